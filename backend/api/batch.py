@@ -0,0 +1,95 @@
+import os
+import shutil
+import time
+import zipfile
+from functools import partial
+
+from django.conf import settings
+
+from .inputs import spool_upload
+from .jobs import Progress
+from .operations import OPERATIONS, run_operation
+from .parallel import ordered_map
+
+BATCH_OPERATIONS = ("compress",) + tuple(OPERATIONS)
+
+
+def _unique_name(name, taken):
+    stem, ext = os.path.splitext(os.path.basename(name) or "document.pdf")
+    if ext.lower() != ".pdf":
+        # Uploads are named by the client; only ever write *.pdf files
+        ext = ".pdf"
+    candidate = f"{stem}{ext}"
+    n = 2
+    while candidate in taken:
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+
+def collect_inputs(files, archive, input_dir):
+    """
+    Spool the uploaded PDFs (and the PDFs inside an optional ZIP) into
+    input_dir. Returns the input paths in upload order.
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    taken = set()
+    paths = []
+
+    for f in files:
+        paths.append(spool_upload(f, input_dir, _unique_name(f.name, taken)))
+
+    if archive is not None:
+        archive_path = spool_upload(archive, input_dir, ".archive.zip")
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                    continue
+                path = os.path.join(input_dir, _unique_name(info.filename, taken))
+                # Copy member by member; the archive is never fully extracted in memory
+                with zf.open(info) as src, open(path, "wb") as dest:
+                    shutil.copyfileobj(src, dest)
+                paths.append(path)
+        os.remove(archive_path)
+
+    return paths
+
+
+def _run_one(op, params, paths):
+    input_path, output_path = paths
+    started = time.perf_counter()
+    result = {"name": os.path.basename(input_path)}
+    try:
+        # Files already run in parallel; don't fan out again per image
+        run_operation(input_path, output_path, op, params, workers=1)
+        result.update(ok=True, output=os.path.basename(output_path), size=os.path.getsize(output_path))
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(input_paths, out_dir, op, params, progress=None, workers=None):
+    """
+    Apply one operation to every input on a process pool. Per-file results
+    are recorded as progress stats; one failing file doesn't stop the rest.
+    """
+    progress = progress or Progress()
+    workers = workers or settings.BATCH_WORKERS
+    total = len(input_paths)
+    os.makedirs(out_dir, exist_ok=True)
+
+    items = [(path, os.path.join(out_dir, os.path.basename(path))) for path in input_paths]
+    results = []
+    outputs = []
+    for result in ordered_map(partial(_run_one, op, params), items, min(workers, total)):
+        results.append(result)
+        if result["ok"]:
+            outputs.append(os.path.join(out_dir, result["output"]))
+        progress.note(files=results)
+        progress(len(results), total)
+
+    if not outputs:
+        raise RuntimeError("Operation failed for every file")
+    return outputs
@@ -0,0 +1,230 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+from .jobs import wants_async
+
+# Response headers replayed on a cache hit, along with the view's own
+# X- headers (stats etc)
+_STORED_HEADERS = ("Content-Type", "Content-Disposition")
+
+
+class ResultCache:
+    """
+    Disk-backed, size-bounded LRU cache of tool outputs.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes plus the operation
+    name and its parameters. Each entry is <key>.bin (the output) and
+    <key>.json (headers to replay); the .bin mtime is bumped on every hit and
+    eviction removes the least recently used entries first.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+
+    def key_for(self, uploaded, op: str, params: dict) -> str:
+        # Stored documents (api/documents.py) were hashed when registered
+        file_hash = getattr(uploaded, "sha256", None)
+        if file_hash is None:
+            digest = hashlib.sha256()
+            for chunk in uploaded.chunks():
+                digest.update(chunk)
+            uploaded.seek(0)
+            file_hash = digest.hexdigest()
+
+        key_src = json.dumps([file_hash, op, params], sort_keys=True)
+        return hashlib.sha256(key_src.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.root, key)
+        return base + ".bin", base + ".json"
+
+    def get(self, key):
+        """
+        Return (path, headers) for a cached result, or None.
+        """
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                headers = json.load(f)
+            os.utime(data_path)
+        except (FileNotFoundError, ValueError):
+            self._bump("misses")
+            return None
+
+        self._bump("hits")
+        return data_path, headers
+
+    def put(self, key, filelike, headers: dict) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        data_path, meta_path = self._paths(key)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+
+        # Output before headers: get() goes by the .json, so it never finds
+        # an entry whose output isn't there yet
+        try:
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(filelike, f)
+            os.replace(tmp_path, data_path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(headers, f)
+            os.replace(tmp_path, meta_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict(keep=data_path)
+        return data_path
+
+    def tee(self, key, chunks, headers: dict):
+        """
+        Pass a streamed response through unchanged while writing it into
+        the cache; the entry is only committed once the stream completes.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        complete = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                with open(tmp_path, "rb") as f:
+                    self.put(key, f, headers)
+            os.remove(tmp_path)
+
+    def evict(self, keep=None):
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith(".bin"):
+                    st = entry.stat()
+                    total += st.st_size
+                    # The entry just written counts towards the limit but stays
+                    if entry.path != keep:
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            # Headers first, for the same reason as in put()
+            for p in (path[:-len(".bin")] + ".json", path):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    # --- hit/miss counters, shared by every worker process ---
+
+    def _stats_path(self):
+        return os.path.join(self.root, "stats.json")
+
+    def _read_counters(self):
+        try:
+            with open(self._stats_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def _bump(self, field):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._stats_path() + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counters = self._read_counters()
+            counters[field] = counters.get(field, 0) + 1
+            with open(self._stats_path(), "w", encoding="utf-8") as f:
+                json.dump(counters, f)
+
+    def stats(self):
+        counters = self._read_counters()
+        entries = 0
+        size = 0
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.name.endswith(".bin"):
+                        entries += 1
+                        size += entry.stat().st_size
+
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+            "maxBytes": self.max_bytes,
+        }
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_MAX_BYTES)
+
+
+def cached_result(op: str, params=()):
+    """
+    View decorator (place it under @api_view): serve a stored result when the
+    same upload was already processed with the same POST ``params``,
+    otherwise run the view and store its FileResponse.
+
+    Only single-file requests are cached; anything with extra uploads (a
+    signature image, a watermark image) or async=1 goes straight through.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            uploaded = request.FILES.get("file")
+            if (
+                not settings.RESULT_CACHE_ENABLED
+                or uploaded is None
+                or len(request.FILES) > 1
+                or wants_async(request)
+            ):
+                return view(request, *args, **kwargs)
+
+            values = {name: request.POST.get(name, "") for name in params}
+            key = result_cache.key_for(uploaded, op, values)
+
+            hit = result_cache.get(key)
+            if hit is not None:
+                data_path, headers = hit
+                # The stored bytes go out as-is; the PDF is never opened
+                response = FileResponse(open(data_path, "rb"))
+                for name, value in headers.items():
+                    response[name] = value
+                response["X-Cache"] = "HIT"
+                return response
+
+            response = view(request, *args, **kwargs)
+            if not isinstance(response, StreamingHttpResponse) or response.status_code != 200:
+                return response
+
+            headers = {
+                name: value for name, value in response.items()
+                if name in _STORED_HEADERS or (name.startswith("X-") and name != "X-Cache")
+            }
+            if isinstance(response, FileResponse) and response.file_to_stream is not None:
+                with response.file_to_stream as produced:
+                    data_path = result_cache.put(key, produced, headers)
+                response.streaming_content = open(data_path, "rb")
+            else:
+                # Generated on the fly (streamed ZIP, text): store as it streams
+                response.streaming_content = result_cache.tee(key, response.streaming_content, headers)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapped
+
+    return decorator
@@ -0,0 +1,234 @@
+"""
+Image recompression for compress_pdf. Every image XObject is decoded once
+(however many pages use it), downsampled to the level's target DPI for the
+largest size it is drawn at, re-encoded as JPEG, grayscale JPEG or 1-bit
+Flate, and swapped in only when the result is smaller.
+"""
+import os
+import zlib
+from collections import namedtuple
+from functools import partial
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops
+
+from .parallel import ordered_map, worker_doc
+from .rendering import pixmap_to_image
+
+ImagePolicy = namedtuple("ImagePolicy", "target_dpi jpeg_quality bilevel")
+
+# level -> what happens to images (None: images are left alone)
+IMAGE_POLICIES = {
+    "lossless": None,
+    "recommended": ImagePolicy(target_dpi=150, jpeg_quality=80, bilevel=False),
+    "strong": ImagePolicy(target_dpi=120, jpeg_quality=65, bilevel=False),
+    "extreme": ImagePolicy(target_dpi=96, jpeg_quality=50, bilevel=True),
+    "minimum": ImagePolicy(target_dpi=72, jpeg_quality=35, bilevel=True),
+}
+
+# Higher garbage/clean/deflate helps reduce size; extreme uses more cleanup.
+SAVE_GARBAGE = {"lossless": 2, "recommended": 2, "strong": 3, "extreme": 4, "minimum": 4}
+
+# Levels the compress endpoints accept; "lossless" and "minimum" are only
+# rungs of the ladder below
+COMPRESS_LEVELS = ("recommended", "strong", "extreme")
+
+# Levels from least to most lossy, searched when compressing to a size
+LEVEL_LADDER = ("lossless", "recommended", "strong", "extreme", "minimum")
+
+# Images this small aren't worth a decode/encode round trip
+MIN_IMAGE_BYTES = 4096
+# Only resample when it removes a meaningful share of the pixels
+DOWNSAMPLE_THRESHOLD = 1.25
+# Below this many images a process pool costs more than it saves
+PARALLEL_MIN_IMAGES = 8
+# Pages compressed to estimate the size a level would give
+SAMPLE_PAGES = 4
+# Share of near-black/near-white pixels for a page to count as a 1-bit scan
+BILEVEL_SHARE = 0.98
+
+
+def collect_images(doc):
+    """
+    Map xref -> lowest effective DPI the image is drawn at (None when no
+    placement could be found). Each xref appears once however many pages
+    reference it.
+    """
+    images = {}
+    for page in doc:
+        for item in page.get_images(full=True):
+            xref, _smask, width, height = item[:4]
+            dpi = images.get(xref)
+            for rect in page.get_image_rects(xref):
+                if rect.is_empty or rect.width <= 0:
+                    continue
+                placed = min(width / (rect.width / 72), height / (rect.height / 72))
+                dpi = placed if dpi is None else min(dpi, placed)
+            images[xref] = dpi
+    return images
+
+
+def _classify(image, policy):
+    """
+    "gray" for images whose color channels (nearly) agree, "bilevel" for
+    grayscale scans that are almost only black and white (when the policy
+    allows 1-bit), "color" otherwise.
+    """
+    if image.mode == "RGB":
+        thumb = image.copy()
+        thumb.thumbnail((128, 128))
+        r, g, b = thumb.split()
+        spread = max(ImageChops.difference(r, g).getextrema()[1], ImageChops.difference(g, b).getextrema()[1])
+        if spread > 8:
+            return "color"
+    if policy.bilevel:
+        histogram = image.convert("L").histogram()
+        extremes = sum(histogram[:32]) + sum(histogram[224:])
+        if extremes >= BILEVEL_SHARE * sum(histogram):
+            return "bilevel"
+    return "gray"
+
+
+def _recompress(input_path, policy, item):
+    """
+    Pool task: returns (xref, image class, old size, new stream or None,
+    image dict entries for the new stream).
+    """
+    xref, dpi = item
+    doc = worker_doc(input_path)
+    old_size = len(doc.xref_stream_raw(xref) or b"")
+    if old_size < MIN_IMAGE_BYTES or doc.xref_get_key(xref, "ImageMask")[1] == "true":
+        return xref, "skipped", old_size, None, None
+
+    try:
+        pix = fitz.Pixmap(doc, xref)
+    except Exception:
+        return xref, "skipped", old_size, None, None
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+
+    image = pixmap_to_image(pix)
+    image_class = _classify(image, policy)
+    if image_class == "gray" and image.mode != "L":
+        image = image.convert("L")
+
+    if dpi and dpi > policy.target_dpi * DOWNSAMPLE_THRESHOLD:
+        scale = policy.target_dpi / dpi
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+
+    if image_class == "bilevel":
+        # PIL packs mode "1" rows MSB first with 1 = white, as PDF expects
+        # for 1 bit DeviceGray
+        bits = image.convert("L").convert("1")
+        data = zlib.compress(bits.tobytes(), 9)
+        entries = {"Filter": "/FlateDecode", "ColorSpace": "/DeviceGray", "BitsPerComponent": "1"}
+    else:
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=policy.jpeg_quality, optimize=True)
+        data = buffer.getvalue()
+        colorspace = "/DeviceGray" if image.mode == "L" else "/DeviceRGB"
+        entries = {"Filter": "/DCTDecode", "ColorSpace": colorspace, "BitsPerComponent": "8"}
+
+    if len(data) >= old_size:
+        return xref, image_class, old_size, None, None
+    entries.update(Width=str(image.width), Height=str(image.height))
+    return xref, image_class, old_size, data, entries
+
+
+def recompress_images(doc, input_path, policy, workers=1, progress=None):
+    """
+    Recompress the images of ``doc`` (opened from ``input_path``) in place.
+    Workers re-open the file themselves, so only the encoded results cross
+    process boundaries. Returns per-class stats:
+    {class: {"images": n, "before": bytes, "after": bytes, "saved": bytes}}.
+    """
+    images = sorted(collect_images(doc).items())
+    if len(images) < PARALLEL_MIN_IMAGES:
+        workers = 1
+    stats = {}
+    task = partial(_recompress, input_path, policy)
+
+    for done, (xref, image_class, old_size, data, entries) in enumerate(
+        ordered_map(task, images, workers), start=1
+    ):
+        new_size = old_size
+        if data is not None:
+            doc.update_stream(xref, data, compress=False)
+            for key in ("DecodeParms", "Decode"):
+                doc.xref_set_key(xref, key, "null")
+            for key, value in entries.items():
+                doc.xref_set_key(xref, key, value)
+            new_size = len(data)
+
+        totals = stats.setdefault(image_class, {"images": 0, "before": 0, "after": 0, "saved": 0})
+        totals["images"] += 1
+        totals["before"] += old_size
+        totals["after"] += new_size
+        totals["saved"] += old_size - new_size
+        if progress is not None:
+            progress(done, len(images))
+
+    return stats
+
+
+def save_compressed(doc, input_path, level, out, workers=1, progress=None):
+    """
+    Recompress the images of ``doc`` for ``level`` and save it to ``out``
+    (a path or a writable buffer). Returns the per-class image stats.
+    """
+    policy = IMAGE_POLICIES[level]
+    stats = {}
+    if policy is not None:
+        stats = recompress_images(doc, input_path, policy, workers, progress)
+    doc.save(
+        out,
+        garbage=SAVE_GARBAGE[level],
+        deflate=True,
+        deflate_images=True,
+        deflate_fonts=True,
+        clean=True,
+    )
+    return stats
+
+
+class SizeEstimator:
+    """
+    Predict the compressed size of a whole document per level from a few
+    sample pages: the sample is compressed for real and its shrink ratio
+    (against the sample saved losslessly) is applied to the document's
+    lossless size. Estimates are memoized per level.
+    """
+
+    def __init__(self, doc, sample_path, lossless_size, pages=SAMPLE_PAGES):
+        self.sample_path = sample_path
+        self.lossless_size = lossless_size
+        self._estimates = {}
+
+        total = len(doc)
+        count = min(pages, total)
+        indexes = sorted({round(i * (total - 1) / max(1, count - 1)) for i in range(count)})
+        sample = fitz.open()
+        for i in indexes:
+            sample.insert_pdf(doc, from_page=i, to_page=i)
+        sample.save(sample_path, garbage=SAVE_GARBAGE["lossless"], deflate=True, clean=True)
+        sample.close()
+        self.sample_size = os.path.getsize(sample_path)
+
+    def estimate(self, level):
+        if level not in self._estimates:
+            sample = fitz.open(self.sample_path)
+            try:
+                buffer = BytesIO()
+                save_compressed(sample, self.sample_path, level, buffer)
+            finally:
+                sample.close()
+            ratio = len(buffer.getvalue()) / max(1, self.sample_size)
+            self._estimates[level] = int(self.lossless_size * ratio)
+        return self._estimates[level]
+
+    def estimates(self):
+        return dict(self._estimates)
@@ -0,0 +1,269 @@
+"""
+Upload-once document handles. A PDF posted to /api/documents/ is stored
+with precomputed metadata and a TTL; every tool then accepts ``doc_id``
+(``doc_ids`` for multi-file tools) in place of an upload, and the stored
+file is handed to the view as if it had just been uploaded to disk.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from functools import wraps
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.http import JsonResponse
+
+from .inputs import spool_upload
+
+SOURCE_FILE = "source.pdf"
+META_FILE = "meta.json"
+
+# Text summary: characters taken from the first pages, and pages looked at
+SUMMARY_CHARS = 1000
+SUMMARY_PAGES = 3
+# Top-level outline entries kept in the metadata
+OUTLINE_ENTRIES = 50
+
+
+class DocumentError(Exception):
+    pass
+
+
+class QuotaExceeded(DocumentError):
+    pass
+
+
+def _root():
+    return str(settings.DOCUMENTS_DIR)
+
+
+def _doc_dir(doc_id: str) -> str:
+    # doc_id arrives from the client and becomes a directory name
+    if len(doc_id) != 32 or not all(c in "0123456789abcdef" for c in doc_id):
+        raise KeyError(doc_id)
+    return os.path.join(_root(), doc_id)
+
+
+def _describe(path: str, password: str = "") -> dict:
+    """
+    Page count, page sizes, encryption and a text/outline summary.
+    """
+    doc = fitz.open(path)
+    try:
+        meta = {"encrypted": bool(doc.is_encrypted), "needsPassword": bool(doc.needs_pass)}
+        if doc.needs_pass and not (password and doc.authenticate(password)):
+            # Nothing past the trailer is readable without the password
+            meta.update(pageCount=None, pages=[], outline=[], summary="")
+            return meta
+
+        metadata = doc.metadata or {}
+        text = ""
+        for page in doc.pages(0, min(SUMMARY_PAGES, len(doc))):
+            text += page.get_text()
+            if len(text) >= SUMMARY_CHARS:
+                break
+
+        meta.update(
+            pageCount=len(doc),
+            pages=[{"width": round(p.rect.width, 2), "height": round(p.rect.height, 2)} for p in doc],
+            title=metadata.get("title") or "",
+            author=metadata.get("author") or "",
+            outline=[
+                {"title": title, "page": page}
+                for level, title, page in doc.get_toc(simple=True)
+                if level == 1
+            ][:OUTLINE_ENTRIES],
+            summary=" ".join(text.split())[:SUMMARY_CHARS],
+        )
+        return meta
+    finally:
+        doc.close()
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def register(path: str, name: str, password: str = "") -> dict:
+    """
+    Take ownership of the PDF at ``path`` (moved into the store) and return
+    its metadata, including the new docId.
+    """
+    os.makedirs(_root(), exist_ok=True)
+    size = os.path.getsize(path)
+    if size > settings.DOCUMENTS_MAX_BYTES:
+        raise QuotaExceeded("Document is larger than the document store quota")
+
+    doc_id = uuid.uuid4().hex
+    doc_dir = os.path.join(_root(), doc_id)
+    os.makedirs(doc_dir)
+    source = os.path.join(doc_dir, SOURCE_FILE)
+    shutil.move(path, source)
+
+    try:
+        now = time.time()
+        meta = {
+            "docId": doc_id,
+            "name": os.path.basename(name) or "document.pdf",
+            "size": size,
+            "sha256": _sha256(source),
+            "created": int(now),
+            "expires": int(now + settings.DOCUMENTS_TTL),
+            **_describe(source, password),
+        }
+    except Exception:
+        shutil.rmtree(doc_dir, ignore_errors=True)
+        raise
+    _write_meta(doc_dir, meta)
+
+    sweep(keep=doc_id)
+    return meta
+
+
+def register_upload(uploaded, password: str = "") -> dict:
+    os.makedirs(_root(), exist_ok=True)
+    staging = os.path.join(_root(), f".{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    try:
+        path = spool_upload(uploaded, staging, SOURCE_FILE)
+        return register(path, uploaded.name, password)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _write_meta(doc_dir: str, meta: dict):
+    tmp_path = os.path.join(doc_dir, META_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(doc_dir, META_FILE))
+
+
+def get(doc_id: str):
+    """
+    Return (source_path, meta) for a live document, or None. Every access
+    counts as a use for quota eviction.
+    """
+    try:
+        doc_dir = _doc_dir(doc_id)
+        with open(os.path.join(doc_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (KeyError, FileNotFoundError, ValueError):
+        return None
+
+    if meta["expires"] < time.time():
+        delete(doc_id)
+        return None
+    os.utime(os.path.join(doc_dir, META_FILE))
+    return os.path.join(doc_dir, SOURCE_FILE), meta
+
+
+def delete(doc_id: str) -> bool:
+    try:
+        doc_dir = _doc_dir(doc_id)
+    except KeyError:
+        return False
+    if not os.path.isdir(doc_dir):
+        return False
+    shutil.rmtree(doc_dir, ignore_errors=True)
+    return True
+
+
+def sweep(keep=None):
+    """
+    Drop expired documents, then the least recently used ones until the
+    store fits settings.DOCUMENTS_MAX_BYTES.
+    """
+    root = _root()
+    with open(os.path.join(root, ".sweep.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                meta_path = os.path.join(entry.path, META_FILE)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    used = os.stat(meta_path).st_mtime
+                except (FileNotFoundError, ValueError):
+                    # Half-registered; leave it unless it is clearly stale
+                    if now - entry.stat().st_mtime > 3600:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                if meta["expires"] < now:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                entries.append((used, meta["size"], entry.name))
+                total += meta["size"]
+
+        entries.sort()
+        for _used, size, doc_id in entries:
+            if total <= settings.DOCUMENTS_MAX_BYTES:
+                break
+            if doc_id == keep:
+                continue
+            shutil.rmtree(os.path.join(root, doc_id), ignore_errors=True)
+            total -= size
+
+
+class StoredDocument(UploadedFile):
+    """
+    A stored document dressed as an on-disk upload: spool_upload hard-links
+    it via temporary_file_path(), the result cache reuses its sha256 and
+    previews its meta.
+    """
+
+    def __init__(self, path: str, meta: dict):
+        super().__init__(
+            open(path, "rb"), meta["name"], "application/pdf", meta["size"], None
+        )
+        self.path = path
+        self.meta = meta
+        self.sha256 = meta["sha256"]
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def _split_ids(values):
+    return [doc_id.strip() for value in values for doc_id in value.split(",") if doc_id.strip()]
+
+
+def accepts_doc_id(view):
+    """
+    Let a view take ``doc_id`` (for "file") or ``doc_ids`` (for "files")
+    instead of uploads. Goes under @api_view and above @cached_result.
+    """
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if "file" not in request.FILES and request.POST.get("doc_id"):
+            found = get(request.POST["doc_id"].strip())
+            if found is None:
+                return JsonResponse({"error": "Unknown or expired doc_id"}, status=404)
+            request.FILES["file"] = StoredDocument(*found)
+
+        if "files" not in request.FILES and request.POST.getlist("doc_ids"):
+            stored = []
+            for doc_id in _split_ids(request.POST.getlist("doc_ids")):
+                found = get(doc_id)
+                if found is None:
+                    return JsonResponse({"error": f"Unknown or expired doc_id: {doc_id}"}, status=404)
+                stored.append(StoredDocument(*found))
+            request.FILES.setlist("files", stored)
+
+        return view(request, *args, **kwargs)
+
+    return wrapped
@@ -0,0 +1,209 @@
+"""
+Images to PDF, one image at a time. Each image's header is read to plan
+its page; baseline RGB/grayscale JPEGs are copied into the PDF byte for
+byte (EXIF orientation is applied by the page's drawing matrix, so even
+rotated phone photos aren't re-encoded). Only images that need work
+(alpha to flatten, a format PDF can't hold such as HEIC or WebP, CMYK,
+16-bit samples, downscaling for max_dpi) are transcoded, on a process
+pool, into a file next to the source, which is then streamed into the
+output. Multi-frame images (TIFF, GIF, ...) give one page per frame.
+"""
+import os
+import zlib
+
+from PIL import Image, ImageOps
+
+try:
+    import pillow_heif
+except ImportError:
+    pillow_heif = None
+else:
+    pillow_heif.register_heif_opener()
+
+from .parallel import ordered_map
+from .pdfwriter import StreamingPdfWriter, pdf_number
+from .textpdf import PAGE_SIZES
+
+# Page size options: "image" makes each page the size of its image
+IMAGE_PAGE_SIZES = ("image", *PAGE_SIZES)
+# Assumed when the image has no (or a nonsense) DPI, as img2pdf does
+DEFAULT_DPI = 96
+JPEG_QUALITY = 90
+# Formats that are already lossy: transcoded to JPEG, others to Flate
+LOSSY_FORMATS = {"JPEG", "MPO", "WEBP", "HEIF", "HEIC", "AVIF"}
+# Below this many images to transcode a process pool costs more than it saves
+PARALLEL_MIN_TRANSCODES = 4
+# Rows deflated at a time when writing lossless samples
+FLATE_ROWS = 256
+
+# EXIF orientation -> drawing matrix for a w x h box at (x, y); the image
+# space unit square has its first sample row at the top
+ORIENTATION_MATRICES = {
+    1: lambda x, y, w, h: (w, 0, 0, h, x, y),
+    2: lambda x, y, w, h: (-w, 0, 0, h, x + w, y),
+    3: lambda x, y, w, h: (-w, 0, 0, -h, x + w, y + h),
+    4: lambda x, y, w, h: (w, 0, 0, -h, x, y + h),
+    5: lambda x, y, w, h: (0, -h, -w, 0, x + w, y + h),
+    6: lambda x, y, w, h: (0, -h, w, 0, x, y + h),
+    7: lambda x, y, w, h: (0, h, w, 0, x, y),
+    8: lambda x, y, w, h: (0, h, -w, 0, x + w, y),
+}
+
+
+def plan_images(path, page_size="image", max_dpi=None):
+    """
+    One plan per frame of the image file (see plan_image).
+    """
+    with Image.open(path) as im:
+        # MPO's extra frames are previews/depth maps of the first
+        frames = 1 if im.format == "MPO" else getattr(im, "n_frames", 1)
+    return [plan_image(path, page_size, max_dpi, frame) for frame in range(frames)]
+
+
+def plan_image(path, page_size="image", max_dpi=None, frame=0):
+    """
+    Read the header of one frame and decide the page size, where the image
+    goes on it, and whether the file can be embedded as-is.
+    """
+    with Image.open(path) as im:
+        fmt = im.format
+        single = getattr(im, "n_frames", 1) == 1
+        im.seek(frame)
+        mode = im.mode
+        width, height = im.size
+        dpi = im.info.get("dpi") or (DEFAULT_DPI, DEFAULT_DPI)
+        orientation = im.getexif().get(0x0112, 1)
+    if orientation not in ORIENTATION_MATRICES:
+        orientation = 1
+    dpi_x, dpi_y = (d if d and d > 1 else DEFAULT_DPI for d in dpi)
+
+    # Displayed size: orientations 5-8 swap the axes
+    shown_w, shown_h = (height, width) if orientation >= 5 else (width, height)
+    image_w = shown_w * 72 / (dpi_y if orientation >= 5 else dpi_x)
+    image_h = shown_h * 72 / (dpi_x if orientation >= 5 else dpi_y)
+
+    if page_size == "image":
+        page_w, page_h = image_w, image_h
+        box = (0, 0, image_w, image_h)
+    else:
+        page_w, page_h = PAGE_SIZES[page_size]
+        if (image_w > image_h) != (page_w > page_h):
+            page_w, page_h = page_h, page_w
+        scale = min(page_w / image_w, page_h / image_h)
+        w, h = image_w * scale, image_h * scale
+        box = ((page_w - w) / 2, (page_h - h) / 2, w, h)
+
+    # Pixels per inch as placed; above max_dpi the image is resampled
+    placed_dpi = shown_w * 72 / box[2]
+    scale = max_dpi / placed_dpi if max_dpi and placed_dpi > max_dpi else 1.0
+
+    passthrough = fmt == "JPEG" and single and mode in ("L", "RGB") and scale == 1.0
+    return {
+        "path": path,
+        "frame": frame,
+        "page": (page_w, page_h),
+        "box": box,
+        "orientation": orientation if passthrough else 1,
+        "scale": scale,
+        "passthrough": passthrough,
+        "lossy": fmt in LOSSY_FORMATS,
+        "size": (width, height),
+        "gray": mode in ("1", "L", "LA"),
+    }
+
+
+def _scratch_path(plan):
+    return f"{plan['path']}.{plan['frame']}.pdfimage"
+
+
+def _image_entries(width, height, colorspace, image_filter):
+    return (
+        f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+        f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter {image_filter}"
+    )
+
+
+def _flatten(im):
+    # Transparent areas become white, as on paper
+    if im.mode in ("P", "PA"):
+        im = im.convert("RGBA")
+    if im.mode in ("RGBA", "LA", "PA"):
+        background = Image.new("RGB" if im.mode == "RGBA" else "L", im.size, "white")
+        background.paste(im, mask=im.getchannel("A"))
+        return background
+    return im
+
+
+def _to_8bit(im):
+    if im.mode.startswith("I"):
+        # 16-bit samples (PNG, TIFF): scale rather than clip to 0-255
+        return im.convert("I").point(lambda v: v / 256).convert("L")
+    return im.convert("L" if im.mode in ("1", "L", "F") else "RGB")
+
+
+def _transcode(plan):
+    """
+    Pool task: write the normalized frame next to the source and return
+    (path, stream dictionary entries); passthrough plans come back as-is.
+    """
+    path = plan["path"]
+    if plan["passthrough"]:
+        colorspace = "/DeviceGray" if plan["gray"] else "/DeviceRGB"
+        return path, _image_entries(*plan["size"], colorspace, "/DCTDecode")
+
+    with Image.open(path) as source:
+        source.seek(plan["frame"])
+        im = _to_8bit(_flatten(ImageOps.exif_transpose(source)))
+        if plan["scale"] < 1.0:
+            size = (max(1, round(im.width * plan["scale"])), max(1, round(im.height * plan["scale"])))
+            im = im.resize(size, Image.LANCZOS)
+
+    colorspace = "/DeviceGray" if im.mode == "L" else "/DeviceRGB"
+    out_path = _scratch_path(plan)
+    if plan["lossy"]:
+        im.save(out_path, format="JPEG", quality=JPEG_QUALITY)
+        image_filter = "/DCTDecode"
+    else:
+        # Deflate the raw samples a band of rows at a time
+        compressor = zlib.compressobj(6)
+        with open(out_path, "wb") as f:
+            for top in range(0, im.height, FLATE_ROWS):
+                band = im.crop((0, top, im.width, min(im.height, top + FLATE_ROWS)))
+                f.write(compressor.compress(band.tobytes()))
+            f.write(compressor.flush())
+        image_filter = "/FlateDecode"
+    return out_path, _image_entries(im.width, im.height, colorspace, image_filter)
+
+
+def write_images_pdf(image_paths, output_path, page_size="image", max_dpi=None, workers=1, progress=None):
+    """
+    Write one page per image frame to output_path. Returns stats: pages,
+    passthrough (embedded unchanged) and transcoded.
+    """
+    plans = [plan for path in image_paths for plan in plan_images(path, page_size, max_dpi)]
+    transcodes = sum(1 for plan in plans if not plan["passthrough"])
+    if transcodes < PARALLEL_MIN_TRANSCODES:
+        workers = 1
+
+    try:
+        with open(output_path, "wb") as out:
+            writer = StreamingPdfWriter(out)
+            for done, (plan, (data_path, entries)) in enumerate(
+                zip(plans, ordered_map(_transcode, plans, workers)), start=1
+            ):
+                image = writer.add_file_stream(entries, data_path)
+                if data_path != plan["path"]:
+                    os.remove(data_path)
+                matrix = " ".join(pdf_number(v) for v in ORIENTATION_MATRICES[plan["orientation"]](*plan["box"]))
+                content = f"q {matrix} cm /Im0 Do Q\n".encode("ascii")
+                writer.add_page(*plan["page"], content, f"<< /XObject << /Im0 {image} 0 R >> >>")
+                if progress is not None:
+                    progress(done, len(plans))
+            writer.close()
+    finally:
+        # Frames already transcoded when something failed
+        for plan in plans:
+            if not plan["passthrough"] and os.path.exists(_scratch_path(plan)):
+                os.remove(_scratch_path(plan))
+
+    return {"pages": len(plans), "passthrough": len(plans) - transcodes, "transcoded": transcodes}
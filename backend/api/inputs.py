@@ -0,0 +1,58 @@
+import mmap
+import os
+import shutil
+
+import fitz  # PyMuPDF
+from pypdf import PdfReader
+
+
+def spool_upload(uploaded, job_dir: str, name: str = "input.pdf") -> str:
+    """
+    Put an upload on disk under job_dir and return its path, without ever
+    holding the whole file in memory.
+
+    Uploads over FILE_UPLOAD_MAX_MEMORY_SIZE are already on disk as a
+    TemporaryUploadedFile; those are hard-linked (or kernel-copied) instead
+    of being read back through Python.
+    """
+    path = os.path.join(job_dir, os.path.basename(name))
+
+    temp_path = getattr(uploaded, "temporary_file_path", None)
+    if temp_path is not None:
+        try:
+            os.link(temp_path(), path)
+        except OSError:
+            shutil.copyfile(temp_path(), path)
+        return path
+
+    with open(path, "wb") as f:
+        for chunk in uploaded.chunks():
+            f.write(chunk)
+    return path
+
+
+def open_mmap(path: str):
+    """
+    Read-only memory map of a file. Pages are faulted in on demand and are
+    shared with the page cache, so they don't count as private memory.
+    """
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_fitz(path: str):
+    # PyMuPDF reads objects from the file lazily when opened by path
+    return fitz.open(path)
+
+
+def open_pypdf(path: str) -> PdfReader:
+    # PdfReader(path) would read the whole file into a BytesIO; over an
+    # mmap it seeks and reads only what it parses
+    return PdfReader(open_mmap(path))
+
+
+def open_pikepdf(path: str, **kwargs):
+    import pikepdf
+
+    # qpdf reads from the file on demand when given a path
+    return pikepdf.open(path, **kwargs)
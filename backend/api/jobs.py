@@ -0,0 +1,276 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+
+STATUS_FILE = "job.json"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_executor = None
+
+
+def _jobs_root() -> str:
+    return os.path.join(settings.MEDIA_ROOT, "jobs")
+
+
+def get_job_dir(job_id: str, create: bool = True) -> str:
+    job_dir = os.path.join(_jobs_root(), job_id)
+    if create:
+        os.makedirs(job_dir, exist_ok=True)
+        sweep()
+    return job_dir
+
+
+def find_job_dir(job_id: str):
+    """
+    The existing directory of a job whose id came from a URL, or None.
+    Job ids are UUIDs, so nothing else (such as "..") is looked up.
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    job_dir = get_job_dir(job_id, create=False)
+    return job_dir if os.path.isdir(job_dir) else None
+
+
+def sweep():
+    """
+    Remove job directories nobody will ask for again: queued jobs
+    settings.JOB_TTL after their last status update, and the scratch
+    directories of synchronous requests (no status file) after
+    settings.JOB_SCRATCH_TTL. Runs at most every JOB_SWEEP_INTERVAL.
+    """
+    root = _jobs_root()
+    stamp = os.path.join(root, ".sweep")
+    now = time.time()
+    try:
+        if now - os.stat(stamp).st_mtime < settings.JOB_SWEEP_INTERVAL:
+            return
+    except FileNotFoundError:
+        pass
+
+    with open(stamp, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process is already sweeping
+            return
+        os.utime(stamp)
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    # Running jobs touch their status file with each progress update
+                    used, ttl = os.stat(os.path.join(entry.path, STATUS_FILE)).st_mtime, settings.JOB_TTL
+                except FileNotFoundError:
+                    used, ttl = entry.stat().st_mtime, settings.JOB_SCRATCH_TTL
+                if now - used > ttl:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def wants_async(request) -> bool:
+    return request.POST.get("async", "").lower() in ("1", "true", "yes")
+
+
+def job_file_url(job_id: str, name: str) -> str:
+    return f"/api/jobs/{job_id}/file/{name}/"
+
+
+class Progress:
+    """
+    Progress sink handed to service functions as ``progress``.
+    Call it with (done, total) and use note() to attach stats (timings etc).
+    """
+
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+        self.stats = {}
+
+    def __call__(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        self.changed()
+
+    def note(self, **stats):
+        self.stats.update(stats)
+        self.changed()
+
+    def changed(self):
+        pass
+
+
+class JobProgress(Progress):
+    """
+    Progress that is persisted into the job's status file, throttled so
+    page-by-page updates don't turn into a write per page.
+    """
+
+    min_interval = 0.25
+
+    def __init__(self, job_dir):
+        super().__init__()
+        self.job_dir = job_dir
+        self._last_write = 0.0
+
+    def changed(self):
+        now = time.monotonic()
+        finished = self.total and self.done >= self.total
+        if not finished and now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+        self.flush()
+
+    def flush(self):
+        update_status(
+            self.job_dir,
+            progress={"done": self.done, "total": self.total},
+            stats=self.stats,
+        )
+
+
+def read_status(job_dir: str):
+    path = os.path.join(job_dir, STATUS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_status(job_dir: str, status: dict):
+    # Write + rename so readers in other processes never see a torn file
+    path = os.path.join(job_dir, STATUS_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def update_status(job_dir: str, **fields):
+    status = read_status(job_dir) or {}
+    status.update(fields)
+    write_status(job_dir, status)
+    return status
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.JOB_WORKERS)
+    return _executor
+
+
+def submit(job_id: str, task: str, func, *args, **kwargs):
+    """
+    Queue func(*args, progress=..., **kwargs) on the worker pool.
+    func must be a module-level function returning an output path or a list
+    of output paths inside the job dir (or a subdirectory of it).
+    """
+    global _executor
+    job_dir = get_job_dir(job_id)
+    write_status(job_dir, {
+        "jobId": job_id,
+        "task": task,
+        "state": QUEUED,
+        "progress": {"done": 0, "total": 0},
+        "outputs": [],
+        "stats": {},
+        "error": None,
+        "createdAt": time.time(),
+    })
+
+    try:
+        future = get_executor().submit(_run_job, job_dir, func, args, kwargs)
+    except BrokenProcessPool:
+        # A worker died (OOM, segfault in a native lib); start a fresh pool
+        _executor = None
+        future = get_executor().submit(_run_job, job_dir, func, args, kwargs)
+    future.add_done_callback(partial(_job_finished, job_dir))
+
+    return job_id
+
+
+def _job_finished(job_dir, future):
+    """
+    Done callback in the submitting process. _run_job records its own
+    outcome; this covers a worker that was killed before it could, which
+    would otherwise leave the job "running" forever.
+    """
+    if future.cancelled():
+        error = "Job was cancelled"
+    elif future.exception() is not None:
+        error = str(future.exception()) or type(future.exception()).__name__
+    else:
+        return
+    status = read_status(job_dir) or {}
+    if status.get("state") in (DONE, FAILED):
+        return
+    update_status(job_dir, state=FAILED, error=error, finishedAt=time.time())
+
+
+def _run_job(job_dir, func, args, kwargs):
+    progress = JobProgress(job_dir)
+    update_status(job_dir, state=RUNNING, startedAt=time.time())
+
+    try:
+        result = func(*args, progress=progress, **kwargs)
+    except Exception as e:
+        update_status(
+            job_dir,
+            state=FAILED,
+            error=str(e),
+            stats=progress.stats,
+            finishedAt=time.time(),
+        )
+        return
+
+    outputs = [result] if isinstance(result, str) else list(result or [])
+    update_status(
+        job_dir,
+        state=DONE,
+        outputs=[os.path.relpath(p, job_dir) for p in outputs],
+        progress={"done": progress.total or 1, "total": progress.total or 1},
+        stats=progress.stats,
+        finishedAt=time.time(),
+    )
+
+
+def job_payload(job_id: str, status: dict):
+    job_dir = get_job_dir(job_id, create=False)
+    results = []
+    for name in status.get("outputs", []):
+        path = os.path.join(job_dir, name)
+        if os.path.exists(path):
+            results.append({
+                "name": os.path.basename(name),
+                "size": os.path.getsize(path),
+                "url": job_file_url(job_id, name),
+            })
+
+    return {
+        "jobId": job_id,
+        "task": status.get("task"),
+        "state": status.get("state"),
+        "progress": status.get("progress"),
+        "stats": status.get("stats", {}),
+        "error": status.get("error"),
+        "results": results,
+        "statusUrl": f"/api/jobs/{job_id}/status/",
+        "resultUrl": f"/api/jobs/{job_id}/result/",
+        "zipUrl": f"/api/jobs/{job_id}/zip/",
+    }
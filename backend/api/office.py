@@ -0,0 +1,387 @@
+"""
+Office documents to PDF through a pool of long-lived headless LibreOffice
+workers. Each worker owns its own user profile and listens on its own
+local socket, so conversions neither pay soffice's cold start nor fight
+over a shared profile lock.
+"""
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+_MAC_SOFFICE = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+
+# Export filter per input extension; LibreOffice picks the wrong one for
+# some formats when only told "pdf"
+EXPORT_FILTERS = {
+    ".doc": "writer_pdf_Export",
+    ".docx": "writer_pdf_Export",
+    ".odt": "writer_pdf_Export",
+    ".rtf": "writer_pdf_Export",
+    ".txt": "writer_pdf_Export",
+    ".xls": "calc_pdf_Export",
+    ".xlsx": "calc_pdf_Export",
+    ".ods": "calc_pdf_Export",
+    ".csv": "calc_pdf_Export",
+    ".ppt": "impress_pdf_Export",
+    ".pptx": "impress_pdf_Export",
+    ".odp": "impress_pdf_Export",
+}
+
+
+class OfficeError(Exception):
+    pass
+
+
+class OfficeUnavailable(OfficeError):
+    """No LibreOffice binary on this host."""
+
+
+class OfficeBusy(OfficeError):
+    """Every worker stayed busy for longer than OFFICE_QUEUE_TIMEOUT."""
+
+
+def find_soffice():
+    candidates = [settings.OFFICE_BINARY, shutil.which("soffice"), shutil.which("libreoffice"), _MAC_SOFFICE]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _output_path(input_path, out_dir):
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class UnoWorker:
+    """
+    One headless soffice process driven over a UNO socket. Documents are
+    loaded hidden and exported with storeToURL, then closed; the process
+    itself stays up between conversions.
+    """
+
+    def __init__(self, binary, profile_dir):
+        self.binary = binary
+        self.profile_dir = profile_dir
+        self.process = None
+        self.port = None
+        self.conversions = 0
+        self._desktop = None
+
+    def start(self):
+        self.port = _free_port()
+        self.conversions = 0
+        self.process = subprocess.Popen(
+            [
+                self.binary,
+                "--headless", "--invisible", "--nologo", "--norestore",
+                "--nodefault", "--nolockcheck",
+                f"-env:UserInstallation=file://{self.profile_dir}",
+                f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # First start of a fresh profile takes a while; poll until it answers
+        deadline = time.monotonic() + settings.OFFICE_START_TIMEOUT
+        while True:
+            try:
+                self._desktop = self._connect()
+                return
+            except Exception:
+                if self.process.poll() is not None:
+                    raise OfficeError("LibreOffice exited during startup")
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise OfficeError("LibreOffice did not start in time")
+                time.sleep(0.25)
+
+    def _connect(self):
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        ctx = resolver.resolve(f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+        return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            # Cheap round trip over the bridge
+            self._desktop.getFrames()
+            return True
+        except Exception:
+            return False
+
+    def convert(self, input_path, out_dir):
+        ext = os.path.splitext(input_path)[1].lower()
+        output_path = _output_path(input_path, out_dir)
+
+        doc = self._desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(input_path)), "_blank", 0,
+            (_prop("Hidden", True), _prop("ReadOnly", True)),
+        )
+        if doc is None:
+            raise OfficeError("LibreOffice could not open the document")
+        try:
+            doc.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                (_prop("FilterName", EXPORT_FILTERS.get(ext, "writer_pdf_Export")),),
+            )
+        finally:
+            doc.close(True)
+        return output_path
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                if self._desktop is not None and self.process.poll() is None:
+                    self._desktop.terminate()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.kill()
+                self.process.wait()
+            self.process = None
+            self._desktop = None
+        # soffice recreates the profile on the next start()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class CliWorker:
+    """
+    Fallback when the Python UNO bindings aren't installed: one
+    ``soffice --convert-to`` per document, but still with a profile of its
+    own so concurrent conversions don't block each other.
+    """
+
+    def __init__(self, binary, profile_dir):
+        self.binary = binary
+        self.profile_dir = profile_dir
+        self.conversions = 0
+        self._process = None
+
+    def start(self):
+        self.conversions = 0
+
+    def healthy(self):
+        return True
+
+    def convert(self, input_path, out_dir):
+        self._process = subprocess.Popen(
+            [
+                self.binary,
+                f"-env:UserInstallation=file://{self.profile_dir}",
+                "--headless", "--convert-to", "pdf", "--outdir", out_dir, input_path,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        _out, err = self._process.communicate()
+        if self._process.returncode != 0:
+            raise OfficeError(err.decode(errors="replace").strip() or "LibreOffice conversion failed")
+        return _output_path(input_path, out_dir)
+
+    def kill(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+
+    def stop(self):
+        self.kill()
+        if self._process is not None:
+            self._process.wait()
+            self._process = None
+        # soffice recreates the profile on the next conversion
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class FakeWorker:
+    """
+    Stand-in converter for tests and machines without LibreOffice: writes a
+    one-page PDF naming the input. Select it with
+    OFFICE_WORKER = "api.office.FakeWorker".
+    """
+
+    def __init__(self, binary=None, profile_dir=None):
+        self.conversions = 0
+
+    def start(self):
+        self.conversions = 0
+
+    def healthy(self):
+        return True
+
+    def convert(self, input_path, out_dir):
+        import fitz  # PyMuPDF
+
+        output_path = _output_path(input_path, out_dir)
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Converted: {os.path.basename(input_path)}")
+        doc.save(output_path)
+        doc.close()
+        return output_path
+
+    def kill(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class OfficePool:
+    """
+    Fixed number of workers handed out through a queue. Workers are started
+    lazily, checked before use, and restarted after ``max_conversions``
+    documents (LibreOffice leaks memory) or after any failure. A conversion
+    running past ``convert_timeout`` gets its worker killed.
+    """
+
+    def __init__(self, worker_factory, size, max_conversions, queue_timeout, convert_timeout):
+        self.worker_factory = worker_factory
+        self.size = size
+        self.max_conversions = max_conversions
+        self.queue_timeout = queue_timeout
+        self.convert_timeout = convert_timeout
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = None
+            with self._lock:
+                if len(self._workers) < self.size:
+                    worker = self.worker_factory(len(self._workers))
+                    self._workers.append(worker)
+                    # Started below like any worker due for a restart
+                    worker.conversions = self.max_conversions
+            if worker is None:
+                try:
+                    worker = self._idle.get(timeout=self.queue_timeout)
+                except queue.Empty:
+                    raise OfficeBusy("All office converters are busy, try again later")
+
+        if worker.conversions >= self.max_conversions or not worker.healthy():
+            try:
+                worker.stop()
+                worker.start()
+            except Exception:
+                # Keep the slot; the next request tries to start it again
+                worker.conversions = self.max_conversions
+                self._idle.put(worker)
+                raise
+        return worker
+
+    def convert(self, input_path, out_dir):
+        worker = self._acquire()
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            worker.kill()
+
+        timer = threading.Timer(self.convert_timeout, on_timeout)
+        timer.start()
+        try:
+            output_path = worker.convert(input_path, out_dir)
+            worker.conversions += 1
+        except Exception:
+            # Whatever state the worker is in, don't hand it out again as is
+            worker.conversions = self.max_conversions
+            if timed_out.is_set():
+                raise OfficeError("Conversion timed out")
+            raise
+        finally:
+            timer.cancel()
+            self._idle.put(worker)
+
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            raise OfficeError("Conversion failed to produce PDF output")
+        return output_path
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_class():
+    if settings.OFFICE_WORKER:
+        return import_string(settings.OFFICE_WORKER)
+    return UnoWorker if uno is not None else CliWorker
+
+
+def get_pool():
+    """
+    The process-wide pool, built on first use. Raises OfficeUnavailable when
+    a real worker is configured but no LibreOffice binary exists.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+
+        worker_class = _worker_class()
+        binary = None
+        if worker_class is not FakeWorker:
+            binary = find_soffice()
+            if binary is None:
+                raise OfficeUnavailable("LibreOffice not found")
+
+        profile_root = str(settings.OFFICE_PROFILE_ROOT)
+
+        def factory(n):
+            profile_dir = os.path.join(profile_root, f"{os.getpid()}-{n}")
+            os.makedirs(profile_dir, exist_ok=True)
+            return worker_class(binary, profile_dir)
+
+        _pool = OfficePool(
+            factory,
+            size=settings.OFFICE_WORKERS,
+            max_conversions=settings.OFFICE_MAX_CONVERSIONS,
+            queue_timeout=settings.OFFICE_QUEUE_TIMEOUT,
+            convert_timeout=settings.OFFICE_CONVERT_TIMEOUT,
+        )
+        atexit.register(_pool.close)
+        return _pool
+
+
+def convert_to_pdf(input_path, out_dir):
+    return get_pool().convert(input_path, out_dir)
@@ -0,0 +1,351 @@
+"""
+Per-tool document operations shared by the single-file views, the batch
+endpoint and pipelines. Each operation edits the pages of an in-memory
+PdfWriter.
+"""
+import time
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+)
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from .inputs import open_pypdf
+from .jobs import Progress
+from .services import compress_pdf
+
+
+def open_writer(source, password: str = "") -> PdfWriter:
+    """
+    Load a PDF (path or file-like) into a PdfWriter, decrypting it first
+    when a password is needed.
+    """
+    reader = open_pypdf(source) if isinstance(source, str) else PdfReader(source)
+    if reader.is_encrypted:
+        reader.decrypt(password)
+
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    return writer
+
+
+def open_incremental_writer(path: str) -> PdfWriter:
+    """
+    PdfWriter that appends an update section to the file at ``path``:
+    write() copies the original bytes untouched and adds only the objects
+    that changed, so existing digital signatures stay valid.
+    """
+    reader = open_pypdf(path)
+    if reader.is_encrypted:
+        raise ValueError("Incremental output isn't supported for encrypted PDFs")
+    return PdfWriter(reader, incremental=True)
+
+
+def rotate(writer: PdfWriter, angle=90):
+    angle = int(angle)
+    for page in writer.pages:
+        page.rotate(angle)
+
+
+def unlock(writer: PdfWriter, password: str = ""):
+    # Decryption happens in open_writer; the rewritten copy carries no
+    # encryption, which is all unlocking needs
+    pass
+
+
+def fill_fields(writer: PdfWriter, fields: dict):
+    # Fields can sit on any page; only pages with annotations can hold them
+    for page in writer.pages:
+        if "/Annots" in page:
+            writer.update_page_form_field_values(page, fields, auto_regenerate=False)
+
+
+# Shared content streams wrapping each page's own content, so our stamp
+# never inherits graphics state the page left behind
+_SAVE_STATE = b"q\n"
+_RESTORE_STATE = b"\nQ\n"
+
+# Resource names for our stamps, unlikely to clash with a page's own
+_NUMBER_FONT = "/PdfcNumF1"
+_WATERMARK_PREFIX = "/PdfcWm"
+
+
+def _add_stream(writer: PdfWriter, data: bytes, entries=None):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    for key, value in (entries or {}).items():
+        stream[NameObject(key)] = value
+    return writer._add_object(stream)
+
+
+def _resource_dict(page, category: str) -> DictionaryObject:
+    if "/Resources" not in page:
+        page[NameObject("/Resources")] = DictionaryObject()
+    resources = page["/Resources"]
+    if category not in resources:
+        resources[NameObject(category)] = DictionaryObject()
+    return resources[category]
+
+
+def _append_content(page, pre_ref, post_ref):
+    """
+    Add content streams around the page's existing ones by reference; the
+    original streams are neither decoded nor rewritten.
+    """
+    contents = page.raw_get("/Contents") if "/Contents" in page else None
+    if contents is None:
+        streams = []
+    elif isinstance(contents.get_object(), ArrayObject):
+        streams = list(contents.get_object())
+    else:
+        streams = [contents]
+    page[NameObject("/Contents")] = ArrayObject([pre_ref, *streams, post_ref])
+
+
+def _pdf_string(text: str) -> bytes:
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped})".encode("latin-1", errors="replace")
+
+
+def number_pages(writer: PdfWriter, position="bottom-center", style="1"):
+    total_pages = len(writer.pages)
+
+    # One Helvetica font object shared by every page; each page only gets
+    # a few bytes of its own content with the number itself
+    font_ref = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+    }))
+    pre_ref = _add_stream(writer, _SAVE_STATE)
+
+    for i, page in enumerate(writer.pages):
+        # Get page size in points (1/72 inch)
+        width = float(page.mediabox.width)
+        height = float(page.mediabox.height)
+
+        # Determine text
+        page_num = i + 1
+        if style == "Page 1 of N":
+            text = f"Page {page_num} of {total_pages}"
+        elif style == "Page 1":
+            text = f"Page {page_num}"
+        else:
+            text = f"{page_num}"
+
+        # Position logic (margin 20pts approx 7mm)
+        margin = 20
+        text_width = pdfmetrics.stringWidth(text, "Helvetica", 12)
+
+        if "bottom" in position:
+            y = margin
+        elif "top" in position:
+            y = height - margin - 10 # adjust for font height
+        else:
+            y = margin
+
+        if "left" in position:
+            x = margin
+        elif "right" in position:
+            x = width - margin - text_width
+        else: # center
+            x = (width - text_width) / 2
+
+        _resource_dict(page, "/Font")[NameObject(_NUMBER_FONT)] = font_ref
+        post = _RESTORE_STATE + (
+            f"q BT {_NUMBER_FONT} 12 Tf 0 g 1 0 0 1 {x:.2f} {y:.2f} Tm ".encode("ascii")
+            + _pdf_string(text)
+            + b" Tj ET Q\n"
+        )
+        _append_content(page, pre_ref, _add_stream(writer, post))
+
+
+def _watermark_form(writer: PdfWriter, width: float, height: float, text: str, image=None):
+    """
+    Draw the watermark once with ReportLab and turn it into a Form XObject
+    that any number of pages can reference.
+    """
+    packet = BytesIO()
+    c = canvas.Canvas(packet, pagesize=(width, height))
+
+    # Draw watermark
+    if image is not None:
+        # Centered, at most half the page in either direction
+        img_w, img_h = image.getSize()
+        scale = min(width / 2 / img_w, height / 2 / img_h)
+        c.saveState()
+        c.setFillAlpha(0.3)
+        c.drawImage(image, (width - img_w * scale) / 2, (height - img_h * scale) / 2,
+                    img_w * scale, img_h * scale, mask="auto")
+        c.restoreState()
+    if text:
+        c.setFont("Helvetica-Bold", 48)
+        c.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.3)
+        c.saveState()
+        c.translate(width/2, height/2)
+        c.rotate(45)
+        c.drawCentredString(0, 0, text)
+        c.restoreState()
+    c.save()
+
+    packet.seek(0)
+    overlay = PdfReader(packet).pages[0]
+    return _add_stream(writer, overlay.get_contents().get_data(), {
+        "/Type": NameObject("/XObject"),
+        "/Subtype": NameObject("/Form"),
+        "/BBox": ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+        "/Resources": overlay["/Resources"].clone(writer),
+    })
+
+
+def watermark(writer: PdfWriter, text="", image: bytes = None):
+    """
+    Stamp ``text`` (diagonal) and/or ``image`` (encoded image bytes,
+    centered) on every page.
+    """
+    if not text and not image:
+        return
+    image = ImageReader(BytesIO(image)) if image else None
+
+    # One Form XObject (and one "draw it" stream) per distinct page size
+    templates = {}
+    pre_ref = _add_stream(writer, _SAVE_STATE)
+
+    for page in writer.pages:
+        width = float(page.mediabox.width)
+        height = float(page.mediabox.height)
+        size = (round(width, 2), round(height, 2))
+
+        if size not in templates:
+            name = f"{_WATERMARK_PREFIX}{len(templates)}"
+            form_ref = _watermark_form(writer, width, height, text, image)
+            post_ref = _add_stream(writer, _RESTORE_STATE + f"q {name} Do Q\n".encode("ascii"))
+            templates[size] = (name, form_ref, post_ref)
+
+        name, form_ref, post_ref = templates[size]
+        _resource_dict(page, "/XObject")[NameObject(name)] = form_ref
+        _append_content(page, pre_ref, post_ref)
+
+
+# name -> (function, POST fields it takes)
+OPERATIONS = {
+    "rotate": (rotate, ("angle",)),
+    "unlock": (unlock, ("password",)),
+    "number_pages": (number_pages, ("position", "style")),
+    "watermark": (watermark, ("text",)),
+}
+
+
+def operation_params(op: str, params: dict) -> dict:
+    """
+    Keep only the fields an operation understands (extra keys such as
+    "password" for opening the input are handled by the caller).
+    """
+    _func, fields = OPERATIONS[op]
+    return {k: v for k, v in params.items() if k in fields}
+
+
+def run_operation(input_path: str, output_path: str, op: str, params: dict, workers=None):
+    """
+    Apply one named operation to a PDF on disk and write the result.
+    "compress" goes through services.compress_pdf (with ``workers`` image
+    processes); everything else edits a PdfWriter.
+    """
+    if op == "compress":
+        out_file, _name = compress_pdf(
+            input_path, params.get("level", "recommended"), output_path=output_path, workers=workers
+        )
+        out_file.close()
+        return output_path
+
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {op}")
+
+    func, _fields = OPERATIONS[op]
+    writer = open_writer(input_path, params.get("password", ""))
+    func(writer, **operation_params(op, params))
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return output_path
+
+
+def validate_steps(steps):
+    """
+    Check a pipeline step list before anything runs; raises ValueError
+    describing the first bad step.
+    """
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("steps must be a non-empty JSON list of objects")
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ValueError(f"Step {i + 1} must be an object")
+        op = step.get("op")
+        if not isinstance(op, str):
+            raise ValueError(f"Step {i + 1} needs an \"op\" string")
+        if op == "compress" and i != len(steps) - 1:
+            raise ValueError("compress must be the last step")
+        if op != "compress" and op not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {op}")
+        for name, value in step.items():
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise ValueError(f"Step {i + 1}: {name} must be a string or a number")
+
+
+def run_pipeline(input_path: str, output_path: str, steps: list, progress=None):
+    """
+    Apply an ordered list of steps ({"op": "rotate", "angle": 90}, ...) to one
+    document. The PDF is parsed once, every step edits the same in-memory
+    PdfWriter, and it is serialized once at the end. "compress" is a
+    save-time option of PyMuPDF, so it may only be the last step and takes
+    over the final save.
+    """
+    progress = progress or Progress()
+    validate_steps(steps)
+    ops = [step["op"] for step in steps]
+
+    timings = []
+    total = len(steps) + 2
+
+    started = time.perf_counter()
+    # Unlock needs its password before anything can be read
+    password = next((s.get("password", "") for s in steps if s.get("op") == "unlock"), "")
+    writer = open_writer(input_path, password)
+    timings.append({"op": "open", "seconds": round(time.perf_counter() - started, 3)})
+    progress(1, total)
+
+    for step in steps:
+        op = step["op"]
+        if op == "compress":
+            continue
+        started = time.perf_counter()
+        func, _fields = OPERATIONS[op]
+        func(writer, **operation_params(op, step))
+        timings.append({"op": op, "seconds": round(time.perf_counter() - started, 3)})
+        progress(len(timings), total)
+
+    started = time.perf_counter()
+    if ops and ops[-1] == "compress":
+        buffer = BytesIO()
+        writer.write(buffer)
+        buffer.seek(0)
+        out_file, _name = compress_pdf(buffer, steps[-1].get("level", "recommended"), output_path=output_path)
+        out_file.close()
+        timings.append({"op": "compress", "seconds": round(time.perf_counter() - started, 3)})
+    else:
+        with open(output_path, "wb") as f:
+            writer.write(f)
+        timings.append({"op": "save", "seconds": round(time.perf_counter() - started, 3)})
+
+    progress.note(steps=timings)
+    progress(total, total)
+    return output_path
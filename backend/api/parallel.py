@@ -0,0 +1,106 @@
+import fcntl
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import fitz  # PyMuPDF
+from django.conf import settings
+
+_worker_doc_cache = None
+
+
+def worker_doc(path):
+    """
+    Per-process cache of the open source document, so a pool worker that
+    handles many pages of the same file opens it only once.
+    """
+    global _worker_doc_cache
+    cached = _worker_doc_cache
+    if cached is not None and cached[0] == path:
+        return cached[1]
+    release_worker_doc()
+    doc = fitz.open(path)
+    _worker_doc_cache = (path, doc)
+    return doc
+
+
+def release_worker_doc():
+    global _worker_doc_cache
+    if _worker_doc_cache is not None:
+        _worker_doc_cache[1].close()
+        _worker_doc_cache = None
+
+
+@contextmanager
+def worker_slots(wanted):
+    """
+    Claim up to ``wanted`` of the settings.PARALLEL_MAX_PROCESSES pool
+    slots shared by every web and job process on the host, and yield how
+    many were granted (possibly 0). A slot is an flock on its own file, so
+    the kernel hands it back if the holder dies.
+    """
+    if wanted <= 0:
+        yield 0
+        return
+    root = str(settings.PARALLEL_SLOTS_DIR)
+    os.makedirs(root, exist_ok=True)
+    total = settings.PARALLEL_MAX_PROCESSES
+    with ExitStack() as held:
+        granted = 0
+        # Start at a different slot per process so callers don't all
+        # contend for slot 0
+        for n in range(total):
+            if granted >= wanted:
+                break
+            f = held.enter_context(open(os.path.join(root, f"slot-{(os.getpid() + n) % total}.lock"), "a"))
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            granted += 1
+        yield granted
+
+
+def _init_worker():
+    # Workers already run side by side; keep native libraries (Tesseract's
+    # OpenMP) from starting a thread per core on top of that
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def ordered_map(fn, items, workers, window=None, on_start=None):
+    """
+    Run fn(item) for every item on a process pool and yield the results in
+    input order. At most ``window`` tasks are in flight, so a long document
+    never has all of its page results sitting in memory at once.
+    fn must be picklable (a module-level function or a functools.partial).
+
+    ``workers`` is an upper bound: the pool only gets as many processes as
+    there are free slots (see worker_slots), and runs inline when there
+    are fewer than two. ``on_start`` is called with the number of processes
+    actually used (1 when inline) before the first item runs.
+    """
+    with worker_slots(workers if workers > 1 else 0) as granted:
+        if on_start is not None:
+            on_start(granted if granted > 1 else 1)
+        if granted <= 1:
+            # Inline in this process: don't leave the source open afterwards
+            try:
+                for item in items:
+                    yield fn(item)
+            finally:
+                release_worker_doc()
+            return
+
+        window = window or granted * 2
+        pool = ProcessPoolExecutor(max_workers=granted, initializer=_init_worker)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,252 @@
+"""
+A minimal PDF writer that streams pages to disk as they are produced.
+Only byte offsets and page object numbers stay in memory; the page tree,
+xref table and trailer are written on close(). Used where a document is
+built from an input too large to hold (text_to_pdf, image_to_pdf).
+
+TrueTypeFont embeds a Unicode TTF as a Type0/Identity-H font. Glyph ids
+and widths are looked up once per character and cached, and on close only
+the glyphs actually used are kept (original glyph ids retained, so the
+content streams written earlier stay valid).
+"""
+import hashlib
+import os
+import zlib
+from io import BytesIO
+
+from fontTools import subset
+from fontTools.ttLib import TTFont
+
+# Placeholder object numbers: 1 is the catalog, 2 the page tree
+CATALOG = 1
+PAGES = 2
+COPY_BLOCK = 1024 * 1024
+
+
+def pdf_name(value: str) -> str:
+    return "/" + "".join(c if c.isalnum() or c in "-_." else f"#{ord(c):02X}" for c in value)
+
+
+def pdf_number(value: float) -> str:
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return text if text not in ("", "-0") else "0"
+
+
+class StreamingPdfWriter:
+    def __init__(self, out):
+        self.out = out
+        self.position = 0
+        self.offsets = {}
+        self.next_id = PAGES + 1
+        self.pages = []
+        self._write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self.position += len(data)
+
+    def reserve(self) -> int:
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def write_object(self, obj_id: int, body: str):
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def write_stream(self, obj_id: int, entries: str, data: bytes, compress=True):
+        """
+        Write a stream object; ``entries`` is the dictionary body without
+        /Length (and without /Filter when compress is set).
+        """
+        if compress:
+            data = zlib.compress(data, 6)
+            entries += " /Filter /FlateDecode"
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n<< {entries} /Length {len(data)} >>\nstream\n".encode("latin-1"))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+
+    def add_file_stream(self, entries: str, path: str) -> int:
+        """
+        Copy an already encoded file (a JPEG, a deflated sample file) into
+        a stream object without reading it into memory.
+        """
+        obj_id = self.reserve()
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n<< {entries} /Length {os.path.getsize(path)} >>\nstream\n".encode("latin-1"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(COPY_BLOCK), b""):
+                self._write(block)
+        self._write(b"\nendstream\nendobj\n")
+        return obj_id
+
+    def add_object(self, body: str) -> int:
+        obj_id = self.reserve()
+        self.write_object(obj_id, body)
+        return obj_id
+
+    def add_stream(self, entries: str, data: bytes, compress=True) -> int:
+        obj_id = self.reserve()
+        self.write_stream(obj_id, entries, data, compress)
+        return obj_id
+
+    def add_page(self, width, height, content: bytes, resources: str) -> int:
+        """
+        Append a page; ``resources`` is the resource dictionary source,
+        e.g. "<< /Font << /F1 5 0 R >> >>".
+        """
+        contents = self.add_stream("", content)
+        page = self.add_object(
+            f"<< /Type /Page /Parent {PAGES} 0 R /MediaBox [0 0 {pdf_number(width)} {pdf_number(height)}] "
+            f"/Resources {resources} /Contents {contents} 0 R >>"
+        )
+        self.pages.append(page)
+        return page
+
+    def close(self):
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        self.write_object(PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>")
+        self.write_object(CATALOG, f"<< /Type /Catalog /Pages {PAGES} 0 R >>")
+
+        xref = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, self.next_id):
+            # Reserved but never written objects are listed as free
+            offset = self.offsets.get(obj_id)
+            lines.append(f"{offset:010d} 00000 n \n" if offset is not None else "0000000000 00000 f \n")
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root {CATALOG} 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self._write("".join(lines).encode("latin-1"))
+
+
+class TrueTypeFont:
+    """
+    A TrueType font for StreamingPdfWriter. ``ref`` is reserved up front so
+    pages can point at the font before it is written by write().
+    """
+
+    def __init__(self, path: str, writer: StreamingPdfWriter):
+        self.path = path
+        self.font = TTFont(path, lazy=True)
+        if "glyf" not in self.font:
+            raise ValueError(f"{path} has no TrueType outlines")
+        self.cmap = self.font.getBestCmap() or {}
+        self.units = self.font["head"].unitsPerEm
+        self.advances = self.font["hmtx"].metrics
+        self.glyph_order = self.font.getGlyphOrder()
+        # Widest glyph, for a quick "the whole line fits" check
+        self.max_advance = self.font["hhea"].advanceWidthMax * 1000 / self.units
+        self.ref = writer.reserve()
+        self._widths = {}
+        # ord -> 4 hex digit code, so encode() is a single str.translate
+        self._codes = {}
+        self.used = {0: ""}
+
+    def _add(self, char: str):
+        name = self.cmap.get(ord(char))
+        # Characters the font lacks map to .notdef
+        gid = self.font.getGlyphID(name) if name else 0
+        self._widths[char] = self.advances[self.glyph_order[gid]][0] * 1000 / self.units
+        self._codes[ord(char)] = f"{gid:04X}"
+        self.used.setdefault(gid, char)
+
+    def advance(self, char: str) -> float:
+        """
+        Advance width of a character in 1/1000 em (cached).
+        """
+        width = self._widths.get(char)
+        if width is None:
+            self._add(char)
+            width = self._widths[char]
+        return width
+
+    def width(self, text: str, size: float) -> float:
+        return sum(self.advance(c) for c in text) * size / 1000
+
+    def encode(self, text: str) -> str:
+        """
+        Hex string operand (with brackets) for Tj under Identity-H.
+        """
+        for char in set(text).difference(self._widths):
+            self._add(char)
+        return "<" + text.translate(self._codes) + ">"
+
+    def _subset(self) -> bytes:
+        options = subset.Options()
+        options.retain_gids = True
+        options.notdef_outline = True
+        options.hinting = False
+        options.layout_features = []
+        options.name_IDs = ["*"]
+        font = TTFont(self.path)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(gids=sorted(self.used))
+        subsetter.subset(font)
+        buffer = BytesIO()
+        font.save(buffer)
+        return buffer.getvalue()
+
+    def _to_unicode(self) -> bytes:
+        entries = [
+            f"<{gid:04X}> <{''.join(f'{u:04X}' for u in _utf16(char))}>"
+            for gid, char in sorted(self.used.items()) if char
+        ]
+        blocks = []
+        # bfchar blocks hold at most 100 entries
+        for i in range(0, len(entries), 100):
+            chunk = entries[i:i + 100]
+            blocks.append(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar")
+        return (
+            "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            + "\n".join(blocks)
+            + "\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n"
+        ).encode("ascii")
+
+    def write(self, writer: StreamingPdfWriter):
+        """
+        Write the subset font program and its dictionaries (call once,
+        after the last page that uses the font).
+        """
+        scale = 1000 / self.units
+        head, hhea = self.font["head"], self.font["hhea"]
+        post, os2 = self.font["post"], self.font.get("OS/2")
+        base = pdf_name(self.font["name"].getDebugName(6) or "Font")[1:]
+        # Subset tag: six capitals derived from the glyph set
+        digest = hashlib.md5(",".join(map(str, sorted(self.used))).encode("ascii")).digest()
+        tag = "".join(chr(65 + b % 26) for b in digest[:6])
+        base_font = f"/{tag}+{base}"
+
+        font_file = writer.add_stream("", self._subset())
+        flags = 4 | (1 if post.isFixedPitch else 0)
+        cap_height = getattr(os2, "sCapHeight", 0) or hhea.ascent
+        descriptor = writer.add_object(
+            f"<< /Type /FontDescriptor /FontName {base_font} /Flags {flags} "
+            f"/FontBBox [{pdf_number(head.xMin * scale)} {pdf_number(head.yMin * scale)} "
+            f"{pdf_number(head.xMax * scale)} {pdf_number(head.yMax * scale)}] "
+            f"/ItalicAngle {pdf_number(post.italicAngle)} /Ascent {pdf_number(hhea.ascent * scale)} "
+            f"/Descent {pdf_number(hhea.descent * scale)} /CapHeight {pdf_number(cap_height * scale)} "
+            f"/StemV 80 /FontFile2 {font_file} 0 R >>"
+        )
+        widths = " ".join(
+            f"{gid} [{pdf_number(self.advances[self.glyph_order[gid]][0] * scale)}]"
+            for gid in sorted(self.used)
+        )
+        cid_font = writer.add_object(
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont {base_font} "
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor} 0 R /CIDToGIDMap /Identity /W [{widths}] >>"
+        )
+        to_unicode = writer.add_stream("", self._to_unicode())
+        writer.write_object(
+            self.ref,
+            f"<< /Type /Font /Subtype /Type0 /BaseFont {base_font} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_font} 0 R] /ToUnicode {to_unicode} 0 R >>",
+        )
+
+
+def _utf16(char: str):
+    data = char.encode("utf-16-be")
+    return [int.from_bytes(data[i:i + 2], "big") for i in range(0, len(data), 2)]
@@ -0,0 +1,111 @@
+"""
+Page previews for the frontend tools: low-DPI thumbnails and fixed-size
+zoom tiles of a stored document (api/documents.py), rendered on demand and
+kept in a size-bounded LRU cache keyed by the document's SHA-256 + page +
+scale, so each visible page is rendered once.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from django.conf import settings
+
+from . import documents
+from .cache import ResultCache
+from .rendering import pixmap_to_image
+
+# Side of a zoom tile in pixels
+TILE_SIZE = 512
+# Zoom levels: level n renders at 2**n times 72 DPI
+MAX_TILE_LEVEL = 3
+# Thumbnail scales are rounded to this step so keys stay few
+SCALE_STEP = 0.05
+MIN_SCALE = 0.05
+MAX_SCALE = 1.0
+# Source documents kept open per process
+OPEN_DOCS = 4
+
+PREVIEW_FORMATS = {"png": "image/png", "jpeg": "image/jpeg"}
+
+# Rendered images; the sources live in the document store
+images = ResultCache(settings.PREVIEW_DIR, settings.PREVIEW_CACHE_MAX_BYTES)
+
+_open_docs = OrderedDict()
+# PyMuPDF documents must not be used from two threads at once
+_render_lock = threading.Lock()
+
+
+def _open(doc_id, source_path):
+    if doc_id in _open_docs:
+        _open_docs.move_to_end(doc_id)
+        return _open_docs[doc_id]
+
+    doc = fitz.open(source_path)
+    _open_docs[doc_id] = doc
+    if len(_open_docs) > OPEN_DOCS:
+        _old_id, old = _open_docs.popitem(last=False)
+        old.close()
+    return doc
+
+
+def quantize_scale(scale):
+    scale = min(MAX_SCALE, max(MIN_SCALE, scale))
+    return round(round(scale / SCALE_STEP) * SCALE_STEP, 2)
+
+
+def _encode(pix, fmt):
+    if fmt == "png":
+        return pix.tobytes("png")
+    buffer = BytesIO()
+    pixmap_to_image(pix).save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def _cached(key_parts, render):
+    """
+    Return (image_path, etag), rendering through ``render()`` on a miss.
+    """
+    key = hashlib.sha256(json.dumps(key_parts).encode("utf-8")).hexdigest()
+    hit = images.get(key)
+    if hit is not None:
+        return hit[0], key
+    with _render_lock:
+        data = render()
+    return images.put(key, BytesIO(data), {}), key
+
+
+def thumbnail(document, page_no, scale=0.25, fmt="png"):
+    """
+    Whole page at ``scale`` (1.0 = 72 DPI). ``document`` is the
+    (source_path, meta) pair from documents.get; page_no is 1-based.
+    """
+    source_path, meta = document
+    scale = quantize_scale(scale)
+
+    def render():
+        page = _open(meta["docId"], source_path).load_page(page_no - 1)
+        return _encode(page.get_pixmap(matrix=fitz.Matrix(scale, scale)), fmt)
+
+    return _cached([meta["sha256"], page_no, "thumb", scale, fmt], render)
+
+
+def tile(document, page_no, level, col, row, fmt="png"):
+    """
+    TILE_SIZE square piece of the page rendered at 2**level x 72 DPI;
+    col/row count tiles from the top left. Edge tiles are cropped.
+    """
+    source_path, meta = document
+    zoom = 2 ** level
+
+    def render():
+        page = _open(meta["docId"], source_path).load_page(page_no - 1)
+        side = TILE_SIZE / zoom
+        clip = fitz.Rect(col * side, row * side, (col + 1) * side, (row + 1) * side) & page.rect
+        if clip.is_empty:
+            raise IndexError("Tile outside the page")
+        return _encode(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip), fmt)
+
+    return _cached([meta["sha256"], page_no, "tile", level, col, row, fmt], render)
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+from PIL import Image
+
+# PIL modes for PyMuPDF pixmaps, keyed by (components, has_alpha)
+_PIL_MODES = {
+    (1, False): "L",
+    (2, True): "LA",
+    (3, False): "RGB",
+    (4, True): "RGBA",
+    (4, False): "CMYK",
+}
+
+
+def render_page(page, dpi, alpha=False):
+    return page.get_pixmap(dpi=dpi, alpha=alpha)
+
+
+def pixmap_to_image(pix):
+    """
+    Wrap a Pixmap's samples in a PIL image over the same memory (no copy,
+    no encode). Keep ``pix`` alive for as long as the image is used.
+    """
+    mode = _PIL_MODES[(pix.n, bool(pix.alpha))]
+    return Image.frombuffer(
+        mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1
+    )
+
+
+def pixmap_to_stream(pix, fmt="png"):
+    """
+    Encode a Pixmap into an in-memory file for consumers that want a
+    file-like object (python-pptx, zip members, HTTP responses).
+    """
+    stream = BytesIO(pix.tobytes(fmt))
+    stream.seek(0)
+    return stream
@@ -1,43 +1,434 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
 import fitz  # PyMuPDF
+from functools import partial
 from io import BytesIO
 
-def compress_pdf(uploaded_file, level="recommended"):
-    """
-    Simple, reliable compression using PyMuPDF.
-    Note: true "image recompress" compression is advanced; this method cleans/optimizes PDF structure.
-    """
-
-    # Map levels to settings
-    # Higher garbage/clean/deflate helps reduce size; extreme uses more cleanup.
-    if level == "extreme":
-        garbage = 4
-        deflate = True
-        clean = True
-        linear = True
-    elif level == "strong":
-        garbage = 3
-        deflate = True
-        clean = True
-        linear = False
-    else:  # recommended
-        garbage = 2
-        deflate = True
-        clean = True
-        linear = False
-
-    # Read uploaded file bytes
-    pdf_bytes = uploaded_file.read()
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-
-    out = BytesIO()
-    doc.save(
-        out,
-        garbage=garbage,
-        deflate=deflate,
-        clean=clean,
-        linear=linear,
-    )
-    doc.close()
-    out.seek(0)
+from django.conf import settings
+
+from pdf2docx import Converter
+from pypdf import PdfWriter
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+from .compression import COMPRESS_LEVELS, LEVEL_LADDER, SizeEstimator, save_compressed
+from .imagepdf import write_images_pdf
+from .inputs import open_pypdf
+from .jobs import Progress
+from .parallel import ordered_map, worker_doc
+from .rendering import pixmap_to_image, render_page
+from .slides import SLIDE_MODES, write_deck
+from .tables import write_tables
+from .textpdf import write_text_pdf
+
+logger = logging.getLogger(__name__)
+
+def compress_pdf(source, level="recommended", output_path=None, progress=None, workers=None):
+    """
+    Compress with PyMuPDF: images are downsampled and re-encoded according
+    to the level's policy (see compression.IMAGE_POLICIES), then the file is
+    garbage-collected and deflated on save.
+
+    source is a path (opened lazily from disk) or an uploaded file. With
+    output_path the result is written there and returned as an open file
+    instead of an in-memory buffer. Bytes saved per image class are
+    reported through progress.note(images=...).
+    """
+    progress = progress or Progress()
+    workers = workers or settings.COMPRESS_WORKERS
+    if level not in COMPRESS_LEVELS:
+        level = "recommended"
+
+    spooled = None
+    if not isinstance(source, str):
+        # Pool workers open the document by path
+        fd, spooled = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(source, f)
+        source = spooled
+
+    doc = fitz.open(source)
+    try:
+        out = output_path or BytesIO()
+        stats = save_compressed(doc, source, level, out, workers, progress)
+    finally:
+        doc.close()
+        if spooled:
+            os.remove(spooled)
+
+    progress.note(images=stats)
 
+    if output_path:
+        return open(output_path, "rb"), "compressed.pdf"
+    out.seek(0)
     return out, "compressed.pdf"
+
+
+# Full compressions tried after the estimate, before giving up on a budget
+MAX_BUDGET_RUNS = 2
+# Aim a little under the budget; estimates from samples are approximate
+BUDGET_MARGIN = 0.95
+
+
+def compress_pdf_to_size(input_path, max_bytes, output_path, progress=None, workers=None):
+    """
+    Compress to at most max_bytes with the least lossy level that fits.
+
+    The document is first saved losslessly; when that is too big, levels are
+    binary-searched on size estimates from a few sample pages, and only the
+    chosen level (then at most MAX_BUDGET_RUNS - 1 more aggressive ones) is
+    run on the whole file. When nothing fits, the smallest output is kept.
+    Records {"level", "targetMet", "estimates", "attempts"} as
+    progress.note(budget=...) and returns the output path.
+    """
+    progress = progress or Progress()
+    attempts = []
+
+    doc = fitz.open(input_path)
+    try:
+        save_compressed(doc, input_path, "lossless", output_path)
+    finally:
+        doc.close()
+    best_level, best_size = "lossless", os.path.getsize(output_path)
+    attempts.append({"level": best_level, "bytes": best_size})
+    estimates = {}
+
+    if best_size > max_bytes:
+        sample_path = output_path + ".sample"
+        candidate_path = output_path + ".candidate"
+        try:
+            doc = fitz.open(input_path)
+            try:
+                estimator = SizeEstimator(doc, sample_path, best_size)
+            finally:
+                doc.close()
+
+            # Sizes shrink along the ladder: find the first level estimated to fit
+            ladder = LEVEL_LADDER[1:]
+            lo, hi = 0, len(ladder) - 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if estimator.estimate(ladder[mid]) <= max_bytes * BUDGET_MARGIN:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            estimates = estimator.estimates()
+
+            for level in ladder[lo:lo + MAX_BUDGET_RUNS]:
+                doc = fitz.open(input_path)
+                try:
+                    stats = save_compressed(doc, input_path, level, candidate_path, workers or settings.COMPRESS_WORKERS)
+                finally:
+                    doc.close()
+                size = os.path.getsize(candidate_path)
+                attempts.append({"level": level, "bytes": size})
+                if size < best_size:
+                    os.replace(candidate_path, output_path)
+                    best_level, best_size = level, size
+                    progress.note(images=stats)
+                if size <= max_bytes:
+                    break
+        finally:
+            for path in (sample_path, candidate_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    progress.note(budget={
+        "level": best_level,
+        "bytes": best_size,
+        "targetMet": best_size <= max_bytes,
+        "estimates": estimates,
+        "attempts": attempts,
+    })
+    return output_path
+
+
+# Pages parsed by one pdf2docx task; progress is reported per segment
+WORD_SEGMENT_PAGES = 16
+# Below this many pages a process pool costs more than it saves
+PARALLEL_MIN_WORD_PAGES = 24
+
+
+def _parse_word_segment(input_path, indexes):
+    """
+    Pool task: parse a run of pages with pdf2docx and return the stored
+    layout (plain dicts), to be restored into one Converter.
+    """
+    cv = Converter(input_path)
+    try:
+        cv.parse(pages=indexes, **cv.default_settings)
+        return cv.store()
+    finally:
+        cv.close()
+
+
+def convert_pdf_to_word(input_path, output_path, progress=None, pages=None, workers=None):
+    """
+    Convert a PDF on disk (all pages, or the 0-based ``pages``) to DOCX
+    with pdf2docx. Pages are parsed in segments of WORD_SEGMENT_PAGES on a
+    pool of settings.WORD_WORKERS processes; the parsed layouts are then
+    restored into one Converter, which writes a single DOCX.
+    """
+    progress = progress or Progress()
+
+    cv = Converter(input_path)
+    try:
+        indexes = list(range(len(cv.fitz_doc))) if pages is None else list(pages)
+        workers = workers or settings.WORD_WORKERS
+        if len(indexes) < PARALLEL_MIN_WORD_PAGES:
+            workers = 1
+
+        segments = [indexes[i:i + WORD_SEGMENT_PAGES] for i in range(0, len(indexes), WORD_SEGMENT_PAGES)]
+        # One extra step for writing the DOCX
+        total = len(indexes) + 1
+        done = 0
+        progress(done, total)
+        for layout in ordered_map(partial(_parse_word_segment, input_path), segments, workers):
+            cv.restore(layout)
+            done += len(layout["pages"])
+            progress(done, total)
+
+        cv.make_docx(output_path, **cv.default_settings)
+    finally:
+        cv.close()
+
+    progress(total, total)
+    progress.note(word={"pages": len(indexes), "segments": len(segments)})
+    return output_path
+
+
+def convert_pdf_to_excel(input_path, output_path, progress=None, workers=None):
+    """
+    Extract tables with pdfplumber into one sheet per table. Pages without
+    ruling lines are skipped up front and the rest are sharded over
+    settings.TABLE_WORKERS processes (see tables.py); counts are reported
+    through progress.note(tables=...).
+    """
+    progress = progress or Progress()
+    workers = workers or settings.TABLE_WORKERS
+
+    stats = write_tables(input_path, output_path, workers, progress)
+    progress.note(tables=stats)
+    return output_path
+
+
+def convert_pdf_to_ppt(input_path, output_path, progress=None, mode="image", dpi=150, workers=None):
+    """
+    Build a deck with one slide per page, sized to the page geometry (see
+    slides.py). mode "image" places a rendered page picture (JPEG or PNG
+    by content, identical pages stored once); "text" places editable text
+    boxes and the embedded images instead. Stats go to progress.note(slides=...).
+    """
+    progress = progress or Progress()
+    workers = workers or settings.RENDER_WORKERS
+    if mode not in SLIDE_MODES:
+        mode = "image"
+
+    stats = write_deck(input_path, output_path, mode, dpi, workers, progress)
+    progress.note(slides=stats)
+    return output_path
+
+
+# Output formats for page images: format -> file extension
+IMAGE_FORMATS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+# Pages rendered in one pool task, and the amount of work (in pages at
+# 72 DPI) below which a pool costs more than it saves
+RENDER_SHARD_PAGES = 8
+PARALLEL_MIN_RENDER_WORK = 64
+
+
+def _encode_page(doc, index, dpi, fmt, quality, grayscale, alpha):
+    page = doc.load_page(index)
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    # JPEG has no alpha channel
+    pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=alpha and fmt != "jpeg")
+    if fmt == "png":
+        return pix.tobytes("png")
+    # Pillow's JPEG encoder is several times faster than PyMuPDF's
+    buffer = BytesIO()
+    pixmap_to_image(pix).save(buffer, format=fmt.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def _render_shard(input_path, options, indexes):
+    """
+    Pool task: render a run of pages from the worker's own copy of the
+    document. Returns [(name, image_bytes)].
+    """
+    doc = worker_doc(input_path)
+    ext = IMAGE_FORMATS[options["fmt"]]
+    return [(f"page_{i+1}.{ext}", _encode_page(doc, i, **options)) for i in indexes]
+
+
+def iter_pdf_images(input_path, progress=None, dpi=150, fmt="png", quality=85, pages=None,
+                    grayscale=False, alpha=False, workers=None):
+    """
+    Lazily render pages (all, or the 0-based ``pages``), yielding
+    (name, image_bytes) in page order. fmt is png, jpeg or webp; quality
+    applies to the lossy ones. Big jobs are rendered on a process pool of
+    settings.RENDER_WORKERS, each worker opening the document itself, with
+    a bounded number of pages in flight. The document is opened up front so
+    a broken PDF fails here rather than halfway through a streamed response.
+    """
+    doc = fitz.open(input_path)
+    try:
+        indexes = list(range(len(doc))) if pages is None else list(pages)
+    finally:
+        doc.close()
+
+    workers = workers or settings.RENDER_WORKERS
+    if len(indexes) * (dpi / 72) ** 2 < PARALLEL_MIN_RENDER_WORK:
+        workers = 1
+
+    options = {"dpi": dpi, "fmt": fmt, "quality": quality, "grayscale": grayscale, "alpha": alpha}
+    shards = [indexes[i:i + RENDER_SHARD_PAGES] for i in range(0, len(indexes), RENDER_SHARD_PAGES)]
+    results = ordered_map(partial(_render_shard, input_path, options), shards, workers)
+    return _iter_rendered(results, len(indexes), progress or Progress())
+
+
+def _iter_rendered(results, total, progress):
+    done = 0
+    for shard in results:
+        for name, data in shard:
+            yield name, data
+            done += 1
+            progress(done, total)
+
+
+def render_pdf_images(input_path, out_dir, progress=None, **options):
+    """
+    Render pages into out_dir (see iter_pdf_images for the options).
+    Returns the image paths.
+    """
+    image_paths = []
+    for name, data in iter_pdf_images(input_path, progress, **options):
+        img_path = os.path.join(out_dir, name)
+        with open(img_path, "wb") as f:
+            f.write(data)
+        image_paths.append(img_path)
+
+    return image_paths
+
+
+def convert_text_to_pdf(input_path, output_path, progress=None, font_size=10, page_size="a4"):
+    """
+    Lay out a UTF-8 text file as PDF pages (see textpdf.py), streaming
+    both the input and the output. Stats go to progress.note(text=...).
+    """
+    progress = progress or Progress()
+    # utf-8-sig drops a BOM; undecodable bytes become U+FFFD
+    with open(input_path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        stats = write_text_pdf(f, output_path, font_size, page_size, progress)
+    progress.note(text=stats)
+    return output_path
+
+
+def convert_images_to_pdf(image_paths, output_path, progress=None, page_size="image", max_dpi=None, workers=None):
+    """
+    One page per image, written as the images are embedded (see
+    imagepdf.py). Images that need transcoding are spread over
+    settings.IMAGE_WORKERS processes. Stats go to progress.note(images=...).
+    """
+    progress = progress or Progress()
+    workers = workers or settings.IMAGE_WORKERS
+
+    stats = write_images_pdf(image_paths, output_path, page_size, max_dpi, workers, progress)
+    progress.note(images=stats)
+    return output_path
+
+
+TEXT_ENGINES = ("pypdf", "pymupdf")
+
+
+def iter_pdf_text(input_path, engine="pypdf"):
+    """
+    Lazily extract text page by page, yielding (page_number, text).
+    engine "pymupdf" is several times faster than pypdf; pypdf is kept as
+    the default since its layout of the text is what users already get.
+    Like iter_pdf_images, the document is opened before the first yield.
+    """
+    if engine == "pymupdf":
+        doc = fitz.open(input_path)
+        return _iter_fitz_text(doc)
+    return _iter_pypdf_text(open_pypdf(input_path))
+
+
+def _iter_fitz_text(doc):
+    try:
+        for i in range(len(doc)):
+            yield i + 1, doc.load_page(i).get_text()
+    finally:
+        doc.close()
+
+
+def _iter_pypdf_text(reader):
+    for i, page in enumerate(reader.pages):
+        yield i + 1, page.extract_text()
+
+
+def _ocr_page(input_path, dpi, index):
+    """
+    OCR a single page in a pool worker. Returns (index, pdf_bytes, seconds).
+    """
+    started = time.perf_counter()
+
+    page = worker_doc(input_path).load_page(index)
+    pix = render_page(page, dpi=dpi)
+
+    try:
+        # pytesseract only spills the image to a temp file for the
+        # tesseract CLI; nothing is written into the job dir
+        pdf_bytes = pytesseract.image_to_pdf_or_hocr(pixmap_to_image(pix), extension='pdf')
+    except Exception as tess_err:
+        logger.warning("OCR failed for page %d: %s", index, tess_err)
+        raise RuntimeError("Tesseract OCR binary not found or failed") from tess_err
+
+    return index, pdf_bytes, time.perf_counter() - started
+
+
+def ocr_pdf_file(input_path, output_path, progress=None, workers=None):
+    """
+    Rasterize each page at 300 DPI and run Tesseract on it, producing a
+    searchable PDF. Pages are OCRed on a process pool of up to ``workers``
+    (default settings.OCR_WORKERS) and reassembled in page order; the
+    number of processes the pool was granted is noted as ``workers``.
+    """
+    if pytesseract is None:
+        raise RuntimeError("pytesseract not installed on server")
+
+    progress = progress or Progress()
+    workers = workers or settings.OCR_WORKERS
+
+    doc = fitz.open(input_path)
+    total = len(doc)
+    doc.close()
+
+    merger = PdfWriter()
+    timings = []
+    granted = []
+    started = time.perf_counter()
+
+    # Higher DPI for OCR
+    ocr_page = partial(_ocr_page, input_path, 300)
+    pages = ordered_map(ocr_page, range(total), min(workers, total), on_start=granted.append)
+    for index, pdf_bytes, seconds in pages:
+        merger.append(BytesIO(pdf_bytes))
+        timings.append(round(seconds, 3))
+        progress(index + 1, total)
+
+    with open(output_path, "wb") as f:
+        merger.write(f)
+
+    progress.note(
+        workers=granted[0],
+        page_timings=timings,
+        total_seconds=round(time.perf_counter() - started, 3),
+    )
+    return output_path
@@ -0,0 +1,157 @@
+"""
+File downloads with HTTP caching and byte ranges: ETag/Last-Modified
+validators, conditional GET (304), single byte ranges (206/416) and
+If-Range. With settings.FILE_SERVING set, Django only names the file and
+the front proxy sends the bytes (and handles ranges) itself.
+"""
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.encoding import iri_to_uri
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+# Read size when streaming a range
+BLOCK_SIZE = 256 * 1024
+
+ACCEL_HEADERS = {"x-accel-redirect": "X-Accel-Redirect", "x-sendfile": "X-Sendfile"}
+
+
+class RangeFile:
+    """
+    Read-only view of ``length`` bytes of ``f`` from ``start``. It has no
+    fileno(), so servers can't sendfile() past the end of the range.
+    """
+
+    def __init__(self, f, start, length):
+        self.f = f
+        self.name = f.name
+        self.remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def file_etag(st) -> str:
+    # Job outputs are written once, so size + mtime identify the content
+    return quote_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}")
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in tags
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, None when the
+    header should be ignored (malformed or several ranges), or "invalid"
+    when no part of the range is inside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return "invalid"
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _proxy_response(path, content_type, disposition):
+    header = ACCEL_HEADERS[settings.FILE_SERVING]
+    response = HttpResponse(content_type=content_type)
+    if header == "X-Accel-Redirect":
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+        response[header] = iri_to_uri(settings.FILE_SERVING_ACCEL_PREFIX.rstrip("/") + "/" + relative)
+    else:
+        response[header] = path
+    response["Content-Disposition"] = disposition
+    return response
+
+
+def serve_file(request, path, filename=None, as_attachment=True):
+    """
+    Response for the file at ``path`` honouring If-None-Match,
+    If-Modified-Since, Range and If-Range.
+    """
+    filename = filename or os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    if settings.FILE_SERVING in ACCEL_HEADERS:
+        disposition = content_disposition_header(as_attachment, filename)
+        return _proxy_response(path, content_type, disposition)
+
+    st = os.stat(path)
+    etag = file_etag(st)
+    last_modified = http_date(st.st_mtime)
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        not_modified = since is not None and int(st.st_mtime) <= since
+    if not_modified:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Last-Modified"] = last_modified
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.method == "GET":
+        if_range = request.headers.get("If-Range")
+        # A stale If-Range means the client wants the whole new file
+        if if_range is None or if_range.strip() in (etag, last_modified):
+            byte_range = parse_range(range_header, st.st_size)
+
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{st.st_size}"
+        return response
+
+    f = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=as_attachment, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            RangeFile(f, start, length), status=206, as_attachment=as_attachment,
+            filename=filename, content_type=content_type,
+        )
+        response.block_size = BLOCK_SIZE
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    return response
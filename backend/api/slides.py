@@ -0,0 +1,229 @@
+"""
+PDF to PowerPoint. The slide size follows the page geometry (pages of a
+different shape are letterboxed), pages are rendered on a process pool,
+and each page image is encoded as JPEG when it is mostly photographs and
+as PNG otherwise. Identical page images are stored in the deck once.
+
+In "text" mode pages are not rasterized at all: every text block becomes
+an editable text box and embedded images are placed as pictures.
+"""
+import hashlib
+from functools import partial
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from pptx import Presentation
+from pptx.dml.color import RGBColor
+from pptx.util import Pt
+
+from .parallel import ordered_map, worker_doc
+from .rendering import pixmap_to_image
+
+SLIDE_MODES = ("image", "text")
+
+# PowerPoint accepts slides between 1 and 56 inches a side
+MIN_SLIDE_PT = 72
+MAX_SLIDE_PT = 56 * 72
+# Pages rendered in one pool task
+SLIDE_SHARD_PAGES = 8
+# Below this many pages a process pool costs more than it saves
+PARALLEL_MIN_SLIDES = 16
+# Share of the page covered by raster images above which JPEG is used
+PHOTO_SHARE = 0.3
+JPEG_QUALITY = 85
+
+
+def slide_size(width, height):
+    """
+    Slide size in points for a page of width x height, scaled into the
+    range PowerPoint accepts.
+    """
+    scale = min(1.0, MAX_SLIDE_PT / max(width, height))
+    scale = max(scale, MIN_SLIDE_PT / min(width, height))
+    return min(MAX_SLIDE_PT, width * scale), min(MAX_SLIDE_PT, height * scale)
+
+
+def _photo_share(page):
+    area = abs(page.rect) or 1
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def _page_image(page, dpi, seen):
+    """
+    (digest, encoded image) for the rendered page; the image is None when
+    this worker already sent the same one.
+    """
+    pix = page.get_pixmap(dpi=dpi)
+    digest = hashlib.sha1(pix.samples_mv).hexdigest()
+    if digest in seen:
+        return digest, None
+    seen.add(digest)
+
+    if _photo_share(page) >= PHOTO_SHARE:
+        buffer = BytesIO()
+        pixmap_to_image(pix).save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        return digest, buffer.getvalue()
+    return digest, pix.tobytes("png")
+
+
+def _page_text(page, seen):
+    """
+    Text blocks ({"bbox", "lines": [[span, ...], ...]}) and images
+    ({"bbox", "digest", "data"}) of the page, in drawing order.
+    """
+    blocks, images = [], []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] == 0:
+            lines = [
+                [
+                    {
+                        "text": span["text"],
+                        "size": span["size"],
+                        "font": span["font"],
+                        "color": span["color"],
+                        "bold": bool(span["flags"] & 16),
+                        "italic": bool(span["flags"] & 2),
+                    }
+                    for span in line["spans"]
+                ]
+                for line in block["lines"]
+            ]
+            blocks.append({"bbox": block["bbox"], "lines": lines})
+        elif block["type"] == 1:
+            data, ext = block["image"], block["ext"]
+            if ext not in ("png", "jpeg", "jpg"):
+                # python-pptx only sniffs common formats
+                pix = fitz.Pixmap(data)
+                if pix.n - pix.alpha > 3:
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                data = pix.tobytes("png")
+            digest = hashlib.sha1(data).hexdigest()
+            images.append({"bbox": block["bbox"], "digest": digest, "data": None if digest in seen else data})
+            seen.add(digest)
+    return blocks, images
+
+
+def _slide_shard(input_path, mode, dpi, indexes):
+    """
+    Pool task: everything needed to build the slides for a run of pages.
+    """
+    doc = worker_doc(input_path)
+    seen = set()
+    results = []
+    for i in indexes:
+        page = doc.load_page(i)
+        result = {"width": page.rect.width, "height": page.rect.height}
+        if mode == "text":
+            result["blocks"], result["images"] = _page_text(page, seen)
+        else:
+            result["digest"], result["data"] = _page_image(page, dpi, seen)
+        results.append(result)
+    return results
+
+
+class DeckBuilder:
+    """
+    Adds slides to a Presentation. Pictures go through shapes.add_picture,
+    which stores identical image bytes in the package once; pool workers
+    send an image only the first time, so the bytes of every distinct
+    image are kept here by digest for its repeats.
+    """
+
+    def __init__(self, width, height):
+        self.prs = Presentation()
+        self.width, self.height = slide_size(width, height)
+        self.prs.slide_width = Pt(self.width)
+        self.prs.slide_height = Pt(self.height)
+        self.layout = self.prs.slide_layouts[6]
+        self.blobs = {}
+        self.stats = {"slides": 0, "images": 0, "reused": 0, "formats": {}}
+
+    def add_slide(self, page_width, page_height):
+        """
+        New blank slide plus a function mapping page points to slide EMU
+        (the page scaled to fit and centered).
+        """
+        slide = self.prs.slides.add_slide(self.layout)
+        self.stats["slides"] += 1
+        scale = min(self.width / page_width, self.height / page_height)
+        dx = (self.width - page_width * scale) / 2
+        dy = (self.height - page_height * scale) / 2
+
+        def place(x0, y0, x1, y1):
+            left, top = Pt(dx + x0 * scale), Pt(dy + y0 * scale)
+            return left, top, Pt(dx + x1 * scale) - left, Pt(dy + y1 * scale) - top
+
+        return slide, place, scale
+
+    def add_picture(self, slide, digest, data, left, top, width, height):
+        blob = self.blobs.get(digest)
+        if blob is None:
+            blob = data
+            self.stats["images"] += 1
+        else:
+            self.stats["reused"] += 1
+        picture = slide.shapes.add_picture(BytesIO(blob), left, top, width, height)
+        if digest not in self.blobs:
+            image = picture.image
+            # The part's own bytes, so the copy kept here costs nothing
+            self.blobs[digest] = image.blob
+            formats = self.stats["formats"]
+            formats[image.ext] = formats.get(image.ext, 0) + 1
+
+    def add_page_image(self, page):
+        slide, place, _scale = self.add_slide(page["width"], page["height"])
+        self.add_picture(slide, page["digest"], page["data"], *place(0, 0, page["width"], page["height"]))
+
+    def add_page_text(self, page):
+        slide, place, scale = self.add_slide(page["width"], page["height"])
+        for image in page["images"]:
+            self.add_picture(slide, image["digest"], image["data"], *place(*image["bbox"]))
+        for block in page["blocks"]:
+            box = slide.shapes.add_textbox(*place(*block["bbox"]))
+            frame = box.text_frame
+            frame.word_wrap = False
+            frame.margin_left = frame.margin_right = frame.margin_top = frame.margin_bottom = 0
+            for n, line in enumerate(block["lines"]):
+                paragraph = frame.paragraphs[0] if n == 0 else frame.add_paragraph()
+                for span in line:
+                    run = paragraph.add_run()
+                    run.text = span["text"]
+                    run.font.size = Pt(max(1, round(span["size"] * scale, 1)))
+                    run.font.name = span["font"]
+                    run.font.bold = span["bold"]
+                    run.font.italic = span["italic"]
+                    run.font.color.rgb = RGBColor.from_string(f"{span['color']:06X}")
+
+    def save(self, output_path):
+        self.prs.save(output_path)
+
+
+def write_deck(input_path, output_path, mode="image", dpi=150, workers=1, progress=None):
+    """
+    Build the deck and return its stats: slides, distinct images stored,
+    pictures that reused one, and stored images per format.
+    """
+    doc = fitz.open(input_path)
+    try:
+        total = len(doc)
+        first = doc.load_page(0).rect if total else fitz.Rect(0, 0, 720, 405)
+    finally:
+        doc.close()
+
+    if total < PARALLEL_MIN_SLIDES:
+        workers = 1
+    deck = DeckBuilder(first.width, first.height)
+    add_page = deck.add_page_text if mode == "text" else deck.add_page_image
+
+    shards = [list(range(i, min(i + SLIDE_SHARD_PAGES, total))) for i in range(0, total, SLIDE_SHARD_PAGES)]
+    done = 0
+    for shard in ordered_map(partial(_slide_shard, input_path, mode, dpi), shards, workers):
+        for page in shard:
+            add_page(page)
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+    deck.save(output_path)
+    return deck.stats
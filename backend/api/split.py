@@ -0,0 +1,95 @@
+import os
+from functools import partial
+
+import fitz  # PyMuPDF
+from django.conf import settings
+
+from .parallel import ordered_map, worker_doc
+
+# Below this many output parts a process pool costs more than it saves
+PARALLEL_MIN_PARTS = 16
+
+
+def plan_parts(mode, total, base_name, ranges=None, every=2):
+    """
+    Work out the output parts as (name, start_idx, end_idx), 0-based inclusive.
+    """
+    parts = []
+    if mode == "single":
+        # one PDF per page
+        for i in range(total):
+            parts.append((f"{base_name}_page_{i+1}.pdf", i, i))
+
+    elif mode == "every":
+        chunk = 1
+        for start in range(0, total, every):
+            end = min(total - 1, start + every - 1)
+            parts.append((f"{base_name}_part_{chunk}.pdf", start, end))
+            chunk += 1
+
+    else:
+        # range mode
+        for part, (s, e) in enumerate(ranges or [], start=1):
+            parts.append((f"{base_name}_range_{part}.pdf", s, e))
+
+    return parts
+
+
+def _part_bytes(src, start, end):
+    # insert_pdf grafts only the objects reachable from the selected pages
+    # (fonts, images, ...) into the new document, once per part
+    part = fitz.open()
+    try:
+        part.insert_pdf(src, from_page=start, to_page=end)
+        return part.tobytes(garbage=1, deflate=True)
+    finally:
+        part.close()
+
+
+def _write_shard(input_path, out_dir, shard):
+    src = worker_doc(input_path)
+    paths = []
+    for name, start, end in shard:
+        path = os.path.join(out_dir, name)
+        with open(path, "wb") as f:
+            f.write(_part_bytes(src, start, end))
+        paths.append(path)
+    return paths
+
+
+def write_parts(input_path, out_dir, parts, workers=None):
+    """
+    Write every part to out_dir. The source is parsed once per worker
+    process and parts are spread over settings.SPLIT_WORKERS processes
+    in contiguous shards. Returns the part paths in order.
+    """
+    workers = workers or settings.SPLIT_WORKERS
+    if len(parts) < PARALLEL_MIN_PARTS:
+        workers = 1
+
+    # A few shards per worker keeps the pool busy when part sizes differ
+    shard_count = max(1, min(len(parts), workers * 4))
+    size = -(-len(parts) // shard_count)
+    shards = [parts[i:i + size] for i in range(0, len(parts), size)]
+
+    paths = []
+    for shard_paths in ordered_map(partial(_write_shard, input_path, out_dir), shards, workers):
+        paths.extend(shard_paths)
+    return paths
+
+
+def iter_parts(input_path, parts):
+    """
+    Yield (name, [pdf_bytes]) per part from a single parse of the source,
+    for streaming straight into a ZIP response.
+    """
+    src = fitz.open(input_path)
+    return _iter_parts(src, parts)
+
+
+def _iter_parts(src, parts):
+    try:
+        for name, start, end in parts:
+            yield name, [_part_bytes(src, start, end)]
+    finally:
+        src.close()
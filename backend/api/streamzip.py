@@ -0,0 +1,101 @@
+import os
+import time
+import zipfile
+
+from django.http import StreamingHttpResponse
+
+# Formats that are already compressed; DEFLATE only burns CPU on them
+STORED_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".zip", ".docx", ".xlsx", ".pptx")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """
+    Write-only target for ZipFile. It has tell() but no seek(), which makes
+    zipfile emit data descriptors instead of seeking back to patch headers,
+    so everything written can be handed out immediately.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_type(arcname, mode):
+    if mode == "store":
+        return zipfile.ZIP_STORED
+    if mode == "auto" and arcname.lower().endswith(STORED_SUFFIXES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def stream_zip(members, mode="auto"):
+    """
+    Yield a ZIP archive chunk by chunk.
+
+    members: iterable of (arcname, source) where source is a file path, a
+    bytes object or an iterable of bytes (e.g. a page rendered on the fly).
+    Members are consumed lazily, so only the member being compressed is
+    ever in memory.
+    mode: "auto" (store already-compressed formats, deflate the rest),
+    "store" or "deflate".
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for arcname, source in members:
+            if isinstance(source, (str, os.PathLike)):
+                info = zipfile.ZipInfo.from_file(source, arcname)
+                chunks = _read_chunks(source)
+            elif isinstance(source, (bytes, bytearray, memoryview)):
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                info.file_size = len(source)
+                chunks = [source]
+            else:
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                chunks = source
+            info.compress_type = _compress_type(arcname, mode)
+
+            with zf.open(info, "w") as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory, written when the archive is closed
+    yield sink.drain()
+
+
+def zip_response(members, filename, mode="auto"):
+    response = StreamingHttpResponse(stream_zip(members, mode), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
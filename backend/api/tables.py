@@ -0,0 +1,144 @@
+"""
+Table extraction for pdf_to_excel. PyMuPDF first looks at each page's
+vector drawings and skips pages without enough ruling lines to form a
+table (pdfplumber's default "lines" strategy would find nothing there);
+the remaining pages are handed to pdfplumber in page-range shards on a
+process pool. Every table becomes its own sheet of a write-only
+openpyxl workbook (up to MAX_TABLE_SHEETS), so memory stays flat however
+long the document is.
+"""
+from functools import partial
+
+import fitz  # PyMuPDF
+import pdfplumber
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .parallel import ordered_map
+
+# Candidate pages handed to one pool task
+TABLE_SHARD_PAGES = 16
+# Below this many candidate pages a process pool costs more than it saves
+PARALLEL_MIN_TABLE_PAGES = 32
+# Same as pdfplumber's edge_min_length: shorter segments aren't rulings
+MIN_EDGE_LENGTH = 3
+# Off-axis slack (points) for a segment to count as horizontal/vertical
+AXIS_TOLERANCE = 1
+# Each write-only sheet holds an open temp file until save; well under the
+# usual 1024 descriptor limit. Tables past this share the last sheet
+MAX_TABLE_SHEETS = 200
+OVERFLOW_SHEET = "More tables"
+
+
+def _count_rulings(page):
+    """
+    (horizontal, vertical) straight edges among the page's drawings.
+    """
+    horizontal = vertical = 0
+    for path in page.get_cdrawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(y1 - y0) <= AXIS_TOLERANCE and abs(x1 - x0) >= MIN_EDGE_LENGTH:
+                    horizontal += 1
+                elif abs(x1 - x0) <= AXIS_TOLERANCE and abs(y1 - y0) >= MIN_EDGE_LENGTH:
+                    vertical += 1
+            elif item[0] in ("re", "qu"):
+                # pdfplumber turns rectangles into their four edges
+                horizontal += 2
+                vertical += 2
+    return horizontal, vertical
+
+
+def candidate_pages(input_path):
+    """
+    0-based indexes of the pages that have at least two horizontal and two
+    vertical rulings, plus the page count.
+    """
+    doc = fitz.open(input_path)
+    try:
+        pages = []
+        for page in doc:
+            horizontal, vertical = _count_rulings(page)
+            if horizontal >= 2 and vertical >= 2:
+                pages.append(page.number)
+        return pages, len(doc)
+    finally:
+        doc.close()
+
+
+def _extract_shard(input_path, indexes):
+    """
+    Pool task: [(page_no, [table rows, ...])] for a run of pages.
+    """
+    results = []
+    with pdfplumber.open(input_path, pages=[i + 1 for i in indexes]) as pdf:
+        for page in pdf.pages:
+            tables = page.extract_tables()
+            results.append((page.page_number, tables))
+            # Drop the parsed layout before the next page
+            page.close()
+    return results
+
+
+def iter_tables(input_path, indexes, total, workers=1, progress=None):
+    """
+    Yield (page_no, table_no, rows) in document order for the candidate
+    pages ``indexes``. progress(done, total) counts every page, skipped
+    ones included.
+    """
+    if len(indexes) < PARALLEL_MIN_TABLE_PAGES:
+        workers = 1
+
+    done = total - len(indexes)
+    if progress is not None:
+        progress(done, total)
+    shards = [indexes[i:i + TABLE_SHARD_PAGES] for i in range(0, len(indexes), TABLE_SHARD_PAGES)]
+    for shard in ordered_map(partial(_extract_shard, input_path), shards, workers):
+        for page_no, tables in shard:
+            for table_no, rows in enumerate(tables, start=1):
+                yield page_no, table_no, rows
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+
+def _cell(value):
+    if value is None:
+        return None
+    # Control characters pdfplumber lets through are invalid in XLSX
+    return ILLEGAL_CHARACTERS_RE.sub("", value)
+
+
+def write_tables(input_path, output_path, workers=1, progress=None):
+    """
+    Write one sheet per table ("Page 3 Table 1", ...) to output_path.
+    openpyxl keeps a temp file open per write-only sheet until save, so
+    past MAX_TABLE_SHEETS the remaining tables share one last sheet, each
+    under a "Page N Table K" title row. Returns stats: pages,
+    candidatePages, tables, sheets.
+    """
+    indexes, total = candidate_pages(input_path)
+    wb = Workbook(write_only=True)
+    count = 0
+    overflow = None
+    for page_no, table_no, rows in iter_tables(input_path, indexes, total, workers, progress):
+        title = f"Page {page_no} Table {table_no}"
+        count += 1
+        if count < MAX_TABLE_SHEETS:
+            ws = wb.create_sheet(title=title)
+        else:
+            if overflow is None:
+                overflow = wb.create_sheet(title=OVERFLOW_SHEET)
+            else:
+                overflow.append([])
+            ws = overflow
+            ws.append([title])
+        for row in rows:
+            ws.append([_cell(value) for value in row])
+
+    if not count:
+        ws = wb.create_sheet(title="No tables")
+        ws.append(["No tables found"])
+    wb.save(output_path)
+    return {"pages": total, "candidatePages": len(indexes), "tables": count, "sheets": len(wb.worksheets)}
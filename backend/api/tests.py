@@ -1,3 +1,1564 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+import docx
+import fitz  # PyMuPDF
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from openpyxl import load_workbook
+from pptx import Presentation
+from pptx.util import Pt
+from pypdf import PdfReader
+
+from . import documents, jobs, office, operations, preview, services
+from .cache import ResultCache, result_cache
+from .imagepdf import write_images_pdf
+from .inputs import spool_upload
+from .office import FakeWorker, OfficeBusy, OfficeError, OfficePool
+from .parallel import ordered_map, worker_slots
+from .rendering import pixmap_to_image, render_page
+from .serving import parse_range
+from .services import convert_pdf_to_word, iter_pdf_images
+from .slides import slide_size, write_deck
+from .split import plan_parts, write_parts
+from .tables import write_tables
+from .views import parse_size, text_chunks
+from .streamzip import stream_zip
+
+
+def pdf_bytes(pages=3):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=300, height=400)
+        page.insert_text((50, 72), f"Page {i + 1}", fontsize=24)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def page_texts(data):
+    with fitz.open(stream=data) as doc:
+        return [page.get_text().strip() for page in doc]
+
+
+def pdf_upload(name="input.pdf", pages=3):
+    return SimpleUploadedFile(name, pdf_bytes(pages), content_type="application/pdf")
+
+
+def fake_tesseract(image, extension="pdf"):
+    # Stands in for the tesseract binary: a one-page PDF naming the image size
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), f"{image.width}x{image.height}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def die_in_worker(progress=None):
+    # What the OOM killer does to a pool worker
+    os._exit(1)
+
+
+def write_marker(path, progress=None):
+    with open(path, "w") as f:
+        f.write("done")
+    return path
+
+
+class TempDirMixin:
+    """
+    A scratch directory per test, which is also MEDIA_ROOT along with the
+    directories settings.py derives from it. The result cache is off
+    unless a test turns it on.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=self.tmp,
+            RESULT_CACHE_ENABLED=False,
+            OFFICE_PROFILE_ROOT=os.path.join(self.tmp, "office-profiles"),
+            DOCUMENTS_DIR=os.path.join(self.tmp, "documents"),
+            PARALLEL_SLOTS_DIR=os.path.join(self.tmp, "pool-slots"),
+            # Pool tests need real pools, however few CPUs the host has
+            PARALLEL_MAX_PROCESSES=4,
+            UPLOADS_DIR=os.path.join(self.tmp, "uploads"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+
+class JobTestMixin(TempDirMixin):
+    """
+    Runs jobs on a fresh one-process pool per test and polls them until
+    they finish.
+    """
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(JOB_WORKERS=1)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.shutdown_pool)
+
+    def shutdown_pool(self):
+        if jobs._executor is not None:
+            jobs._executor.shutdown()
+            jobs._executor = None
+
+    def wait_for(self, job_id, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            payload = self.client.get(f"/api/jobs/{job_id}/status/").json()
+            if payload["state"] in (jobs.DONE, jobs.FAILED):
+                return payload
+            time.sleep(0.05)
+        self.fail(f"job {job_id} did not finish")
+
+
+class JobQueueTests(JobTestMixin, SimpleTestCase):
+    def test_job_reaches_done(self):
+        response = self.client.post("/api/pdf-to-image/", {"file": pdf_upload(pages=2), "async": "1"})
+        self.assertEqual(response.status_code, 202)
+
+        payload = self.wait_for(response.json()["jobId"])
+
+        self.assertEqual(payload["state"], jobs.DONE)
+        self.assertEqual(payload["progress"], {"done": 2, "total": 2})
+        self.assertEqual(len(payload["results"]), 2)
+        result = self.client.get(payload["resultUrl"])
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["Content-Type"], "application/zip")
+
+    def test_job_reaches_failed(self):
+        broken = SimpleUploadedFile("broken.pdf", b"not a pdf", content_type="application/pdf")
+        response = self.client.post("/api/pdf-to-image/", {"file": broken, "async": "1"})
+
+        payload = self.wait_for(response.json()["jobId"])
+
+        self.assertEqual(payload["state"], jobs.FAILED)
+        self.assertTrue(payload["error"])
+        result = self.client.get(payload["resultUrl"])
+        self.assertEqual(result.status_code, 500)
+        self.assertEqual(result.json()["error"], payload["error"])
+
+    def test_killed_worker_fails_the_job_and_the_pool_restarts(self):
+        killed = jobs.submit(uuid.uuid4().hex, "crash", die_in_worker)
+        payload = self.wait_for(killed)
+        self.assertEqual(payload["state"], jobs.FAILED)
+        self.assertTrue(payload["error"])
+
+        job_id = uuid.uuid4().hex
+        output_path = os.path.join(jobs.get_job_dir(job_id), "marker.txt")
+        jobs.submit(job_id, "marker", write_marker, output_path)
+        self.assertEqual(self.wait_for(job_id)["state"], jobs.DONE)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/api/jobs/nope/status/").status_code, 404)
+        self.assertEqual(self.client.get("/api/jobs/nope/result/").status_code, 404)
+
+    def test_job_id_must_be_a_uuid(self):
+        # A status file outside the jobs directory must stay out of reach
+        os.makedirs(self.path("jobs"))
+        jobs.write_status(self.tmp, {"jobId": "..", "state": jobs.DONE, "outputs": []})
+        for url in ("/api/jobs/../status/", "/api/jobs/../result/", "/api/jobs/../zip/"):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
+class ParallelOcrTests(TempDirMixin, SimpleTestCase):
+    def test_ordered_map_keeps_input_order(self):
+        results = list(ordered_map(partial(pow, 2), range(20), workers=3, window=4))
+        self.assertEqual(results, [2 ** i for i in range(20)])
+
+    def test_inline_run_claims_no_slots(self):
+        self.assertEqual(list(ordered_map(partial(pow, 2), range(3), workers=1)), [1, 2, 4])
+        self.assertFalse(os.path.exists(self.path("pool-slots")))
+
+    @override_settings(PARALLEL_MAX_PROCESSES=3)
+    def test_slots_are_shared_up_to_the_cap(self):
+        with worker_slots(2) as first:
+            with worker_slots(4) as second:
+                self.assertEqual((first, second), (2, 1))
+                with worker_slots(2) as third:
+                    self.assertEqual(third, 0)
+        # Released on exit
+        with worker_slots(5) as granted:
+            self.assertEqual(granted, 3)
+
+    @override_settings(OCR_WORKERS=2)
+    @mock.patch("pytesseract.image_to_pdf_or_hocr", fake_tesseract)
+    def test_pages_are_reassembled_in_order(self):
+        # Every page gets its own width so the OCR output shows the order
+        with fitz.open() as doc:
+            for i in range(5):
+                doc.new_page(width=72 * (i + 1), height=72)
+            upload = SimpleUploadedFile("scan.pdf", doc.tobytes())
+
+        response = self.client.post("/api/ocr-pdf/", {"file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        texts = page_texts(b"".join(response.streaming_content))
+        self.assertEqual(texts, [f"{300 * (i + 1)}x300" for i in range(5)])
+        self.assertEqual(len(response["X-OCR-Page-Timings"].split(",")), 5)
+        self.assertEqual(response["X-OCR-Workers"], "2")
+
+    @override_settings(OCR_WORKERS=4, PARALLEL_MAX_PROCESSES=4)
+    @mock.patch("pytesseract.image_to_pdf_or_hocr", fake_tesseract)
+    def test_reports_the_workers_it_was_granted(self):
+        started = []
+        with worker_slots(1):
+            results = list(ordered_map(partial(pow, 2), range(5), workers=4, on_start=started.append))
+            self.assertEqual((results, started), ([1, 2, 4, 8, 16], [3]))
+
+            with worker_slots(2):
+                response = self.client.post("/api/ocr-pdf/", {"file": pdf_upload(pages=5)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-OCR-Workers"], "1")
+
+
+class RenderingTests(TempDirMixin, SimpleTestCase):
+    def test_pixmap_to_image_wraps_samples(self):
+        with fitz.open(stream=pdf_bytes(pages=1)) as doc:
+            pix = render_page(doc[0], dpi=72)
+        image = pixmap_to_image(pix)
+        self.assertEqual((image.mode, image.size), ("RGB", (300, 400)))
+        self.assertEqual(image.tobytes(), pix.samples)
+
+    def test_ppt_renders_pages_in_memory(self):
+        response = self.client.post("/api/pdf-to-ppt/", {"file": pdf_upload(pages=3)})
+
+        self.assertEqual(response.status_code, 200)
+        prs = Presentation(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(prs.slides), 3)
+        leftovers = [n for _, _, names in os.walk(self.tmp) for n in names if n.endswith(".png")]
+        self.assertEqual(leftovers, [])
+
+
+class ResultCacheTests(TempDirMixin, SimpleTestCase):
+    def test_put_and_get(self):
+        cache = ResultCache(self.tmp, 1024 ** 2)
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", io.BytesIO(b"output"), {"Content-Type": "application/pdf"})
+
+        data_path, headers = cache.get("k")
+        with open(data_path, "rb") as f:
+            self.assertEqual(f.read(), b"output")
+        self.assertEqual(headers, {"Content-Type": "application/pdf"})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_failed_put_leaves_no_headers_behind(self):
+        cache = ResultCache(self.tmp, 1024 ** 2)
+        with mock.patch("api.cache.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                cache.put("k", io.BytesIO(b"output"), {"Content-Type": "application/pdf"})
+
+        self.assertEqual(os.listdir(self.tmp), [])
+        self.assertIsNone(cache.get("k"))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(self.tmp, 250)
+        for key in ("a", "b"):
+            cache.put(key, io.BytesIO(b"x" * 100), {})
+        os.utime(cache._paths("a")[0], (1, 1))
+        os.utime(cache._paths("b")[0], (2, 2))
+        cache.get("a")
+
+        cache.put("c", io.BytesIO(b"x" * 100), {})
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_tee_commits_only_complete_streams(self):
+        cache = ResultCache(self.tmp, 1024 ** 2)
+        self.assertEqual(b"".join(cache.tee("done", iter([b"a", b"b"]), {})), b"ab")
+        self.assertIsNotNone(cache.get("done"))
+
+        def failing():
+            yield b"partial"
+            raise RuntimeError("extraction failed")
+
+        with self.assertRaises(RuntimeError):
+            b"".join(cache.tee("failed", failing(), {}))
+        self.assertIsNone(cache.get("failed"))
+        self.assertEqual([n for n in os.listdir(self.tmp) if n.endswith(".tmp")], [])
+
+    @override_settings(RESULT_CACHE_ENABLED=True)
+    def test_repeated_request_is_served_from_cache(self):
+        data = pdf_bytes()
+        cache_dir = self.path("cache")
+
+        def rotate(angle):
+            upload = SimpleUploadedFile("input.pdf", data, content_type="application/pdf")
+            with mock.patch.object(result_cache, "root", cache_dir):
+                response = self.client.post("/api/rotate/", {"file": upload, "angle": angle})
+            self.assertEqual(response.status_code, 200)
+            return response["X-Cache"], b"".join(response.streaming_content)
+
+        first = rotate("90")
+        again = rotate("90")
+        other = rotate("180")
+
+        self.assertEqual(first[0], "MISS")
+        self.assertEqual(again, ("HIT", first[1]))
+        self.assertEqual(other[0], "MISS")
+
+
+class StreamZipTests(TempDirMixin, SimpleTestCase):
+    def test_members_from_paths_bytes_and_iterables(self):
+        on_disk = self.path("part.pdf")
+        with open(on_disk, "wb") as f:
+            f.write(b"%PDF-1.7 on disk" * 1000)
+        members = [
+            ("part.pdf", on_disk),
+            ("page-1.png", b"\x89PNG rendered page" * 500),
+            ("notes.txt", (chunk for chunk in [b"first ", b"second"])),
+        ]
+
+        data = b"".join(stream_zip(members))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("part.pdf"), b"%PDF-1.7 on disk" * 1000)
+            self.assertEqual(zf.read("page-1.png"), b"\x89PNG rendered page" * 500)
+            self.assertEqual(zf.read("notes.txt"), b"first second")
+            self.assertEqual(zf.getinfo("part.pdf").compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zf.getinfo("page-1.png").compress_type, zipfile.ZIP_STORED)
+
+    def test_store_mode(self):
+        data = b"".join(stream_zip([("a.pdf", b"abc")], mode="store"))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertEqual(zf.getinfo("a.pdf").compress_type, zipfile.ZIP_STORED)
+
+    def test_pdf_to_image_streams_a_zip(self):
+        response = self.client.post("/api/pdf-to-image/", {"file": pdf_upload(pages=3)})
+
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["page_1.png", "page_2.png", "page_3.png"])
+            self.assertIsNone(zf.testzip())
+
+
+class SplitTests(TempDirMixin, SimpleTestCase):
+    def test_part_boundaries(self):
+        self.assertEqual(plan_parts("every", 5, "doc", every=2), [
+            ("doc_part_1.pdf", 0, 1),
+            ("doc_part_2.pdf", 2, 3),
+            ("doc_part_3.pdf", 4, 4),
+        ])
+        self.assertEqual(plan_parts("single", 2, "doc"), [
+            ("doc_page_1.pdf", 0, 0),
+            ("doc_page_2.pdf", 1, 1),
+        ])
+        self.assertEqual(plan_parts("range", 9, "doc", ranges=[(0, 2), (7, 8)]), [
+            ("doc_range_1.pdf", 0, 2),
+            ("doc_range_2.pdf", 7, 8),
+        ])
+
+    def test_parallel_parts_keep_their_pages(self):
+        input_path = self.path("input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(pdf_bytes(pages=20))
+        parts = plan_parts("single", 20, "doc")
+
+        paths = write_parts(input_path, self.tmp, parts, workers=2)
+
+        self.assertEqual(paths, [self.path(name) for name, _, _ in parts])
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                self.assertEqual(page_texts(f.read()), [f"Page {i + 1}"])
+
+    def test_zip_output(self):
+        response = self.client.post("/api/split/prepare/", {
+            "file": pdf_upload(pages=5), "mode": "range", "range": "1-2,5", "output": "zip",
+        })
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["split_range_1.pdf", "split_range_2.pdf"])
+            self.assertEqual(page_texts(zf.read("split_range_1.pdf")), ["Page 1", "Page 2"])
+            self.assertEqual(page_texts(zf.read("split_range_2.pdf")), ["Page 5"])
+
+    def test_job_zip_holds_only_the_parts(self):
+        payload = self.client.post("/api/split/prepare/", {
+            "file": pdf_upload(pages=4), "mode": "every", "every": "3",
+        }).json()
+
+        response = self.client.get(payload["zipUrl"])
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(sorted(zf.namelist()), ["split_part_1.pdf", "split_part_2.pdf"])
+
+
+class SpoolUploadTests(TempDirMixin, SimpleTestCase):
+    def test_temporary_upload_is_linked(self):
+        with override_settings(FILE_UPLOAD_TEMP_DIR=self.tmp):
+            uploaded = TemporaryUploadedFile("big.pdf", "application/pdf", 0, None)
+        self.addCleanup(uploaded.close)
+        uploaded.write(b"%PDF-1.7 spooled")
+        uploaded.flush()
+        job_dir = self.path("job")
+        os.mkdir(job_dir)
+
+        path = spool_upload(uploaded, job_dir)
+
+        self.assertEqual(path, os.path.join(job_dir, "input.pdf"))
+        self.assertTrue(os.path.samefile(path, uploaded.temporary_file_path()))
+
+    def test_in_memory_upload_is_written(self):
+        path = spool_upload(SimpleUploadedFile("a.pdf", b"%PDF-1.7 small"), self.tmp, name="../a.pdf")
+        self.assertEqual(path, self.path("a.pdf"))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1.7 small")
+
+    def test_protect_writes_encrypted_output(self):
+        response = self.client.post("/api/protect/", {"file": pdf_upload(pages=2), "password": "s3cret"})
+
+        self.assertEqual(response.status_code, 200)
+        with fitz.open(stream=b"".join(response.streaming_content)) as doc:
+            self.assertTrue(doc.needs_pass)
+            self.assertTrue(doc.authenticate("s3cret"))
+            self.assertEqual(len(doc), 2)
+
+    @override_settings(JOB_TTL=100, JOB_SCRATCH_TTL=10, JOB_SWEEP_INTERVAL=0)
+    def test_sweep_removes_expired_job_dirs(self):
+        ages = {"old-scratch": 20, "new-scratch": 5, "old-job": 200, "new-job": 20}
+        for name, age in ages.items():
+            job_dir = jobs.get_job_dir(name)
+            if name.endswith("job"):
+                jobs.write_status(job_dir, {"state": jobs.DONE})
+                target = os.path.join(job_dir, jobs.STATUS_FILE)
+            else:
+                target = job_dir
+            os.utime(target, (time.time() - age,) * 2)
+
+        jobs.sweep()
+
+        remaining = [n for n in os.listdir(self.path("jobs")) if not n.startswith(".")]
+        self.assertEqual(sorted(remaining), ["new-job", "new-scratch"])
+
+
+class BatchTests(JobTestMixin, SimpleTestCase):
+    def zip_of(self, members):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            for name, data in members:
+                zf.writestr(name, data)
+        return SimpleUploadedFile("batch.zip", buf.getvalue(), content_type="application/zip")
+
+    def test_rotates_uploads_and_archive_members(self):
+        response = self.client.post("/api/batch/", {
+            "files": [pdf_upload("a.pdf", pages=1), pdf_upload("b.pdf", pages=2)],
+            "archive": self.zip_of([("nested/c.pdf", pdf_bytes(pages=1)), ("readme.txt", b"skip me")]),
+            "operation": "rotate",
+            "params": '{"angle": 90}',
+        })
+        self.assertEqual(response.status_code, 202)
+
+        payload = self.wait_for(response.json()["jobId"])
+
+        self.assertEqual(payload["state"], jobs.DONE)
+        files = payload["stats"]["files"]
+        self.assertEqual([f["name"] for f in files], ["a.pdf", "b.pdf", "c.pdf"])
+        self.assertTrue(all(f["ok"] for f in files))
+        with zipfile.ZipFile(io.BytesIO(b"".join(self.client.get(payload["zipUrl"]).streaming_content))) as zf:
+            with fitz.open(stream=zf.read("b.pdf")) as doc:
+                self.assertEqual([page.rotation for page in doc], [90, 90])
+
+    def test_one_bad_file_does_not_fail_the_batch(self):
+        broken = SimpleUploadedFile("broken.pdf", b"not a pdf", content_type="application/pdf")
+        response = self.client.post("/api/batch/", {
+            "files": [pdf_upload("good.pdf"), broken],
+            "operation": "rotate",
+            "params": '{"angle": 180}',
+        })
+
+        payload = self.wait_for(response.json()["jobId"])
+
+        self.assertEqual(payload["state"], jobs.DONE)
+        self.assertEqual([f["ok"] for f in payload["stats"]["files"]], [True, False])
+
+    def test_upload_names_cannot_clobber_job_files(self):
+        response = self.client.post("/api/batch/", {
+            "files": [pdf_upload("job.json", pages=1), pdf_upload("job.pdf", pages=2)],
+            "operation": "rotate",
+            "params": '{"angle": 90}',
+        })
+
+        payload = self.wait_for(response.json()["jobId"])
+
+        self.assertEqual(payload["state"], jobs.DONE)
+        self.assertEqual([f["name"] for f in payload["stats"]["files"]], ["job.pdf", "job_2.pdf"])
+        self.assertEqual([r["name"] for r in payload["results"]], ["job.pdf", "job_2.pdf"])
+        job_dir = jobs.get_job_dir(payload["jobId"], create=False)
+        self.assertEqual(sorted(os.listdir(os.path.join(job_dir, "outputs"))), ["job.pdf", "job_2.pdf"])
+        data = b"".join(self.client.get(payload["results"][1]["url"]).streaming_content)
+        self.assertEqual(len(page_texts(data)), 2)
+        with zipfile.ZipFile(io.BytesIO(b"".join(self.client.get(payload["zipUrl"]).streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["job.pdf", "job_2.pdf"])
+
+    def test_file_route_stays_inside_the_job(self):
+        response = self.client.post("/api/batch/", {"files": [pdf_upload()], "operation": "rotate"})
+        job_id = self.wait_for(response.json()["jobId"])["jobId"]
+        other_id = uuid.uuid4().hex
+        with open(os.path.join(jobs.get_job_dir(other_id), "secret.pdf"), "wb") as f:
+            f.write(pdf_bytes())
+
+        response = self.client.get(f"/api/jobs/{job_id}/file/outputs/../../{other_id}/secret.pdf/")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejects_unknown_operation(self):
+        response = self.client.post("/api/batch/", {"files": [pdf_upload()], "operation": "explode"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PipelineTests(TempDirMixin, SimpleTestCase):
+    def run_pipeline(self, steps):
+        return self.client.post("/api/pipeline/", {"file": pdf_upload(pages=2), "steps": json.dumps(steps)})
+
+    def test_runs_steps_in_order(self):
+        response = self.run_pipeline([
+            {"op": "rotate", "angle": 90},
+            {"op": "number_pages", "style": "Page 1"},
+            {"op": "watermark", "text": "DRAFT"},
+            {"op": "compress", "level": "recommended"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        timings = json.loads(response["X-Pipeline-Timings"])
+        self.assertEqual([t["op"] for t in timings], ["open", "rotate", "number_pages", "watermark", "compress"])
+        with fitz.open(stream=b"".join(response.streaming_content)) as doc:
+            self.assertEqual([page.rotation for page in doc], [90, 90])
+            self.assertIn("DRAFT", doc[1].get_text())
+
+    def test_rejects_bad_steps(self):
+        for steps in (
+            [{"op": "compress"}, {"op": "rotate", "angle": 90}],
+            [{"op": "explode"}],
+            [],
+        ):
+            response = self.run_pipeline(steps)
+            self.assertEqual(response.status_code, 400, steps)
+
+    def test_malformed_steps_are_rejected_before_running(self):
+        for steps in (
+            [{"op": ["rotate"]}],
+            [{"op": "rotate", "angle": [90]}],
+            ["rotate"],
+            {"op": "rotate"},
+        ):
+            response = self.run_pipeline(steps)
+            self.assertEqual(response.status_code, 400, steps)
+            self.assertIn("error", response.json())
+        self.assertFalse(os.path.exists(self.path("jobs")))
+
+
+class StampTests(TempDirMixin, SimpleTestCase):
+    def writer_for(self, sizes):
+        path = self.path("input.pdf")
+        with fitz.open() as doc:
+            for i, size in enumerate(sizes):
+                doc.new_page(width=size[0], height=size[1]).insert_text((20, 40), f"Body {i + 1}")
+            doc.save(path)
+        return operations.open_writer(path)
+
+    def save(self, writer):
+        out = io.BytesIO()
+        writer.write(out)
+        return out.getvalue()
+
+    def test_page_numbers(self):
+        writer = self.writer_for([(300, 400)] * 3)
+        operations.number_pages(writer, style="Page 1 of N")
+
+        texts = page_texts(self.save(writer))
+
+        for i, text in enumerate(texts):
+            self.assertIn(f"Body {i + 1}", text)
+            self.assertIn(f"Page {i + 1} of 3", text)
+
+    def test_watermark_form_is_shared_per_page_size(self):
+        writer = self.writer_for([(300, 400), (300, 400), (600, 400)])
+        operations.watermark(writer, text="DRAFT")
+
+        data = self.save(writer)
+
+        for text in page_texts(data):
+            self.assertIn("DRAFT", text)
+        pages = PdfReader(io.BytesIO(data)).pages
+        forms = [
+            {name: ref.idnum for name, ref in page["/Resources"]["/XObject"].items()}
+            for page in pages
+        ]
+        self.assertEqual(forms[0], forms[1])
+        self.assertEqual(list(forms[2]), ["/PdfcWm1"])
+        self.assertNotEqual(forms[0]["/PdfcWm0"], forms[2]["/PdfcWm1"])
+
+    def test_image_watermark(self):
+        response = self.client.post("/api/watermark/", {
+            "file": pdf_upload(pages=1),
+            "image": png_upload("logo.png", size=(40, 40), color="red"),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        with fitz.open(stream=b"".join(response.streaming_content)) as doc:
+            pix = doc[0].get_pixmap(dpi=72)
+        # A faint red square in the middle of the page, scaled to half its width
+        red, green, blue = pix.pixel(150, 200)
+        self.assertEqual(red, 255)
+        self.assertLess(green, 230)
+        self.assertEqual(pix.pixel(150, 200), pix.pixel(80, 130))
+        self.assertEqual(pix.pixel(70, 200), (255, 255, 255))
+
+
+class CountingWorker(FakeWorker):
+    def __init__(self, binary=None, profile_dir=None):
+        super().__init__(binary, profile_dir)
+        self.starts = 0
+        self.killed = threading.Event()
+
+    def start(self):
+        super().start()
+        self.starts += 1
+        self.killed.clear()
+
+    def kill(self):
+        self.killed.set()
+
+
+class HangingWorker(CountingWorker):
+    # Blocks until the pool's timeout kills it, while ``hang`` is set
+    hang = True
+
+    def convert(self, input_path, out_dir):
+        if not self.hang:
+            return super().convert(input_path, out_dir)
+        self.killed.wait(5)
+        raise OfficeError("soffice was killed")
+
+
+class OfficePoolTests(TempDirMixin, SimpleTestCase):
+    def make_pool(self, worker_class=CountingWorker, size=1, max_conversions=100,
+                  queue_timeout=0.1, convert_timeout=5):
+        self.workers = []
+
+        def factory(n):
+            worker = worker_class()
+            self.workers.append(worker)
+            return worker
+
+        return OfficePool(factory, size, max_conversions, queue_timeout, convert_timeout)
+
+    def convert(self, pool, name="report.docx"):
+        input_path = self.path(name)
+        open(input_path, "wb").close()
+        return pool.convert(input_path, self.tmp)
+
+    def test_converts_and_reuses_worker(self):
+        pool = self.make_pool()
+        output_path = self.convert(pool)
+        self.assertEqual(output_path, self.path("report.pdf"))
+        with fitz.open(output_path) as doc:
+            self.assertIn("report.docx", doc[0].get_text())
+        self.convert(pool)
+        self.assertEqual(len(self.workers), 1)
+        self.assertEqual(self.workers[0].starts, 1)
+
+    def test_restarts_after_max_conversions(self):
+        pool = self.make_pool(max_conversions=2)
+        for _ in range(5):
+            self.convert(pool)
+        self.assertEqual(len(self.workers), 1)
+        # Started for conversions 1, 3 and 5
+        self.assertEqual(self.workers[0].starts, 3)
+
+    def test_timeout_kills_and_restarts_worker(self):
+        pool = self.make_pool(HangingWorker, convert_timeout=0.2)
+        with self.assertRaisesMessage(OfficeError, "Conversion timed out"):
+            self.convert(pool)
+        worker = self.workers[0]
+        self.assertTrue(worker.killed.is_set())
+
+        # The killed worker is started again before its next use
+        worker.hang = False
+        self.convert(pool)
+        self.assertEqual(worker.starts, 2)
+
+    def test_busy_when_every_worker_is_taken(self):
+        pool = self.make_pool(size=1)
+        held = pool._acquire()
+        with self.assertRaises(OfficeBusy):
+            self.convert(pool)
+        pool._idle.put(held)
+        self.convert(pool)
+
+    def test_stop_removes_the_worker_profile(self):
+        for worker_class in (office.UnoWorker, office.CliWorker):
+            profile_dir = self.path(f"profile-{worker_class.__name__}")
+            os.makedirs(os.path.join(profile_dir, "user"))
+            worker = worker_class("soffice", profile_dir)
+            if worker_class is office.CliWorker:
+                # A conversion still running when the pool shuts down
+                worker._process = subprocess.Popen(["sleep", "30"])
+
+            worker.stop()
+
+            self.assertFalse(os.path.exists(profile_dir), worker_class.__name__)
+
+    @override_settings(OFFICE_WORKER="api.office.FakeWorker")
+    @mock.patch.object(office, "_pool", None)
+    def test_view_converts_through_the_pool(self):
+        upload = SimpleUploadedFile("sheet.xlsx", b"PK fake workbook")
+        response = self.client.post("/api/excel-to-pdf/", {"file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="sheet.pdf"', response["Content-Disposition"])
+        self.assertEqual(page_texts(b"".join(response.streaming_content)), ["Converted: sheet.xlsx"])
+
+
+def photo_pdf(color=True, size=1200):
+    # A 2 inch square image drawn from a 600 DPI, noisy photo-like raster
+    noise = Image.effect_noise((size, size), 40)
+    if color:
+        gradient = Image.linear_gradient("L").resize(noise.size)
+        image = Image.merge("RGB", (noise, gradient, noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    else:
+        image = noise.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    with fitz.open() as doc:
+        doc.new_page(width=300, height=300).insert_image(fitz.Rect(0, 0, 144, 144), stream=buffer.getvalue())
+        return doc.tobytes()
+
+
+class CompressionTests(TempDirMixin, SimpleTestCase):
+    def compress(self, data, level):
+        upload = SimpleUploadedFile("photo.pdf", data, content_type="application/pdf")
+        response = self.client.post("/api/compress/", {"file": upload, "level": level})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content), json.loads(response["X-Compression-Stats"])
+
+    def image_size(self, data):
+        with fitz.open(stream=data) as doc:
+            info = doc[0].get_images(full=True)[0]
+            return info[2], info[3]
+
+    def test_downsamples_to_the_level_dpi(self):
+        original = photo_pdf()
+        for level, width in (("recommended", 300), ("strong", 240), ("extreme", 192)):
+            output, stats = self.compress(original, level)
+            self.assertEqual(self.image_size(output), (width, width), level)
+            self.assertLess(len(output), len(original))
+            self.assertEqual(stats["color"]["images"], 1)
+            self.assertGreater(stats["color"]["saved"], 0)
+
+    def test_gray_images_are_stored_as_grayscale(self):
+        output, stats = self.compress(photo_pdf(color=False), "recommended")
+
+        self.assertEqual(list(stats), ["gray"])
+        with fitz.open(stream=output) as doc:
+            xref = doc[0].get_images(full=True)[0][0]
+            self.assertEqual(fitz.Pixmap(doc, xref).n, 1)
+
+    def test_ladder_only_levels_fall_back_to_recommended(self):
+        original = photo_pdf()
+        for level in ("lossless", "minimum", "bogus"):
+            output, stats = self.compress(original, level)
+            self.assertEqual(self.image_size(output), (300, 300), level)
+
+
+class CompressToSizeTests(TempDirMixin, SimpleTestCase):
+    def compress(self, data, max_bytes):
+        upload = SimpleUploadedFile("photo.pdf", data, content_type="application/pdf")
+        response = self.client.post("/api/compress/", {"file": upload, "max_bytes": max_bytes})
+        self.assertEqual(response.status_code, 200)
+        output = b"".join(response.streaming_content)
+        return output, response["X-Compression-Level"], response["X-Compression-Target-Met"]
+
+    def image_width(self, data):
+        with fitz.open(stream=data) as doc:
+            return doc[0].get_images(full=True)[0][2]
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("10MB"), 10 * 1024 ** 2)
+        self.assertEqual(parse_size("800 kb"), 800 * 1024)
+        self.assertEqual(parse_size("1048576"), 1048576)
+        for text in ("", "MB", "ten", "0", "5TB"):
+            with self.assertRaises(ValueError, msg=text):
+                parse_size(text)
+
+    def test_lossless_when_it_already_fits(self):
+        output, level, met = self.compress(photo_pdf(), "100MB")
+        self.assertEqual((level, met), ("lossless", "true"))
+        self.assertEqual(self.image_width(output), 1200)
+
+    def test_hits_the_target(self):
+        output, level, met = self.compress(photo_pdf(), "100KB")
+        self.assertEqual((level, met), ("recommended", "true"))
+        self.assertLessEqual(len(output), 100 * 1024)
+
+    def test_reports_a_target_it_cannot_meet(self):
+        output, level, met = self.compress(photo_pdf(), "1000")
+        self.assertEqual((level, met), ("minimum", "false"))
+        self.assertGreater(len(output), 1000)
+        # The smallest attempt is what comes back
+        self.assertLess(len(output), 100 * 1024)
+
+    def test_rejects_bad_size(self):
+        upload = SimpleUploadedFile("photo.pdf", pdf_bytes(), content_type="application/pdf")
+        response = self.client.post("/api/compress/", {"file": upload, "max_bytes": "lots"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_run_leaves_no_scratch_files(self):
+        real_save = services.save_compressed
+
+        def failing_save(doc, input_path, level, output_path, workers=None):
+            if level == "lossless":
+                return real_save(doc, input_path, level, output_path)
+            with open(output_path, "wb") as f:
+                f.write(b"half written")
+            raise RuntimeError("out of disk")
+
+        input_path = self.path("photo.pdf")
+        with open(input_path, "wb") as f:
+            f.write(photo_pdf())
+
+        with mock.patch.object(services, "save_compressed", failing_save):
+            with self.assertRaises(RuntimeError):
+                services.compress_pdf_to_size(input_path, 100 * 1024, self.path("out.pdf"))
+
+        self.assertEqual([n for n in os.listdir(self.tmp) if n.startswith("out.pdf.")], [])
+
+
+def png_upload(name="signature.png", size=(60, 30), color="navy"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+def form_pdf():
+    with fitz.open() as doc:
+        page = doc.new_page(width=300, height=400)
+        widget = fitz.Widget()
+        widget.field_name = "name"
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.rect = fitz.Rect(50, 50, 250, 80)
+        page.add_widget(widget)
+        return doc.tobytes()
+
+
+class IncrementalSaveTests(TempDirMixin, SimpleTestCase):
+    def post(self, url, original, **fields):
+        upload = SimpleUploadedFile("input.pdf", original, content_type="application/pdf")
+        response = self.client.post(url, {"file": upload, "incremental": "1", **fields})
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_sign_keeps_original_bytes(self):
+        original = pdf_bytes(pages=2)
+        response, output = self.post("/api/sign-pdf/", original, signature=png_upload(), page="2")
+
+        self.assertEqual(response["X-Incremental"], "true")
+        self.assertTrue(output.startswith(original))
+        with fitz.open(stream=output) as doc:
+            self.assertEqual(len(doc[1].get_images()), 1)
+
+    def test_sign_closes_the_document_on_a_bad_page(self):
+        opened = []
+
+        def open_fitz(path):
+            opened.append(fitz.open(path))
+            return opened[-1]
+
+        upload = SimpleUploadedFile("input.pdf", pdf_bytes(pages=2), content_type="application/pdf")
+        with mock.patch("api.views.open_fitz", open_fitz):
+            response = self.client.post("/api/sign-pdf/", {"file": upload, "signature": png_upload(), "page": "3"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(opened[0].is_closed)
+
+    def test_rotate_keeps_original_bytes(self):
+        original = pdf_bytes(pages=2)
+        _response, output = self.post("/api/rotate/", original, angle="90")
+
+        self.assertTrue(output.startswith(original))
+        with fitz.open(stream=output) as doc:
+            self.assertEqual([page.rotation for page in doc], [90, 90])
+
+    def test_form_fill_keeps_original_bytes(self):
+        original = form_pdf()
+        _response, output = self.post("/api/form-fill/", original, fields='{"name": "Ada"}')
+
+        self.assertTrue(output.startswith(original))
+        fields = PdfReader(io.BytesIO(output)).get_fields()
+        self.assertEqual(fields["name"]["/V"], "Ada")
+
+
+class TextExtractionTests(TempDirMixin, SimpleTestCase):
+    def extract(self, **fields):
+        response = self.client.post("/api/pdf-to-text/", {"file": pdf_upload(pages=3), **fields})
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+
+    def test_streams_ndjson_records(self):
+        for engine in ("pypdf", "pymupdf"):
+            response, body = self.extract(stream="1", format="ndjson", engine=engine)
+
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            records = [json.loads(line) for line in body.splitlines()]
+            self.assertEqual([r["page"] for r in records], [1, 2, 3])
+            self.assertEqual([r["text"].strip() for r in records], ["Page 1", "Page 2", "Page 3"])
+
+    def test_plain_text_file(self):
+        _response, body = self.extract()
+        self.assertEqual([chunk.strip() for chunk in body.split("\n\n") if chunk.strip()],
+                         ["Page 1", "Page 2", "Page 3"])
+
+    def test_failure_mid_stream_is_the_last_record(self):
+        def pages():
+            yield 1, "first"
+            raise RuntimeError("page 2 is broken")
+
+        chunks = []
+        with self.assertRaisesMessage(RuntimeError, "page 2 is broken"):
+            for chunk in text_chunks(pages(), "ndjson"):
+                chunks.append(chunk)
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {"page": 1, "text": "first"},
+            {"error": "page 2 is broken"},
+        ])
+
+    @override_settings(RESULT_CACHE_ENABLED=True)
+    def test_failed_extraction_is_not_cached(self):
+        def broken(path, engine):
+            yield 1, "first"
+            raise RuntimeError("page 2 is broken")
+
+        with mock.patch.object(result_cache, "root", self.path("cache")):
+            with mock.patch("api.views.iter_pdf_text", broken):
+                response = self.client.post("/api/pdf-to-text/", {"file": pdf_upload(), "format": "ndjson"})
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(response.json(), {"error": "page 2 is broken"})
+
+            response = self.client.post("/api/pdf-to-text/", {"file": pdf_upload(), "format": "ndjson"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_rejects_unknown_engine(self):
+        response = self.client.post("/api/pdf-to-text/", {"file": pdf_upload(), "engine": "ocr"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PdfToImageTests(TempDirMixin, SimpleTestCase):
+    def images(self, **fields):
+        response = self.client.post("/api/pdf-to-image/", {"file": pdf_upload(pages=4), **fields})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            return {name: Image.open(io.BytesIO(zf.read(name))) for name in zf.namelist()}
+
+    def test_page_selection_format_and_grayscale(self):
+        images = self.images(pages="2-3", format="jpg", dpi="72", grayscale="1")
+
+        self.assertEqual(list(images), ["page_2.jpg", "page_3.jpg"])
+        for image in images.values():
+            self.assertEqual((image.format, image.mode, image.size), ("JPEG", "L", (300, 400)))
+
+    def test_transparent_webp(self):
+        images = self.images(pages="1", format="webp", alpha="1", dpi="36")
+        self.assertEqual((images["page_1.webp"].format, images["page_1.webp"].mode), ("WEBP", "RGBA"))
+
+    def test_pool_keeps_page_order(self):
+        input_path = self.path("input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(pdf_bytes(pages=20))
+
+        names = [name for name, _data in iter_pdf_images(input_path, workers=2)]
+
+        self.assertEqual(names, [f"page_{i}.png" for i in range(1, 21)])
+
+    def test_rejects_bad_options(self):
+        for fields in ({"dpi": "5000"}, {"format": "gif"}, {"quality": "high"}):
+            response = self.client.post("/api/pdf-to-image/", {"file": pdf_upload(), **fields})
+            self.assertEqual(response.status_code, 400, fields)
+
+
+class PreviewTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(preview.images, "root", self.path("preview")),
+            mock.patch.object(preview, "_open_docs", OrderedDict()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, data=None, **fields):
+        if data is not None:
+            fields["file"] = SimpleUploadedFile("doc.pdf", data)
+        response = self.client.post("/api/preview/", fields)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def image(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        if response.status_code != 200:
+            return response, None
+        return response, Image.open(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_upload_returns_hash_and_page_sizes(self):
+        data = pdf_bytes(pages=2)
+        meta = self.upload(data)
+
+        self.assertEqual(meta["hash"], hashlib.sha256(data).hexdigest())
+        self.assertEqual(meta["pageCount"], 2)
+        self.assertEqual(meta["pages"], [{"width": 300, "height": 400}] * 2)
+        self.assertEqual(meta["thumbnailUrl"], f"/api/preview/{meta['docId']}/pages/{{page}}/thumb/")
+        self.assertEqual(documents.get(meta["docId"])[1]["sha256"], meta["hash"])
+
+    def test_stored_document_is_previewed_without_a_copy(self):
+        stored = self.client.post("/api/documents/", {"file": pdf_upload(pages=2)}).json()
+
+        meta = self.upload(doc_id=stored["docId"])
+
+        self.assertEqual((meta["docId"], meta["hash"]), (stored["docId"], stored["sha256"]))
+        stored_ids = [n for n in os.listdir(self.path("documents")) if not n.startswith(".")]
+        self.assertEqual(stored_ids, [stored["docId"]])
+
+    def test_same_content_shares_renders(self):
+        data = pdf_bytes(pages=1)
+        first, second = self.upload(data), self.upload(data)
+        self.assertNotEqual(first["docId"], second["docId"])
+
+        response, _image = self.image(first["thumbnailUrl"].format(page=1))
+        again, _image = self.image(second["thumbnailUrl"].format(page=1))
+
+        self.assertEqual(response["ETag"], again["ETag"])
+        self.assertEqual(len([n for n in os.listdir(self.path("preview")) if n.endswith(".bin")]), 1)
+
+    def test_thumbnail_is_cached_and_revalidated(self):
+        meta = self.upload(pdf_bytes(pages=2))
+        url = meta["thumbnailUrl"].format(page=2) + "?scale=0.49&type=jpeg"
+
+        response, image = self.image(url)
+        self.assertEqual((image.format, image.size), ("JPEG", (150, 200)))
+        self.assertIn("immutable", response["Cache-Control"])
+
+        again, _image = self.image(url, if_none_match=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], response["ETag"])
+
+    def test_tiles_are_cropped_at_the_page_edge(self):
+        meta = self.upload(pdf_bytes(pages=1))
+        tile_url = meta["tileUrl"].replace("{page}", "1")
+
+        _response, first = self.image(tile_url.format(level=1, col=0, row=0))
+        _response, corner = self.image(tile_url.format(level=1, col=1, row=1))
+        outside, _image = self.image(tile_url.format(level=1, col=2, row=0))
+
+        self.assertEqual(first.size, (512, 512))
+        self.assertEqual(corner.size, (88, 288))
+        self.assertEqual(outside.status_code, 400)
+
+    def test_unknown_document_and_page(self):
+        meta = self.upload(pdf_bytes(pages=1))
+        self.assertEqual(self.client.get(meta["thumbnailUrl"].format(page=2)).status_code, 400)
+        unknown = meta["thumbnailUrl"].format(page=1).replace(meta["docId"], "0" * 32)
+        self.assertEqual(self.client.get(unknown).status_code, 404)
+
+
+class DocumentHandleTests(TempDirMixin, SimpleTestCase):
+    def register(self, pages=3, name="report.pdf"):
+        response = self.client.post("/api/documents/", {"file": pdf_upload(name, pages=pages)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_register_read_and_delete(self):
+        meta = self.register()
+
+        self.assertEqual((meta["name"], meta["pageCount"]), ("report.pdf", 3))
+        self.assertEqual(meta["summary"], "Page 1 Page 2 Page 3")
+        url = f"/api/documents/{meta['docId']}/"
+        self.assertEqual(self.client.get(url).json(), meta)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_tool_views_accept_doc_ids(self):
+        first = self.register(pages=2)
+        second = self.register(pages=1)
+
+        rotated = self.client.post("/api/rotate/", {"doc_id": first["docId"], "angle": "90"})
+        merged = self.client.post("/api/merge/", {"doc_ids": f"{first['docId']},{second['docId']}"})
+
+        with fitz.open(stream=b"".join(rotated.streaming_content)) as doc:
+            self.assertEqual([page.rotation for page in doc], [90, 90])
+        self.assertEqual(page_texts(b"".join(merged.streaming_content)), ["Page 1", "Page 2", "Page 1"])
+        # The stored source is untouched by the tools
+        self.assertEqual(documents.get(first["docId"])[1]["pageCount"], 2)
+
+    def test_unknown_doc_id(self):
+        response = self.client.post("/api/rotate/", {"doc_id": "0" * 32, "angle": "90"})
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(documents.get("../../etc"))
+
+    def test_expired_handle(self):
+        with override_settings(DOCUMENTS_TTL=-1):
+            meta = self.register()
+        self.assertIsNone(documents.get(meta["docId"]))
+
+    @override_settings(DOCUMENTS_MAX_BYTES=100)
+    def test_over_quota(self):
+        response = self.client.post("/api/documents/", {"file": pdf_upload()})
+        self.assertEqual(response.status_code, 413)
+
+
+@override_settings(UPLOAD_MIN_CHUNK_SIZE=16)
+class ChunkedUploadTests(TempDirMixin, SimpleTestCase):
+    chunk_size = 512
+
+    def setUp(self):
+        super().setUp()
+        self.data = pdf_bytes(pages=2)
+        self.chunks = [self.data[i:i + self.chunk_size] for i in range(0, len(self.data), self.chunk_size)]
+
+    def start(self, **fields):
+        response = self.client.post("/api/uploads/", {
+            "name": "big.pdf", "size": len(self.data), "chunk_size": self.chunk_size, **fields,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunk(self, upload_id, index, data=None, checksum=None):
+        data = self.chunks[index] if data is None else data
+        return self.client.put(
+            f"/api/uploads/{upload_id}/chunks/{index}/", data,
+            content_type="application/octet-stream",
+            headers={"X-Chunk-Sha256": checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    def test_chunks_in_any_order_become_a_document(self):
+        state = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        upload_id = state["uploadId"]
+        self.assertEqual(state["totalChunks"], len(self.chunks))
+        self.assertGreater(len(self.chunks), 2)
+
+        for index in reversed(range(1, len(self.chunks))):
+            self.assertEqual(self.put_chunk(upload_id, index).status_code, 200)
+        status = self.client.get(f"/api/uploads/{upload_id}/").json()
+        self.assertEqual(status["receivedChunks"], list(range(1, len(self.chunks))))
+        self.assertFalse(status["complete"])
+
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 200)
+        response = self.client.post(f"/api/uploads/{upload_id}/complete/")
+
+        self.assertEqual(response.status_code, 201)
+        meta = response.json()
+        self.assertEqual((meta["name"], meta["pageCount"]), ("big.pdf", 2))
+        source_path, _meta = documents.get(meta["docId"])
+        with open(source_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.client.get(f"/api/uploads/{upload_id}/").status_code, 404)
+
+    def test_bad_chunk_checksum_is_rejected(self):
+        upload_id = self.start()["uploadId"]
+
+        response = self.put_chunk(upload_id, 0, checksum="0" * 64)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.client.get(f"/api/uploads/{upload_id}/").json()["receivedChunks"], [])
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 200)
+
+    def test_preflight_allows_the_checksum_header(self):
+        upload_id = self.start()["uploadId"]
+
+        response = self.client.options(f"/api/uploads/{upload_id}/chunks/0/", headers={
+            "Origin": "http://localhost:5173",
+            "Access-Control-Request-Method": "PUT",
+            "Access-Control-Request-Headers": "content-type,x-chunk-sha256",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        allowed = response["Access-Control-Allow-Headers"].split(", ")
+        self.assertIn("x-chunk-sha256", allowed)
+
+    def test_chunk_needs_checksum_and_exact_length(self):
+        upload_id = self.start()["uploadId"]
+        url = f"/api/uploads/{upload_id}/chunks/0/"
+        response = self.client.put(url, self.chunks[0], content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, 0, data=self.chunks[0][:-1]).status_code, 400)
+
+    def test_complete_checks_missing_chunks_and_file_digest(self):
+        upload_id = self.start(sha256="f" * 64)["uploadId"]
+        self.put_chunk(upload_id, 0)
+        self.assertEqual(self.client.post(f"/api/uploads/{upload_id}/complete/").status_code, 409)
+
+        for index in range(1, len(self.chunks)):
+            self.put_chunk(upload_id, index)
+        self.assertEqual(self.client.post(f"/api/uploads/{upload_id}/complete/").status_code, 422)
+
+    def test_partial_upload_is_not_downloadable(self):
+        upload_id = self.start()["uploadId"]
+        self.put_chunk(upload_id, 0)
+
+        response = self.client.get(f"/api/jobs/{upload_id}/file/upload.part/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp, "uploads", upload_id)))
+
+    def test_idle_uploads_expire(self):
+        idle_id = self.start()["uploadId"]
+        self.put_chunk(idle_id, 0)
+        with override_settings(UPLOAD_TTL=-1):
+            active_id = self.start()["uploadId"]
+
+        self.assertEqual(self.client.get(f"/api/uploads/{idle_id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/uploads/{active_id}/").status_code, 200)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 999))
+        self.assertEqual(parse_range("bytes=500-5000", 1000), (500, 999))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range("bytes=1000-", 1000), "invalid")
+        self.assertEqual(parse_range("bytes=2000-3000", 1000), "invalid")
+        self.assertEqual(parse_range("bytes=-0", 1000), "invalid")
+
+    def test_ignored(self):
+        for header in ("bytes=0-1,5-9", "items=0-1", "bytes=5", "bytes=a-b", "bytes=9-2"):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+
+class ServeJobFileTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        payload = self.client.post("/api/split/prepare/", {
+            "file": pdf_upload(pages=2), "mode": "single",
+        }).json()
+        self.url = payload["results"][0]["url"]
+        self.data = b"".join(self.client.get(self.url).streaming_content)
+
+    def test_range_and_validators(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.data[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.data)}")
+
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, headers={"If-None-Match": etag}).status_code, 304)
+        stale = self.client.get(self.url, headers={"Range": "bytes=10-19", "If-Range": '"old"'})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(b"".join(stale.streaming_content), self.data)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, headers={"Range": f"bytes={len(self.data)}-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+    @override_settings(FILE_SERVING="x-accel-redirect", FILE_SERVING_ACCEL_PREFIX="/protected/")
+    def test_proxy_offload(self):
+        response = self.client.get(self.url)
+        job_id = self.url.split("/")[3]
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/jobs/{job_id}/split_page_1.pdf")
+        self.assertEqual(response.content, b"")
+
+    def test_unknown_job_zip_creates_nothing(self):
+        job_id = uuid.uuid4().hex
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}/zip/").status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "jobs", job_id)))
+
+
+def table_pdf(pages, table_pages):
+    # A ruled 3x2 grid on each of table_pages (0-based), plain text elsewhere
+    with fitz.open() as doc:
+        for i in range(pages):
+            page = doc.new_page(width=300, height=400)
+            if i not in table_pages:
+                page.insert_text((50, 72), f"Prose on page {i + 1}")
+                continue
+            xs, ys = (50, 150, 250), (50, 80, 110, 140)
+            for x in xs:
+                page.draw_line((x, ys[0]), (x, ys[-1]))
+            for y in ys:
+                page.draw_line((xs[0], y), (xs[-1], y))
+            for r in range(3):
+                for c in range(2):
+                    page.insert_text((xs[c] + 5, ys[r] + 20), f"p{i + 1}r{r}c{c}", fontsize=10)
+        return doc.tobytes()
+
+
+class TableExtractionTests(TempDirMixin, SimpleTestCase):
+    def test_one_sheet_per_table(self):
+        upload = SimpleUploadedFile("report.pdf", table_pdf(3, {0, 2}), content_type="application/pdf")
+        response = self.client.post("/api/pdf-to-excel/", {"file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response["X-Table-Stats"]), {"pages": 3, "candidatePages": 2, "tables": 2, "sheets": 2})
+        wb = load_workbook(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(wb.sheetnames, ["Page 1 Table 1", "Page 3 Table 1"])
+        rows = [list(row) for row in wb["Page 3 Table 1"].iter_rows(values_only=True)]
+        self.assertEqual(rows, [[f"p3r{r}c{c}" for c in range(2)] for r in range(3)])
+
+    def test_pool_keeps_document_order(self):
+        input_path = self.path("input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(table_pdf(40, set(range(40))))
+
+        stats = write_tables(input_path, self.path("out.xlsx"), workers=2)
+
+        self.assertEqual(stats["tables"], 40)
+        wb = load_workbook(self.path("out.xlsx"), read_only=True)
+        self.assertEqual(wb.sheetnames, [f"Page {i} Table 1" for i in range(1, 41)])
+        wb.close()
+
+    @mock.patch("api.tables.MAX_TABLE_SHEETS", 3)
+    def test_tables_past_the_sheet_cap_share_one_sheet(self):
+        input_path = self.path("input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(table_pdf(4, set(range(4))))
+
+        stats = write_tables(input_path, self.path("out.xlsx"))
+
+        self.assertEqual((stats["tables"], stats["sheets"]), (4, 3))
+        wb = load_workbook(self.path("out.xlsx"))
+        self.assertEqual(wb.sheetnames, ["Page 1 Table 1", "Page 2 Table 1", "More tables"])
+        rows = [row[0] for row in wb["More tables"].iter_rows(values_only=True)]
+        self.assertEqual(rows, ["Page 3 Table 1", "p3r0c0", "p3r1c0", "p3r2c0", None,
+                                "Page 4 Table 1", "p4r0c0", "p4r1c0", "p4r2c0"])
+
+
+def docx_texts(source):
+    return [p.text.strip() for p in docx.Document(source).paragraphs if p.text.strip()]
+
+
+class PdfToWordTests(TempDirMixin, SimpleTestCase):
+    def test_page_selection(self):
+        for fields, expected in (
+            ({"pages": "2,4"}, ["Page 2", "Page 4"]),
+            ({"start": "2", "end": "3"}, ["Page 2", "Page 3"]),
+        ):
+            response = self.client.post("/api/pdf-to-word/", {"file": pdf_upload(pages=5), **fields})
+            self.assertEqual(response.status_code, 200)
+            texts = docx_texts(io.BytesIO(b"".join(response.streaming_content)))
+            self.assertEqual(texts, expected, fields)
+
+    def test_segments_parsed_on_a_pool_keep_page_order(self):
+        input_path = self.path("input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(pdf_bytes(pages=30))
+        progress = jobs.Progress()
+
+        convert_pdf_to_word(input_path, self.path("out.docx"), progress=progress, workers=2)
+
+        self.assertEqual(docx_texts(self.path("out.docx")), [f"Page {i}" for i in range(1, 31)])
+        self.assertEqual(progress.stats["word"], {"pages": 30, "segments": 2})
+        self.assertEqual((progress.done, progress.total), (31, 31))
+
+
+class SlideTests(TempDirMixin, SimpleTestCase):
+    def convert(self, data, **fields):
+        upload = SimpleUploadedFile("deck.pdf", data, content_type="application/pdf")
+        response = self.client.post("/api/pdf-to-ppt/", {"file": upload, **fields})
+        self.assertEqual(response.status_code, 200)
+        prs = Presentation(io.BytesIO(b"".join(response.streaming_content)))
+        return prs, json.loads(response["X-Slide-Stats"])
+
+    def test_slide_size(self):
+        self.assertEqual(slide_size(300, 400), (300, 400))
+        self.assertEqual(slide_size(36, 36), (72, 72))
+        self.assertEqual(slide_size(8000, 4000), (4032, 2016))
+
+    def test_identical_pages_share_one_image(self):
+        with fitz.open() as doc:
+            for _ in range(2):
+                doc.new_page(width=300, height=400)
+            doc.new_page(width=300, height=400).insert_text((50, 72), "Different")
+            data = doc.tobytes()
+
+        prs, stats = self.convert(data)
+
+        self.assertEqual((prs.slide_width, prs.slide_height), (Pt(300), Pt(400)))
+        self.assertEqual(len(prs.slides), 3)
+        self.assertEqual(stats["images"], 2)
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["formats"], {"png": 2})
+
+    def test_repeats_across_pool_workers_store_one_image(self):
+        input_path = self.path("input.pdf")
+        with fitz.open() as doc:
+            for _ in range(40):
+                doc.new_page(width=300, height=400)
+            doc.save(input_path)
+
+        stats = write_deck(input_path, self.path("out.pptx"), workers=2)
+
+        self.assertEqual((stats["slides"], stats["images"], stats["reused"]), (40, 1, 39))
+        with zipfile.ZipFile(self.path("out.pptx")) as zf:
+            media = [name for name in zf.namelist() if name.startswith("ppt/media/")]
+        self.assertEqual(len(media), 1)
+
+    def test_text_mode_places_editable_text(self):
+        prs, stats = self.convert(pdf_bytes(pages=2), mode="text")
+
+        self.assertEqual(stats["images"], 0)
+        texts = [[shape.text_frame.text for shape in slide.shapes] for slide in prs.slides]
+        self.assertEqual(texts, [["Page 1"], ["Page 2"]])
+
+    def test_rejects_bad_options(self):
+        for fields in ({"mode": "video"}, {"dpi": "1000"}):
+            response = self.client.post("/api/pdf-to-ppt/", {"file": pdf_upload(), **fields})
+            self.assertEqual(response.status_code, 400, fields)
+
+
+class TextToPdfTests(TempDirMixin, SimpleTestCase):
+    def convert(self, text, **fields):
+        upload = SimpleUploadedFile("notes.txt", text.encode("utf-8"), content_type="text/plain")
+        response = self.client.post("/api/text-to-pdf/", {"file": upload, **fields})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_text_stays_extractable(self):
+        data = self.convert("\ufeffHello Grüße\ncafé naïve\n", page_size="letter")
+
+        with fitz.open(stream=data) as doc:
+            self.assertEqual(len(doc), 1)
+            self.assertEqual(tuple(doc[0].rect)[2:], (612, 792))
+            self.assertEqual(doc[0].get_text().split("\n")[:2], ["Hello Grüße", "café naïve"])
+
+    def test_pages_fill_up_in_order(self):
+        data = self.convert("".join(f"line {i}\n" for i in range(1, 201)))
+
+        texts = page_texts(data)
+        # 61 lines fit on an A4 page at 10pt
+        self.assertEqual(len(texts), 4)
+        self.assertTrue(texts[1].startswith("line 62\n"))
+        self.assertTrue(texts[3].endswith("line 200"))
+
+    def test_long_lines_wrap_at_spaces(self):
+        words = [f"word{i}" for i in range(300)]
+        data = self.convert(" ".join(words) + "\n", font_size="12")
+
+        lines = page_texts(data)[0].split("\n")
+        self.assertGreater(len(lines), 5)
+        self.assertEqual(" ".join(line.strip() for line in lines).split(), words)
+
+    def test_rejects_bad_options(self):
+        for fields in ({"page_size": "a0"}, {"font_size": "100"}):
+            upload = SimpleUploadedFile("notes.txt", b"text")
+            response = self.client.post("/api/text-to-pdf/", {"file": upload, **fields})
+            self.assertEqual(response.status_code, 400, fields)
+
+
+class ImagesToPdfTests(TempDirMixin, SimpleTestCase):
+    def image_file(self, name, image, **save_options):
+        buffer = io.BytesIO()
+        image.save(buffer, **save_options)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def convert(self, files, **fields):
+        response = self.client.post("/api/image-to-pdf/", {"files": files, **fields})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content), json.loads(response["X-Image-Stats"])
+
+    def test_jpeg_is_embedded_unchanged(self):
+        photo = self.image_file("photo.jpg", Image.new("RGB", (96, 48), "red"), format="JPEG")
+        jpeg = photo.read()
+        photo.seek(0)
+
+        data, stats = self.convert([photo])
+
+        self.assertEqual(stats, {"pages": 1, "passthrough": 1, "transcoded": 0})
+        self.assertIn(jpeg, data)
+        with fitz.open(stream=data) as doc:
+            self.assertEqual(tuple(doc[0].rect)[2:], (72, 36))
+
+    def test_exif_orientation_turns_the_page(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        photo = self.image_file("phone.jpg", Image.new("RGB", (96, 48), "blue"), format="JPEG", exif=exif)
+
+        data, stats = self.convert([photo])
+
+        self.assertEqual(stats["passthrough"], 1)
+        with fitz.open(stream=data) as doc:
+            width, height = doc[0].rect.width, doc[0].rect.height
+        # 96 x 48 pixels, shown rotated a quarter turn
+        self.assertEqual(height, 2 * width)
+
+    def test_transparency_becomes_white(self):
+        clear = self.image_file("clear.png", Image.new("RGBA", (40, 40), (255, 0, 0, 0)), format="PNG")
+
+        data, stats = self.convert([clear])
+
+        self.assertEqual(stats["transcoded"], 1)
+        with fitz.open(stream=data) as doc:
+            self.assertEqual(doc[0].get_pixmap().pixel(10, 10), (255, 255, 255))
+
+    def test_page_size_and_max_dpi(self):
+        wide = self.image_file("wide.png", Image.new("RGB", (2000, 1000), "green"), format="PNG")
+
+        data, _stats = self.convert([wide], page_size="a4", max_dpi="72")
+
+        with fitz.open(stream=data) as doc:
+            self.assertEqual([round(v) for v in tuple(doc[0].rect)[2:]], [842, 595])
+            self.assertEqual(doc[0].get_images(full=True)[0][2], 842)
+
+    def render_means(self, output_path):
+        means = []
+        with fitz.open(output_path) as doc:
+            for page in doc:
+                samples = page.get_pixmap(dpi=72).samples
+                means.append(sum(samples) / len(samples))
+        return means
+
+    def test_16bit_grayscale_is_scaled(self):
+        gradient = Image.new("I;16", (256, 16))
+        gradient.putdata([x * 257 for x in range(256)] * 16)
+        image_path = self.path("gradient.png")
+        gradient.save(image_path)
+
+        output_path = self.path("out.pdf")
+        write_images_pdf([image_path], output_path)
+
+        # Clipping instead of scaling made the page almost white
+        self.assertAlmostEqual(self.render_means(output_path)[0], 127.5, delta=3)
+
+    def test_one_page_per_frame(self):
+        frames = [Image.new("RGB", (60, 40), color) for color in ("red", "green", "blue")]
+        tiff_path = self.path("scan.tif")
+        frames[0].save(tiff_path, save_all=True, append_images=frames[1:])
+        jpeg_path = self.path("photo.jpg")
+        frames[0].save(jpeg_path)
+
+        output_path = self.path("out.pdf")
+        stats = write_images_pdf([tiff_path, jpeg_path], output_path)
+
+        self.assertEqual(stats, {"pages": 4, "passthrough": 1, "transcoded": 3})
+        with fitz.open(output_path) as doc:
+            colors = [page.get_pixmap(dpi=72).pixel(30, 20) for page in doc]
+        self.assertEqual(colors[:3], [(255, 0, 0), (0, 128, 0), (0, 0, 255)])
+        self.assertEqual([n for n in os.listdir(self.tmp) if n.endswith(".pdfimage")], [])
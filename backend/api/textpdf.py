@@ -0,0 +1,141 @@
+"""
+Plain text to PDF without holding the text or the document in memory.
+The input is read in bounded chunks, wrapped greedily with the embedded
+font's cached glyph widths, and each page is written out as soon as it
+is full (see pdfwriter.py). Memory is bounded by one page of text.
+"""
+import os
+
+from django.conf import settings
+
+from .pdfwriter import StreamingPdfWriter, TrueTypeFont, pdf_number
+
+# Page sizes in points
+PAGE_SIZES = {"a4": (595.28, 841.89), "letter": (612, 792), "legal": (612, 1008)}
+MARGIN = 36
+LINE_SPACING = 1.25
+TAB_SIZE = 4
+# Characters read at a time; a longer line is wrapped across reads
+READ_CHARS = 64 * 1024
+
+# Tried in order when settings.TEXT_PDF_FONT is not set
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/TTF/DejaVuSansMono.ttf",
+    "/usr/share/fonts/truetype/DejaVuSansMono.ttf",
+    "/Library/Fonts/Courier New.ttf",
+    "C:/Windows/Fonts/consola.ttf",
+)
+
+
+def find_text_font():
+    for path in (settings.TEXT_PDF_FONT, *FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return path
+    # Latin-only, but always installed alongside ReportLab
+    import reportlab
+
+    return os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+
+
+def _clean(text):
+    # Drop control characters other than tab; fonts have no glyphs for them
+    if text.isprintable():
+        return text
+    return "".join(c for c in text.expandtabs(TAB_SIZE) if c.isprintable())
+
+
+class TextLayout:
+    """
+    Greedy line breaker: wrap(text) returns the complete lines and keeps
+    the unfinished last one so the next chunk can continue it.
+    """
+
+    def __init__(self, font, size, max_width):
+        self.font = font
+        self.size = size
+        # Widths are compared in 1/1000 em, as the font caches them
+        self.limit = max_width * 1000 / size
+
+    def wrap(self, text):
+        if len(text) * self.font.max_advance <= self.limit:
+            return [], text
+
+        advance = self.font.advance
+        lines = []
+        start = 0
+        width = 0.0
+        last_space = -1
+        for i, char in enumerate(text):
+            char_width = advance(char)
+            if width + char_width > self.limit and i > start:
+                # Break after the last space when there is one on this line
+                cut = last_space + 1 if last_space >= start else i
+                lines.append(text[start:cut])
+                start = cut
+                width = sum(advance(c) for c in text[start:i])
+                last_space = -1
+            width += char_width
+            if char == " ":
+                last_space = i
+        return lines, text[start:]
+
+
+def write_text_pdf(text_file, output_path, font_size=10, page_size="a4", progress=None):
+    """
+    Lay out the text stream ``text_file`` into output_path. progress is
+    called with the page count so far. Returns stats: pages, lines.
+    """
+    width, height = PAGE_SIZES[page_size]
+    leading = font_size * LINE_SPACING
+    lines_per_page = max(1, int((height - 2 * MARGIN) // leading))
+
+    with open(output_path, "wb") as out:
+        writer = StreamingPdfWriter(out)
+        font = TrueTypeFont(find_text_font(), writer)
+        layout = TextLayout(font, font_size, width - 2 * MARGIN)
+        resources = f"<< /Font << /F1 {font.ref} 0 R >> >>"
+        header = (
+            f"BT /F1 {pdf_number(font_size)} Tf {pdf_number(leading)} TL "
+            f"{MARGIN} {pdf_number(height - MARGIN - font_size)} Td\n"
+        )
+        page_lines = []
+        total_lines = 0
+
+        def emit(line):
+            nonlocal total_lines
+            page_lines.append(f"{font.encode(line)} Tj T*")
+            total_lines += 1
+            if len(page_lines) == lines_per_page:
+                flush()
+
+        def flush():
+            content = header + "\n".join(page_lines) + "\nET\n"
+            writer.add_page(width, height, content.encode("ascii"), resources)
+            page_lines.clear()
+            if progress is not None:
+                progress(len(writer.pages))
+
+        carry = ""
+        while True:
+            # readline with a limit: whole lines, but never more than READ_CHARS
+            chunk = text_file.readline(READ_CHARS)
+            if not chunk:
+                break
+            ended = chunk.endswith("\n")
+            lines, carry = layout.wrap(carry + _clean(chunk.rstrip("\r\n")))
+            for line in lines:
+                emit(line)
+            if ended:
+                emit(carry)
+                carry = ""
+        if carry:
+            emit(carry)
+
+        if page_lines or not writer.pages:
+            flush()
+        font.write(writer)
+        writer.close()
+
+    return {"pages": len(writer.pages), "lines": total_lines}
@@ -0,0 +1,203 @@
+"""
+Resumable chunked uploads. The client announces a file, PUTs fixed-size
+chunks in any order (each with its SHA-256), asks which ones arrived after
+a dropped connection, and completes the upload into a document handle.
+
+Chunks are written with pwrite straight into a preallocated file in the
+upload's directory under settings.UPLOADS_DIR (out of reach of the job
+download routes), so nothing is buffered beyond one read block and
+concurrent chunk requests don't need a lock. Arrival is tracked in a
+bitmap file with one byte per chunk. Uploads idle for UPLOAD_TTL are
+swept.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+from . import documents
+
+STATE_FILE = "upload.json"
+DATA_FILE = "upload.part"
+BITMAP_FILE = "chunks.bitmap"
+
+READ_BLOCK = 256 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+def _root():
+    return str(settings.UPLOADS_DIR)
+
+
+def _upload_dir(upload_id: str) -> str:
+    # upload_id comes from the URL and names a directory
+    if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+        raise KeyError(upload_id)
+    path = os.path.join(_root(), upload_id)
+    if not os.path.exists(os.path.join(path, STATE_FILE)):
+        raise KeyError(upload_id)
+    return path
+
+
+def sweep():
+    """
+    Drop uploads that have had no chunk (or were not even announced)
+    for settings.UPLOAD_TTL.
+    """
+    root = _root()
+    with open(os.path.join(root, ".sweep.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        now = time.time()
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    # Every chunk write touches the bitmap
+                    used = os.stat(os.path.join(entry.path, BITMAP_FILE)).st_mtime
+                except FileNotFoundError:
+                    used = entry.stat().st_mtime
+                if now - used > settings.UPLOAD_TTL:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _read_state(upload_dir: str) -> dict:
+    with open(os.path.join(upload_dir, STATE_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def init_upload(upload_id: str, name: str, size: int, chunk_size=None, sha256=None) -> dict:
+    if size <= 0:
+        raise UploadError("size must be positive")
+    # Completed uploads land in the document store, which has its own quota
+    if size > min(settings.UPLOAD_MAX_BYTES, settings.DOCUMENTS_MAX_BYTES):
+        raise UploadError("File is larger than the upload limit")
+    chunk_size = int(chunk_size or settings.UPLOAD_CHUNK_SIZE)
+    if not settings.UPLOAD_MIN_CHUNK_SIZE <= chunk_size <= settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(
+            f"chunk_size must be between {settings.UPLOAD_MIN_CHUNK_SIZE} and {settings.UPLOAD_MAX_CHUNK_SIZE}"
+        )
+
+    os.makedirs(_root(), exist_ok=True)
+    sweep()
+    upload_dir = os.path.join(_root(), upload_id)
+    os.makedirs(upload_dir)
+    total = -(-size // chunk_size)
+
+    # Sparse until written: no disk is used for chunks that haven't arrived
+    with open(os.path.join(upload_dir, DATA_FILE), "wb") as f:
+        f.truncate(size)
+    with open(os.path.join(upload_dir, BITMAP_FILE), "wb") as f:
+        f.write(bytes(total))
+
+    state = {
+        "uploadId": upload_id,
+        "name": os.path.basename(name) or "document.pdf",
+        "size": size,
+        "chunkSize": chunk_size,
+        "totalChunks": total,
+        "sha256": (sha256 or "").lower() or None,
+        "created": int(time.time()),
+    }
+    with open(os.path.join(upload_dir, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    return status(upload_id)
+
+
+def status(upload_id: str) -> dict:
+    upload_dir = _upload_dir(upload_id)
+    state = _read_state(upload_dir)
+    with open(os.path.join(upload_dir, BITMAP_FILE), "rb") as f:
+        bitmap = f.read()
+    received = [i for i, flag in enumerate(bitmap) if flag]
+    return {**state, "receivedChunks": received, "complete": len(received) == state["totalChunks"]}
+
+
+def write_chunk(upload_id: str, index: int, stream, expected_sha256: str) -> dict:
+    """
+    Copy one chunk from ``stream`` into place, hashing as it goes. The chunk
+    only counts as received when its length and checksum match; a bad or
+    interrupted chunk is simply sent again.
+    """
+    upload_dir = _upload_dir(upload_id)
+    state = _read_state(upload_dir)
+    if not 0 <= index < state["totalChunks"]:
+        raise UploadError("Chunk index out of range")
+
+    offset = index * state["chunkSize"]
+    length = min(state["chunkSize"], state["size"] - offset)
+    digest = hashlib.sha256()
+    written = 0
+
+    # A resent chunk no longer counts until it has been verified again
+    _mark(upload_dir, index, False)
+
+    fd = os.open(os.path.join(upload_dir, DATA_FILE), os.O_WRONLY)
+    try:
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            digest.update(block)
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+        if written < length or stream.read(1):
+            raise UploadError(f"Chunk {index} must be exactly {length} bytes")
+    finally:
+        os.close(fd)
+
+    if digest.hexdigest() != (expected_sha256 or "").lower():
+        raise ChecksumMismatch(f"Checksum mismatch for chunk {index}")
+
+    _mark(upload_dir, index, True)
+    return {"index": index, "received": True}
+
+
+def _mark(upload_dir: str, index: int, received: bool):
+    fd = os.open(os.path.join(upload_dir, BITMAP_FILE), os.O_WRONLY)
+    try:
+        os.pwrite(fd, b"\x01" if received else b"\x00", index)
+    finally:
+        os.close(fd)
+
+
+def complete(upload_id: str, password: str = "") -> dict:
+    """
+    Check every chunk arrived (and the whole-file SHA-256 when one was
+    announced), then hand the file to the document store. Returns the
+    document metadata with its docId.
+    """
+    current = status(upload_id)
+    if not current["complete"]:
+        missing = current["totalChunks"] - len(current["receivedChunks"])
+        raise UploadError(f"{missing} chunk(s) still missing")
+
+    upload_dir = _upload_dir(upload_id)
+    data_path = os.path.join(upload_dir, DATA_FILE)
+    if current["sha256"]:
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        if digest.hexdigest() != current["sha256"]:
+            raise ChecksumMismatch("Checksum mismatch for the assembled file")
+
+    # Same filesystem as the store, so this is a rename
+    meta = documents.register(data_path, current["name"], password)
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    return meta
+
+
+def abort(upload_id: str):
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
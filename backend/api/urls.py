@@ -16,8 +16,26 @@ urlpatterns = [
     path("image-to-pdf/", views.image_to_pdf, name="image_to_pdf"),
     path("auto-rename/", views.auto_rename_pdf, name="auto_rename_pdf"),
     path("reorder-pages/", views.reorder_pages, name="reorder_pages"),
+    path("batch/", views.batch_operation, name="batch_operation"),
+    path("pipeline/", views.pipeline, name="pipeline"),
     path("jobs/<str:job_id>/zip/", views.download_job_zip, name="download_job_zip"),
-    path("jobs/<str:job_id>/file/<str:filename>/", views.download_job_file, name="download_job_file"),
+    path("jobs/<str:job_id>/file/<path:filename>/", views.download_job_file, name="download_job_file"),
+    path("jobs/<str:job_id>/status/", views.job_status, name="job_status"),
+    path("jobs/<str:job_id>/result/", views.job_result, name="job_result"),
+    path("cache/stats/", views.cache_stats, name="cache_stats"),
+    path("documents/", views.upload_document, name="upload_document"),
+    path("documents/<str:doc_id>/", views.document_detail, name="document_detail"),
+    path("uploads/", views.start_upload, name="start_upload"),
+    path("uploads/<str:upload_id>/", views.upload_status, name="upload_status"),
+    path("uploads/<str:upload_id>/chunks/<int:index>/", views.upload_chunk, name="upload_chunk"),
+    path("uploads/<str:upload_id>/complete/", views.complete_upload, name="complete_upload"),
+    path("preview/", views.preview_document, name="preview_document"),
+    path("preview/<str:doc_id>/pages/<int:page>/thumb/", views.preview_thumbnail, name="preview_thumbnail"),
+    path(
+        "preview/<str:doc_id>/pages/<int:page>/tile/<int:level>/<int:col>/<int:row>/",
+        views.preview_tile,
+        name="preview_tile",
+    ),
 
     # View & Edit
     path("number-pages/", views.number_pages, name="number_pages"),
@@ -1,33 +1,44 @@
 import os
+import shutil
 import uuid
-import zipfile
 from io import BytesIO
 
-from django.conf import settings
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 import json
 
 from pypdf import PdfReader, PdfWriter
-import pdfplumber
-import pandas as pd
-from pptx import Presentation
-from pptx.util import Inches
-from fpdf import FPDF
 import subprocess
 try:
     import pytesseract
 except ImportError:
     pytesseract = None
-from reportlab.pdfgen import canvas
 from reportlab.lib import pagesizes
 from reportlab.lib import colors
 
+from . import documents, jobs, office, operations, preview, serving, uploads
+from .batch import BATCH_OPERATIONS, collect_inputs, run_batch
+from .cache import cached_result, result_cache
+from .documents import accepts_doc_id
+from .imagepdf import IMAGE_PAGE_SIZES
+from .inputs import open_fitz, open_pikepdf, spool_upload
+from .jobs import get_job_dir, wants_async
+from .split import iter_parts, plan_parts, write_parts
+from .streamzip import zip_response
+from .textpdf import PAGE_SIZES
 
-def get_job_dir(job_id: str) -> str:
-    job_dir = os.path.join(settings.MEDIA_ROOT, "jobs", job_id)
-    os.makedirs(job_dir, exist_ok=True)
-    return job_dir
+
+def submit_job(job_id: str, task: str, func, *args, **kwargs):
+    """
+    Queue a conversion on the job pool and answer 202 with the job status.
+    """
+    jobs.submit(job_id, task, func, *args, **kwargs)
+    job_dir = get_job_dir(job_id)
+    return JsonResponse(jobs.job_payload(job_id, jobs.read_status(job_dir)), status=202)
+
+
+def wants_incremental(request) -> bool:
+    return request.POST.get("incremental", "").lower() in ("1", "true", "yes")
 
 
 def parse_ranges(range_text: str, total_pages: int):
@@ -62,15 +73,26 @@ def parse_ranges(range_text: str, total_pages: int):
     return out
 
 
-def write_pdf_subset(reader: PdfReader, start_idx: int, end_idx: int, out_path: str):
-    writer = PdfWriter()
-    for i in range(start_idx, end_idx + 1):
-        writer.add_page(reader.pages[i])
-    with open(out_path, "wb") as f:
-        writer.write(f)
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(size_text: str) -> int:
+    """
+    Convert "10MB", "500 kb" or "1048576" into a byte count.
+    """
+    text = size_text.strip().upper().replace(" ", "")
+    number = text.rstrip("KMGB")
+    unit = text[len(number):]
+    if unit not in _SIZE_UNITS or not number:
+        raise ValueError(f"Invalid size: {size_text}")
+    size = int(float(number) * _SIZE_UNITS[unit])
+    if size <= 0:
+        raise ValueError(f"Invalid size: {size_text}")
+    return size
 
 
 @api_view(["POST"])
+@accepts_doc_id
 def split_prepare(request):
     """
     POST multipart:
@@ -79,6 +101,7 @@ def split_prepare(request):
       range: (if range)
       every: (if every)
       base_name: (optional)
+      output: json (default, parts saved to the job) | zip (stream parts as a ZIP)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -88,65 +111,44 @@ def split_prepare(request):
     range_text = request.POST.get("range", "")
     every = request.POST.get("every", "2")
     base_name = request.POST.get("base_name", "split").strip() or "split"
+    output = request.POST.get("output", "json")
 
     try:
-        reader = PdfReader(pdf_file)
-        total = len(reader.pages)
-        if total == 0:
-            return JsonResponse({"error": "PDF has 0 pages"}, status=400)
-
         job_id = str(uuid.uuid4())
         job_dir = get_job_dir(job_id)
+        input_path = spool_upload(pdf_file, job_dir)
 
-        results = []
-
-        if mode == "single":
-            # one PDF per page
-            for i in range(total):
-                out_name = f"{base_name}_page_{i+1}.pdf"
-                out_path = os.path.join(job_dir, out_name)
-                write_pdf_subset(reader, i, i, out_path)
-                results.append({
-                    "name": out_name,
-                    "size": os.path.getsize(out_path),
-                    "url": f"/api/jobs/{job_id}/file/{out_name}/",
-                })
-
-        elif mode == "every":
+        with open_fitz(input_path) as doc:
+            total = len(doc)
+        if total == 0:
+            return JsonResponse({"error": "PDF has 0 pages"}, status=400)
+
+        if mode == "every":
             n = int(every)
             if n <= 0:
                 return JsonResponse({"error": "Every must be >= 1"}, status=400)
-
-            chunk = 1
-            for start in range(0, total, n):
-                end = min(total - 1, start + n - 1)
-                out_name = f"{base_name}_part_{chunk}.pdf"
-                out_path = os.path.join(job_dir, out_name)
-                write_pdf_subset(reader, start, end, out_path)
-                results.append({
-                    "name": out_name,
-                    "size": os.path.getsize(out_path),
-                    "url": f"/api/jobs/{job_id}/file/{out_name}/",
-                })
-                chunk += 1
-
+            parts = plan_parts(mode, total, base_name, every=n)
+        elif mode == "single":
+            parts = plan_parts(mode, total, base_name)
         else:
-            # range mode
             ranges = parse_ranges(range_text, total)
             if not ranges:
                 return JsonResponse({"error": "Invalid or empty range"}, status=400)
+            parts = plan_parts(mode, total, base_name, ranges=ranges)
+
+        if output == "zip":
+            return zip_response(iter_parts(input_path, parts), f"{base_name}.zip")
+
+        paths = write_parts(input_path, job_dir, parts)
+        names = [os.path.basename(p) for p in paths]
+        # Record the parts so the job ZIP contains exactly these files
+        jobs.write_status(job_dir, {"jobId": job_id, "task": "split", "state": jobs.DONE, "outputs": names})
 
-            part = 1
-            for (s, e) in ranges:
-                out_name = f"{base_name}_range_{part}.pdf"
-                out_path = os.path.join(job_dir, out_name)
-                write_pdf_subset(reader, s, e, out_path)
-                results.append({
-                    "name": out_name,
-                    "size": os.path.getsize(out_path),
-                    "url": f"/api/jobs/{job_id}/file/{out_name}/",
-                })
-                part += 1
+        results = [{
+            "name": name,
+            "size": os.path.getsize(path),
+            "url": jobs.job_file_url(job_id, name),
+        } for name, path in zip(names, paths)]
 
         return JsonResponse({
             "jobId": job_id,
@@ -160,60 +162,356 @@ def split_prepare(request):
 
 @api_view(["GET"])
 def download_job_file(request, job_id, filename):
-    job_dir = get_job_dir(job_id)
-    safe = os.path.basename(filename)
-    abs_path = os.path.join(job_dir, safe)
-    if not os.path.exists(abs_path):
+    """
+    Supports Range/If-Range (resumed downloads, PDF viewers), and
+    If-None-Match/If-Modified-Since; see api/serving.py.
+    """
+    job_dir = jobs.find_job_dir(job_id)
+    if job_dir is None:
+        raise Http404("Job not found")
+    # Outputs may sit in a subdirectory of the job (batch writes to outputs/)
+    relative = os.path.normpath(filename)
+    if os.path.isabs(relative) or relative.split(os.sep)[0] == os.pardir:
+        raise Http404("File not found")
+    abs_path = os.path.join(job_dir, relative)
+    if not os.path.isfile(abs_path):
         raise Http404("File not found")
 
-    return FileResponse(open(abs_path, "rb"), as_attachment=True, filename=safe)
+    return serving.serve_file(request, abs_path, os.path.basename(relative))
 
 
 @api_view(["GET"])
 def download_job_zip(request, job_id):
-    job_dir = get_job_dir(job_id)
-    if not os.path.isdir(job_dir):
+    job_dir = jobs.find_job_dir(job_id)
+    if job_dir is None:
         raise Http404("Job not found")
 
-    pdfs = sorted([f for f in os.listdir(job_dir) if f.lower().endswith(".pdf")])
-    if not pdfs:
-        return JsonResponse({"error": "No PDFs in this job"}, status=404)
+    status = jobs.read_status(job_dir)
+    if status is not None:
+        # Queued conversion job: zip exactly what the job produced
+        names = status.get("outputs", [])
+        zip_name = f"{job_id}_{status.get('task')}.zip"
+    else:
+        names = sorted([f for f in os.listdir(job_dir) if f.lower().endswith(".pdf")])
+        zip_name = f"{job_id}_split.zip"
+    if not names:
+        return JsonResponse({"error": "No files in this job"}, status=404)
+
+    members = ((os.path.basename(fn), os.path.join(job_dir, fn)) for fn in names)
+    return zip_response(members, zip_name)
+
+
+@api_view(["GET"])
+def job_status(request, job_id):
+    job_dir = jobs.find_job_dir(job_id)
+    status = jobs.read_status(job_dir) if job_dir is not None else None
+    if status is None:
+        raise Http404("Job not found")
+
+    return JsonResponse(jobs.job_payload(job_id, status))
+
+
+@api_view(["GET"])
+def job_result(request, job_id):
+    """
+    Download the job output once it is done. Jobs with several outputs
+    (e.g. pdf-to-image) are served as a ZIP.
+    """
+    job_dir = jobs.find_job_dir(job_id)
+    status = jobs.read_status(job_dir) if job_dir is not None else None
+    if status is None:
+        raise Http404("Job not found")
+
+    if status["state"] == jobs.FAILED:
+        return JsonResponse({"error": status.get("error") or "Job failed"}, status=500)
+    if status["state"] != jobs.DONE:
+        return JsonResponse(jobs.job_payload(job_id, status), status=202)
+
+    outputs = status.get("outputs", [])
+    if len(outputs) == 1:
+        return download_job_file(request._request, job_id, outputs[0])
+    return download_job_zip(request._request, job_id)
+
 
-    mem = BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fn in pdfs:
-            zf.write(os.path.join(job_dir, fn), arcname=fn)
+@api_view(["GET"])
+def cache_stats(request):
+    return JsonResponse(result_cache.stats())
+
+
+@api_view(["POST"])
+def upload_document(request):
+    """
+    POST multipart:
+      file: PDF
+      password: needed to read page sizes/summary of an encrypted PDF (optional)
+    Stores the document once; pass the returned docId as doc_id (or in
+    doc_ids) to any tool instead of uploading the file again.
+    """
+    if "file" not in request.FILES:
+        return JsonResponse({"error": "No file uploaded"}, status=400)
+
+    try:
+        meta = documents.register_upload(request.FILES["file"], request.POST.get("password", ""))
+    except documents.QuotaExceeded as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse(meta, status=201)
+
+
+@api_view(["GET", "DELETE"])
+def document_detail(request, doc_id):
+    if request.method == "DELETE":
+        if not documents.delete(doc_id):
+            raise Http404("Unknown document")
+        return HttpResponse(status=204)
+
+    found = documents.get(doc_id)
+    if found is None:
+        raise Http404("Unknown or expired document")
+    return JsonResponse(found[1])
 
-    mem.seek(0)
-    return FileResponse(mem, as_attachment=True, filename=f"{job_id}_split.zip")
+
+@api_view(["POST"])
+def start_upload(request):
+    """
+    POST multipart/form:
+      name: file name
+      size: total bytes
+      chunk_size: bytes per chunk (optional, default settings.UPLOAD_CHUNK_SIZE)
+      sha256: hex digest of the whole file, checked on complete (optional)
+    Then PUT each chunk to chunks/<index>/ with an X-Chunk-Sha256 header,
+    and POST complete/ to turn the upload into a document handle.
+    """
+    try:
+        size = int(request.POST.get("size", 0))
+        chunk_size = request.POST.get("chunk_size") or None
+        state = uploads.init_upload(
+            uuid.uuid4().hex, request.POST.get("name", ""), size, chunk_size, request.POST.get("sha256")
+        )
+    except (ValueError, uploads.UploadError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(state, status=201)
+
+
+@api_view(["GET", "DELETE"])
+def upload_status(request, upload_id):
+    try:
+        if request.method == "DELETE":
+            uploads.abort(upload_id)
+            return HttpResponse(status=204)
+        return JsonResponse(uploads.status(upload_id))
+    except KeyError:
+        raise Http404("Unknown upload")
+
+
+@api_view(["PUT"])
+def upload_chunk(request, upload_id, index):
+    """
+    PUT raw chunk bytes (application/octet-stream)
+      X-Chunk-Sha256: hex digest of the chunk
+    """
+    checksum = request.headers.get("X-Chunk-Sha256")
+    if not checksum:
+        return JsonResponse({"error": "X-Chunk-Sha256 header required"}, status=400)
+
+    # Read straight from the socket; Django's upload handlers never see it
+    stream = request.stream or BytesIO()
+    try:
+        return JsonResponse(uploads.write_chunk(upload_id, index, stream, checksum))
+    except KeyError:
+        raise Http404("Unknown upload")
+    except uploads.ChecksumMismatch as e:
+        return JsonResponse({"error": str(e)}, status=422)
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+@api_view(["POST"])
+def complete_upload(request, upload_id):
+    """
+    POST form:
+      password: for the document metadata of an encrypted PDF (optional)
+    Returns the document handle (docId, page count, ...).
+    """
+    try:
+        meta = uploads.complete(upload_id, request.POST.get("password", ""))
+    except KeyError:
+        raise Http404("Unknown upload")
+    except uploads.ChecksumMismatch as e:
+        return JsonResponse({"error": str(e)}, status=422)
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    except documents.QuotaExceeded as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse(meta, status=201)
+
+
+@api_view(["POST"])
+@accepts_doc_id
+def preview_document(request):
+    """
+    POST multipart:
+      file: PDF (or doc_id of a stored document)
+    Stores the document (see /api/documents/) and returns its metadata,
+    hash and the thumbnail/tile URL templates.
+    """
+    if "file" not in request.FILES:
+        return JsonResponse({"error": "No file uploaded"}, status=400)
+
+    uploaded = request.FILES["file"]
+    try:
+        if isinstance(uploaded, documents.StoredDocument):
+            # Came as a doc_id: already stored and hashed
+            meta = uploaded.meta
+        else:
+            meta = documents.register_upload(uploaded)
+    except documents.QuotaExceeded as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    base = f"/api/preview/{meta['docId']}/pages/{{page}}"
+    return JsonResponse({
+        "hash": meta["sha256"],
+        **meta,
+        "thumbnailUrl": base + "/thumb/",
+        "tileUrl": base + "/tile/{level}/{col}/{row}/",
+        "tileSize": preview.TILE_SIZE,
+        "maxLevel": preview.MAX_TILE_LEVEL,
+    })
+
+
+def _preview_response(request, doc_id, page, render):
+    """
+    Check the page exists, then serve the image render(document, fmt)
+    returns (rendered or cached). The URL fully determines the content, so
+    browsers may keep it forever.
+    """
+    # Not "format": DRF reserves that query parameter for content negotiation
+    fmt = request.GET.get("type", "png").lower()
+    if fmt not in preview.PREVIEW_FORMATS:
+        return JsonResponse({"error": "type must be png or jpeg"}, status=400)
+
+    document = documents.get(doc_id)
+    if document is None:
+        raise Http404("Unknown or expired document, upload it to /api/preview/ again")
+    if not 1 <= page <= (document[1]["pageCount"] or 0):
+        return JsonResponse({"error": "Invalid page number"}, status=400)
+
+    try:
+        path, etag = render(document, fmt)
+    except IndexError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    etag = f'"{etag}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = FileResponse(open(path, "rb"), content_type=preview.PREVIEW_FORMATS[fmt])
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@api_view(["GET"])
+def preview_thumbnail(request, doc_id, page):
+    """
+    GET ?scale=0.25 (fraction of 72 DPI, 0.05-1) &type=png|jpeg
+    """
+    try:
+        scale = float(request.GET.get("scale", 0.25))
+    except ValueError:
+        return JsonResponse({"error": "scale must be a number"}, status=400)
+    return _preview_response(
+        request, doc_id, page, lambda document, fmt: preview.thumbnail(document, page, scale, fmt)
+    )
+
+
+@api_view(["GET"])
+def preview_tile(request, doc_id, page, level, col, row):
+    """
+    GET ?type=png|jpeg
+    Tile col/row of the page rendered at 2**level x 72 DPI.
+    """
+    if level > preview.MAX_TILE_LEVEL:
+        return JsonResponse({"error": f"level must be 0-{preview.MAX_TILE_LEVEL}"}, status=400)
+    return _preview_response(
+        request, doc_id, page, lambda document, fmt: preview.tile(document, page, level, col, row, fmt)
+    )
 
 
 # --- New Features ---
 
 from .services import compress_pdf as service_compress_pdf
+from .services import (
+    IMAGE_FORMATS,
+    SLIDE_MODES,
+    TEXT_ENGINES,
+    compress_pdf_to_size,
+    convert_images_to_pdf,
+    convert_pdf_to_excel,
+    convert_pdf_to_ppt,
+    convert_pdf_to_word,
+    convert_text_to_pdf,
+    iter_pdf_images,
+    iter_pdf_text,
+    ocr_pdf_file,
+    render_pdf_images,
+)
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("compress", ("level", "max_bytes"))
 def compress_pdf_view(request):
     """
     POST multipart:
       file: PDF
       level: recommended|extreme|strong
+      max_bytes: optional target size ("10MB", "800KB", bytes); picks the
+                 least lossy level that fits and ignores level
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
     
     pdf_file = request.FILES["file"]
     level = request.POST.get("level", "recommended")
+    max_bytes = None
+    if request.POST.get("max_bytes"):
+        try:
+            max_bytes = parse_size(request.POST["max_bytes"])
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    job_dir = get_job_dir(str(uuid.uuid4()))
     
     try:
+        input_path = spool_upload(pdf_file, job_dir)
+        output_path = os.path.join(job_dir, "compressed.pdf")
+        progress = jobs.Progress()
         # Use service logic
-        out_buffer, filename = service_compress_pdf(pdf_file, level)
-        return FileResponse(out_buffer, as_attachment=True, filename=filename)
+        if max_bytes:
+            compress_pdf_to_size(input_path, max_bytes, output_path, progress=progress)
+            out_file, filename = open(output_path, "rb"), "compressed.pdf"
+        else:
+            out_file, filename = service_compress_pdf(input_path, level, output_path=output_path, progress=progress)
+        response = FileResponse(out_file, as_attachment=True, filename=filename)
+        response["X-Compression-Stats"] = json.dumps(progress.stats.get("images", {}))
+        if max_bytes:
+            budget = progress.stats["budget"]
+            response["X-Compression-Level"] = budget["level"]
+            response["X-Compression-Target-Met"] = "true" if budget["targetMet"] else "false"
+            response["X-Compression-Budget"] = json.dumps(budget)
+        return response
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @api_view(["POST"])
+@accepts_doc_id
 def merge_pdfs(request):
     """
     POST multipart:
@@ -242,11 +540,14 @@ def merge_pdfs(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("rotate", ("angle", "incremental"))
 def rotate_pdf(request):
     """
     POST multipart:
       file: PDF
       angle: 90|180|270
+      incremental: 1 to append the change instead of rewriting the file (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -255,14 +556,18 @@ def rotate_pdf(request):
     angle = int(request.POST.get("angle", 90))
     
     try:
-        reader = PdfReader(pdf_file)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            page.rotate(angle)
-            writer.add_page(page)
-            
-        out = BytesIO()
+        if wants_incremental(request):
+            job_dir = get_job_dir(str(uuid.uuid4()))
+            writer = operations.open_incremental_writer(spool_upload(pdf_file, job_dir))
+        else:
+            writer = operations.open_writer(pdf_file)
+        operations.rotate(writer, angle)
+
+        if wants_incremental(request):
+            # Output is the original bytes plus the update; keep it on disk
+            out = open(os.path.join(job_dir, "rotated.pdf"), "w+b")
+        else:
+            out = BytesIO()
         writer.write(out)
         out.seek(0)
         return FileResponse(out, as_attachment=True, filename="rotated.pdf")
@@ -271,6 +576,8 @@ def rotate_pdf(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("delete_pages", ("pages",))
 def delete_pages(request):
     """
     POST multipart:
@@ -314,6 +621,8 @@ def delete_pages(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("extract_pages", ("pages",))
 def extract_pages(request):
     """
     POST multipart:
@@ -346,6 +655,7 @@ def extract_pages(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
 def protect_pdf(request):
     """
     POST multipart:
@@ -359,12 +669,12 @@ def protect_pdf(request):
     pdf_file = request.FILES["file"]
     password = request.POST.get("password", "")
     permissions_arg = request.POST.get("permissions", "")
+    job_dir = get_job_dir(str(uuid.uuid4()))
 
     try:
         import pikepdf
 
-        pdf_bytes = pdf_file.read()
-        pdf = pikepdf.open(BytesIO(pdf_bytes))
+        pdf = open_pikepdf(spool_upload(pdf_file, job_dir))
 
         # Build permissions object
         perms = [p.strip() for p in permissions_arg.split(",") if p.strip()]
@@ -379,25 +689,26 @@ def protect_pdf(request):
             accessibility=True,
         )
 
-        out = BytesIO()
+        output_path = os.path.join(job_dir, "protected.pdf")
         # Use same password for user and owner if only one provided
         owner_pass = password if password else "owner_default_123"
         pdf.save(
-            out,
+            output_path,
             encryption=pikepdf.Encryption(
                 user=password,
                 owner=owner_pass,
                 allow=allow,
             )
         )
-        out.seek(0)
-        return FileResponse(out, as_attachment=True, filename="protected.pdf")
+        pdf.close()
+        return FileResponse(open(output_path, "rb"), as_attachment=True, filename="protected.pdf")
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 
 @api_view(["POST"])
+@accepts_doc_id
 def unlock_pdf(request):
     """
     POST multipart:
@@ -411,13 +722,7 @@ def unlock_pdf(request):
     password = request.POST.get("password", "")
     
     try:
-        reader = PdfReader(pdf_file)
-        if reader.is_encrypted:
-            reader.decrypt(password)
-        
-        writer = PdfWriter()
-        for page in reader.pages:
-            writer.add_page(page)
+        writer = operations.open_writer(pdf_file, password)
             
         out = BytesIO()
         writer.write(out)
@@ -428,6 +733,8 @@ def unlock_pdf(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("flatten")
 def flatten_pdf(request):
     """
     POST multipart:
@@ -438,12 +745,10 @@ def flatten_pdf(request):
         return JsonResponse({"error": "No file uploaded"}, status=400)
     
     pdf_file = request.FILES["file"]
+    job_dir = get_job_dir(str(uuid.uuid4()))
     
     try:
-        import fitz  # PyMuPDF
-
-        pdf_bytes = pdf_file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        doc = open_fitz(spool_upload(pdf_file, job_dir))
 
         # Flatten form fields (widgets) at document level
         try:
@@ -462,21 +767,23 @@ def flatten_pdf(request):
             except Exception:
                 pass
 
-        out = BytesIO()
-        doc.save(out)
-        out.seek(0)
-        return FileResponse(out, as_attachment=True, filename="flattened.pdf")
+        output_path = os.path.join(job_dir, "flattened.pdf")
+        doc.save(output_path)
+        doc.close()
+        return FileResponse(open(output_path, "rb"), as_attachment=True, filename="flattened.pdf")
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-from pdf2docx import Converter
-import img2pdf
-
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("pdf_to_word", ("pages", "start", "end"))
 def pdf_to_word(request):
     """
     POST multipart:
       file: PDF
+      pages: "1-3,5" (optional, default all pages)
+      start / end: first and last page, 1-based (optional, ignored with pages)
+      async: 1 to queue the conversion and get a jobId back (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -485,18 +792,27 @@ def pdf_to_word(request):
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
     
-    input_path = os.path.join(job_dir, "input.pdf")
     output_path = os.path.join(job_dir, "converted.docx")
     
     try:
-        # Save temp file
-        with open(input_path, "wb") as f:
-            for chunk in pdf_file.chunks():
-                f.write(chunk)
-        
-        cv = Converter(input_path)
-        cv.convert(output_path, start=0, end=None)
-        cv.close()
+        input_path = spool_upload(pdf_file, job_dir)
+
+        pages = None
+        page_range = request.POST.get("pages", "").strip()
+        start, end = request.POST.get("start", "").strip(), request.POST.get("end", "").strip()
+        if page_range or start or end:
+            doc = open_fitz(input_path)
+            total = len(doc)
+            doc.close()
+            page_range = page_range or f"{start or 1}-{end or total}"
+            pages = [i for s, e in parse_ranges(page_range, total) for i in range(s, e + 1)]
+            if not pages:
+                return JsonResponse({"error": "No valid pages selected"}, status=400)
+
+        if wants_async(request):
+            return submit_job(job_id, "pdf_to_word", convert_pdf_to_word, input_path, output_path, pages=pages)
+
+        convert_pdf_to_word(input_path, output_path, pages=pages)
         
         return FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.docx")
     except Exception as e:
@@ -504,44 +820,61 @@ def pdf_to_word(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("pdf_to_image", ("dpi", "format", "quality", "pages", "grayscale", "alpha"))
 def pdf_to_image(request):
     """
     POST multipart:
       file: PDF
+      dpi: 10-600 (default 150)
+      format: png|jpeg|webp (default png)
+      quality: 1-100 for jpeg/webp (default 85)
+      pages: "1-3,5" (optional, default all pages)
+      grayscale: 1 for grayscale images (optional)
+      alpha: 1 for a transparent background, png/webp only (optional)
+      async: 1 to queue the render and get a jobId back (optional)
     Returns ZIP of images
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
     
     pdf_file = request.FILES["file"]
+    fmt = request.POST.get("format", "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in IMAGE_FORMATS:
+        return JsonResponse({"error": "format must be png, jpeg or webp"}, status=400)
+    try:
+        dpi = int(request.POST.get("dpi", 150))
+        quality = int(request.POST.get("quality", 85))
+    except ValueError:
+        return JsonResponse({"error": "dpi and quality must be integers"}, status=400)
+    if not 10 <= dpi <= 600 or not 1 <= quality <= 100:
+        return JsonResponse({"error": "dpi must be 10-600 and quality 1-100"}, status=400)
+    flags = {name: request.POST.get(name, "").lower() in ("1", "true", "yes") for name in ("grayscale", "alpha")}
+
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
     
     try:
-        import fitz  # PyMuPDF
-        
-        # Read from memory
-        pdf_bytes = pdf_file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        image_files = []
-        for i in range(len(doc)):
-            page = doc.load_page(i)
-            # Render high quality
-            pix = page.get_pixmap(dpi=150)
-            img_name = f"page_{i+1}.png"
-            img_path = os.path.join(job_dir, img_name)
-            pix.save(img_path)
-            image_files.append(img_name)
-            
-        # Zip them
-        mem = BytesIO()
-        with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
-            for fn in image_files:
-                zf.write(os.path.join(job_dir, fn), arcname=fn)
-        
-        mem.seek(0)
-        return FileResponse(mem, as_attachment=True, filename="pdf_images.zip")
+        input_path = spool_upload(pdf_file, job_dir)
+
+        pages = None
+        if request.POST.get("pages", "").strip():
+            doc = open_fitz(input_path)
+            total = len(doc)
+            doc.close()
+            pages = [i for s, e in parse_ranges(request.POST["pages"], total) for i in range(s, e + 1)]
+            if not pages:
+                return JsonResponse({"error": "No valid pages selected"}, status=400)
+
+        options = dict(dpi=dpi, fmt=fmt, quality=quality, pages=pages, **flags)
+
+        if wants_async(request):
+            return submit_job(job_id, "pdf_to_image", render_pdf_images, input_path, job_dir, **options)
+
+        # Pages are rendered as the ZIP is streamed; images are stored as-is
+        return zip_response(iter_pdf_images(input_path, **options), "pdf_images.zip")
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -550,7 +883,11 @@ def pdf_to_image(request):
 def image_to_pdf(request):
     """
     POST multipart:
-      files: list of images
+      files: list of images (JPEG, PNG, WebP, TIFF, ...; HEIC when pillow-heif
+             is installed); multi-frame TIFF/GIF give a page per frame
+      page_size: image|a4|letter|legal (default image: each page fits its image)
+      max_dpi: downscale images placed above this resolution (optional)
+      async: 1 to queue the conversion and get a jobId back (optional)
     """
     if "files" not in request.FILES:
         return JsonResponse({"error": "No files uploaded"}, status=400)
@@ -558,22 +895,45 @@ def image_to_pdf(request):
     files = request.FILES.getlist("files")
     if not files:
         return JsonResponse({"error": "No image files found"}, status=400)
+
+    page_size = request.POST.get("page_size", "image").lower()
+    if page_size not in IMAGE_PAGE_SIZES:
+        return JsonResponse({"error": "page_size must be image, a4, letter or legal"}, status=400)
+    max_dpi = None
+    if request.POST.get("max_dpi"):
+        try:
+            max_dpi = int(request.POST["max_dpi"])
+        except ValueError:
+            return JsonResponse({"error": "max_dpi must be an integer"}, status=400)
+        if not 36 <= max_dpi <= 1200:
+            return JsonResponse({"error": "max_dpi must be 36-1200"}, status=400)
+
+    job_id = str(uuid.uuid4())
+    job_dir = get_job_dir(job_id)
+    output_path = os.path.join(job_dir, "images.pdf")
     
     try:
-        # img2pdf requires files or bytes
-        # We'll read all into a list of bytes
-        images_bytes = []
-        for f in files:
-            f.seek(0)
-            images_bytes.append(f.read())
-            
-        pdf_bytes = img2pdf.convert(images_bytes)
-        
-        return FileResponse(BytesIO(pdf_bytes), as_attachment=True, filename="images.pdf")
+        # Each upload goes to disk; only one image is decoded at a time
+        image_paths = [
+            spool_upload(f, job_dir, f"image_{i:04d}{os.path.splitext(f.name)[1].lower()}")
+            for i, f in enumerate(files)
+        ]
+        options = dict(page_size=page_size, max_dpi=max_dpi)
+
+        if wants_async(request):
+            return submit_job(job_id, "image_to_pdf", convert_images_to_pdf, image_paths, output_path, **options)
+
+        progress = jobs.Progress()
+        convert_images_to_pdf(image_paths, output_path, progress=progress, **options)
+
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="images.pdf")
+        response["X-Image-Stats"] = json.dumps(progress.stats.get("images", {}))
+        return response
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @api_view(["POST"])
+@accepts_doc_id
 def auto_rename_pdf(request):
     """
     POST multipart:
@@ -620,6 +980,8 @@ def auto_rename_pdf(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("reorder_pages", ("order",))
 def reorder_pages(request):
     """
     POST multipart:
@@ -665,9 +1027,97 @@ def reorder_pages(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@api_view(["POST"])
+@accepts_doc_id
+def batch_operation(request):
+    """
+    POST multipart:
+      files: list of PDFs and/or
+      archive: ZIP of PDFs
+      operation: compress|rotate|unlock|number_pages|watermark
+      params: JSON object with the tool's fields, e.g. {"angle": 90}
+    Always queued as a job: poll statusUrl for per-file results, then
+    download everything from zipUrl.
+    """
+    files = request.FILES.getlist("files")
+    archive = request.FILES.get("archive")
+    if not files and archive is None:
+        return JsonResponse({"error": "No files uploaded"}, status=400)
+
+    op = request.POST.get("operation", "")
+    if op not in BATCH_OPERATIONS:
+        return JsonResponse({"error": f"Unsupported operation: {op}"}, status=400)
+
+    try:
+        params = json.loads(request.POST.get("params", "{}") or "{}")
+    except ValueError:
+        return JsonResponse({"error": "params must be a JSON object"}, status=400)
+
+    try:
+        job_id = str(uuid.uuid4())
+        job_dir = get_job_dir(job_id)
+        input_paths = collect_inputs(files, archive, os.path.join(job_dir, "inputs"))
+        if not input_paths:
+            return JsonResponse({"error": "No PDF files found"}, status=400)
+
+        return submit_job(job_id, f"batch_{op}", run_batch, input_paths, os.path.join(job_dir, "outputs"), op, params)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(["POST"])
+@accepts_doc_id
+def pipeline(request):
+    """
+    POST multipart:
+      file: PDF
+      steps: JSON list run in order, e.g.
+        [{"op": "unlock", "password": "x"}, {"op": "rotate", "angle": 90},
+         {"op": "number_pages", "style": "Page 1"}, {"op": "watermark", "text": "DRAFT"},
+         {"op": "compress", "level": "strong"}]
+      async: 1 to queue the pipeline and get a jobId back (optional)
+    The document is parsed once and saved once; per-step timings come back
+    in X-Pipeline-Timings (or the job stats).
+    """
+    if "file" not in request.FILES:
+        return JsonResponse({"error": "No file uploaded"}, status=400)
+
+    try:
+        steps = json.loads(request.POST.get("steps", "[]") or "[]")
+    except ValueError:
+        return JsonResponse({"error": "steps must be a JSON list"}, status=400)
+    try:
+        operations.validate_steps(steps)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    pdf_file = request.FILES["file"]
+    job_id = str(uuid.uuid4())
+    job_dir = get_job_dir(job_id)
+    output_path = os.path.join(job_dir, "processed.pdf")
+
+    try:
+        input_path = spool_upload(pdf_file, job_dir)
+
+        if wants_async(request):
+            return submit_job(job_id, "pipeline", operations.run_pipeline, input_path, output_path, steps)
+
+        progress = jobs.Progress()
+        operations.run_pipeline(input_path, output_path, steps, progress=progress)
+
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="processed.pdf")
+        response["X-Pipeline-Timings"] = json.dumps(progress.stats["steps"])
+        return response
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
 # --- View & Edit Features ---
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("number_pages", ("position", "style"))
 def number_pages(request):
     """
     POST multipart:
@@ -683,58 +1133,8 @@ def number_pages(request):
     style = request.POST.get("style", "1")
     
     try:
-        reader = PdfReader(pdf_file)
-        writer = PdfWriter()
-        total_pages = len(reader.pages)
-        
-        for i, page in enumerate(reader.pages):
-            # Create a PDF with just the number
-            packet = BytesIO()
-            
-            # Get page size in points (1/72 inch)
-            width = float(page.mediabox.width)
-            height = float(page.mediabox.height)
-            
-            c = canvas.Canvas(packet, pagesize=(width, height))
-            
-            # Determine text
-            page_num = i + 1
-            if style == "Page 1 of N":
-                text = f"Page {page_num} of {total_pages}"
-            elif style == "Page 1":
-                text = f"Page {page_num}"
-            else:
-                text = f"{page_num}"
-            
-            c.setFont("Helvetica", 12)
-            
-            # Position logic (margin 20pts approx 7mm)
-            margin = 20
-            text_width = c.stringWidth(text, "Helvetica", 12)
-            
-            if "bottom" in position:
-                y = margin
-            elif "top" in position:
-                y = height - margin - 10 # adjust for font height
-            else:
-                y = margin
-                
-            if "left" in position:
-                x = margin
-            elif "right" in position:
-                x = width - margin - text_width
-            else: # center
-                x = (width - text_width) / 2
-            
-            c.drawString(x, y, text)
-            c.save()
-            
-            packet.seek(0)
-            number_pdf = PdfReader(packet)
-            
-            # Merge
-            page.merge_page(number_pdf.pages[0])
-            writer.add_page(page)
+        writer = operations.open_writer(pdf_file)
+        operations.number_pages(writer, position, style)
             
         out = BytesIO()
         writer.write(out)
@@ -745,6 +1145,8 @@ def number_pages(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("crop", ("box",))
 def crop_pdf(request):
     """
     POST multipart:
@@ -792,6 +1194,8 @@ def crop_pdf(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("watermark", ("text",))
 def watermark_pdf(request):
     """
     POST multipart:
@@ -809,38 +1213,8 @@ def watermark_pdf(request):
     watermark_image = request.FILES.get("image")
     
     try:
-        reader = PdfReader(pdf_file)
-        writer = PdfWriter()
-        
-        # Create watermark PDF
-        
-        for page in reader.pages:
-            width = float(page.mediabox.width)
-            height = float(page.mediabox.height)
-            
-            packet = BytesIO()
-            c = canvas.Canvas(packet, pagesize=(width, height))
-            
-            # Draw watermark
-            if watermark_text:
-                c.setFont("Helvetica-Bold", 48)
-                c.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.3)
-                c.saveState()
-                c.translate(width/2, height/2)
-                c.rotate(45)
-                c.drawCentredString(0, 0, watermark_text)
-                c.restoreState()
-            elif watermark_image:
-                 # TODO: Implement image watermark using c.drawImage
-                 pass
-                 
-            c.save()
-            packet.seek(0)
-            overlay = PdfReader(packet)
-            if len(overlay.pages) > 0:
-                page.merge_page(overlay.pages[0])
-            
-            writer.add_page(page)
+        writer = operations.open_writer(pdf_file)
+        operations.watermark(writer, watermark_text, watermark_image.read() if watermark_image else None)
             
         out = BytesIO()
         writer.write(out)
@@ -851,11 +1225,14 @@ def watermark_pdf(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("form_fill", ("fields", "incremental"))
 def form_fill(request):
     """
     POST multipart:
       file: PDF
       fields: json string { "field_name": "value" }
+      incremental: 1 to append the filled values instead of rewriting the file (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -865,21 +1242,19 @@ def form_fill(request):
     
     try:
         fields = json.loads(fields_str)
-        reader = PdfReader(pdf_file)
-        writer = PdfWriter()
-        
-        # Copy pages and update fields
-        writer.append_pages_from_reader(reader)
-        writer.update_page_form_field_values(
-            writer.pages[0], fields
-        )
-        
-        # For multiple pages, we might need to iterate.
-        # simple update_page_form_field_values might only work if we used clone_reader_document_root or similar.
-        # Actually pypdf's form filling is bit complex. 
-        # But let's try the standard way.
-        
-        out = BytesIO()
+
+        if wants_incremental(request):
+            # Only the changed field objects are written after the original
+            # bytes, which also keeps existing signatures valid
+            job_dir = get_job_dir(str(uuid.uuid4()))
+            writer = operations.open_incremental_writer(spool_upload(pdf_file, job_dir))
+            out = open(os.path.join(job_dir, "filled.pdf"), "w+b")
+        else:
+            # Cloning keeps the document's /AcroForm, which the fields live in
+            writer = PdfWriter(clone_from=PdfReader(pdf_file))
+            out = BytesIO()
+        operations.fill_fields(writer, fields)
+
         writer.write(out)
         out.seek(0)
         return FileResponse(out, as_attachment=True, filename="filled.pdf")
@@ -888,10 +1263,14 @@ def form_fill(request):
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("pdf_to_excel")
 def pdf_to_excel(request):
     """
     POST multipart:
       file: PDF
+      async: 1 to queue the conversion and get a jobId back (optional)
+    Each table found becomes its own sheet ("Page 3 Table 1", ...).
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -900,185 +1279,197 @@ def pdf_to_excel(request):
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
     
-    input_path = os.path.join(job_dir, "input.pdf")
     output_path = os.path.join(job_dir, "converted.xlsx")
     
     try:
-        with open(input_path, "wb") as f:
-            for chunk in pdf_file.chunks():
-                f.write(chunk)
-                
-        # Basic extraction: extract tables from each page
-        with pdfplumber.open(input_path) as pdf:
-            all_tables = []
-            for page in pdf.pages:
-                tables = page.extract_tables()
-                for table in tables:
-                    df = pd.DataFrame(table)
-                    all_tables.append(df)
-            
-            if not all_tables:
-                 pd.DataFrame(["No tables found"]).to_excel(output_path, index=False, header=False)
-            else:
-                final_df = pd.concat(all_tables, ignore_index=True)
-                final_df.to_excel(output_path, index=False, header=False)
+        input_path = spool_upload(pdf_file, job_dir)
 
-        return FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.xlsx")
+        if wants_async(request):
+            return submit_job(job_id, "pdf_to_excel", convert_pdf_to_excel, input_path, output_path)
+
+        progress = jobs.Progress()
+        convert_pdf_to_excel(input_path, output_path, progress=progress)
+
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.xlsx")
+        response["X-Table-Stats"] = json.dumps(progress.stats.get("tables", {}))
+        return response
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("pdf_to_ppt", ("mode", "dpi"))
 def pdf_to_ppt(request):
     """
     POST multipart:
       file: PDF
+      mode: image|text (default image; text gives editable text boxes)
+      dpi: 36-300 for image mode (default 150)
+      async: 1 to queue the conversion and get a jobId back (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
 
+    mode = request.POST.get("mode", "image").lower()
+    if mode not in SLIDE_MODES:
+        return JsonResponse({"error": "mode must be image or text"}, status=400)
+    try:
+        dpi = int(request.POST.get("dpi", 150))
+    except ValueError:
+        return JsonResponse({"error": "dpi must be an integer"}, status=400)
+    if not 36 <= dpi <= 300:
+        return JsonResponse({"error": "dpi must be 36-300"}, status=400)
+
     pdf_file = request.FILES["file"]
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
 
-    input_path = os.path.join(job_dir, "input.pdf")
     output_path = os.path.join(job_dir, "converted.pptx")
 
     try:
-        with open(input_path, "wb") as f:
-            for chunk in pdf_file.chunks():
-                f.write(chunk)
-        
-        import fitz # PyMuPDF
-        
-        doc = fitz.open(input_path)
-        prs = Presentation()
-        prs.slide_width = Inches(10)
-        prs.slide_height = Inches(5.625)
-        
-        for i in range(len(doc)):
-            page = doc.load_page(i)
-            pix = page.get_pixmap(dpi=150)
-            img_name = f"page_{i}.png"
-            img_path = os.path.join(job_dir, img_name)
-            pix.save(img_path)
-            
-            blank_slide_layout = prs.slide_layouts[6] 
-            slide = prs.slides.add_slide(blank_slide_layout)
-            slide.shapes.add_picture(img_path, 0, 0, width=prs.slide_width, height=prs.slide_height)
-            
-        prs.save(output_path)
-        
-        return FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.pptx")
+        input_path = spool_upload(pdf_file, job_dir)
+
+        if wants_async(request):
+            return submit_job(job_id, "pdf_to_ppt", convert_pdf_to_ppt, input_path, output_path, mode=mode, dpi=dpi)
+
+        progress = jobs.Progress()
+        convert_pdf_to_ppt(input_path, output_path, progress=progress, mode=mode, dpi=dpi)
+
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.pptx")
+        response["X-Slide-Stats"] = json.dumps(progress.stats.get("slides", {}))
+        return response
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("pdf_to_text", ("stream", "format", "engine"))
 def pdf_to_text(request):
     """
     POST multipart:
       file: PDF
+      stream: 1 to send page text as it is extracted (optional)
+      format: text|ndjson, ndjson gives one {"page": n, "text": ...} per line
+      engine: pypdf|pymupdf (pymupdf is much faster)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
 
     pdf_file = request.FILES["file"]
+    stream = request.POST.get("stream", "").lower() in ("1", "true", "yes")
+    fmt = request.POST.get("format", "text").lower()
+    engine = request.POST.get("engine", "pypdf").lower()
+    if fmt not in ("text", "ndjson"):
+        return JsonResponse({"error": "format must be text or ndjson"}, status=400)
+    if engine not in TEXT_ENGINES:
+        return JsonResponse({"error": "engine must be pypdf or pymupdf"}, status=400)
+    job_dir = get_job_dir(str(uuid.uuid4()))
     
     try:
-        reader = PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n\n"
-            
-        out = BytesIO()
-        out.write(text.encode("utf-8"))
-        out.seek(0)
-        
-        return FileResponse(out, as_attachment=True, filename="converted.txt")
+        pages = iter_pdf_text(spool_upload(pdf_file, job_dir), engine)
+        filename = "converted.ndjson" if fmt == "ndjson" else "converted.txt"
+        content_type = "application/x-ndjson" if fmt == "ndjson" else "text/plain; charset=utf-8"
+
+        if stream:
+            response = StreamingHttpResponse(text_chunks(pages, fmt), content_type=content_type)
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return response
+
+        # Written page by page; the whole text is never one Python string
+        output_path = os.path.join(job_dir, filename)
+        with open(output_path, "wb") as out:
+            for chunk in text_chunks(pages, fmt):
+                out.write(chunk)
+        return FileResponse(open(output_path, "rb"), as_attachment=True, filename=filename, content_type=content_type)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
-@api_view(["POST"])
-def word_to_pdf(request):
+def text_chunks(pages, fmt="text"):
     """
-    POST multipart:
-      file: DOCX/DOC
+    Encode (page_number, text) pairs for the response: plain text pages
+    separated by a blank line, or one NDJSON record per page. A failure
+    mid-stream can't become an error response any more, so in NDJSON it is
+    sent as a final {"error": ...} record. The error is still raised, so the
+    response is cut short (never cached) rather than ending cleanly.
+    """
+    try:
+        for number, text in pages:
+            if fmt == "ndjson":
+                yield (json.dumps({"page": number, "text": text}, ensure_ascii=False) + "\n").encode("utf-8")
+            else:
+                yield (text + "\n\n").encode("utf-8")
+    except Exception as e:
+        if fmt == "ndjson":
+            yield (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+        raise
+
+
+def office_to_pdf(request, unavailable=None):
+    """
+    Shared body of the Word/Excel/PPT to PDF views: spool the upload and
+    hand it to the LibreOffice pool. ``unavailable(input_path, job_dir)``
+    is tried when no LibreOffice is installed.
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
 
-    docx_file = request.FILES["file"]
+    f = request.FILES["file"]
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
 
-    original_name = docx_file.name
-    input_path = os.path.join(job_dir, original_name)
-    output_path = os.path.join(job_dir, os.path.splitext(original_name)[0] + ".pdf")
-
     try:
-        with open(input_path, "wb") as f:
-            for chunk in docx_file.chunks():
-                f.write(chunk)
-        
-        soffice = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        if os.path.exists(soffice):
-             subprocess.run([soffice, "--headless", "--convert-to", "pdf", input_path, "--outdir", job_dir], check=True)
-        else:
-             # Fallback attempt using textutil for basic docx to html then... wait, textutil can convert docx to html.
-             # but we need PDF. macOS 'cupsfilter' can convert text/html to pdf.
-             # Let's try: textutil -convert html input.docx -stdout | cupsfilter -i text/html - > output.pdf
-             # This is a bit hacky but might work on macOS for basic files.
-             
-             try:
-                 # 1. Convert to HTML
-                 html_path = os.path.join(job_dir, "temp.html")
-                 subprocess.run(["textutil", "-convert", "html", input_path, "-output", html_path], check=True)
-                 
-                 # 2. Convert HTML to PDF using cupsfilter
-                 with open(output_path, "wb") as pdf_out:
-                     # cupsfilter writes to stdout
-                     subprocess.run(["cupsfilter", "-i", "text/html", html_path], stdout=pdf_out, check=True)
-             except Exception as sub_e:
-                 return JsonResponse({"error": "LibreOffice not found and fallback failed: " + str(sub_e)}, status=501)
-
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-             return JsonResponse({"error": "Conversion failed to produce PDF output"}, status=500)
-             
+        input_path = spool_upload(f, job_dir, f.name)
+        try:
+            output_path = office.convert_to_pdf(input_path, job_dir)
+        except office.OfficeUnavailable as e:
+            if unavailable is None:
+                return JsonResponse({"error": f"{e}. Conversion not supported."}, status=501)
+            output_path = unavailable(input_path, job_dir)
+        except office.OfficeBusy as e:
+            return JsonResponse({"error": str(e)}, status=503)
+
         return FileResponse(open(output_path, "rb"), as_attachment=True, filename=os.path.basename(output_path))
     except Exception as e:
-        return JsonResponse({"error": f"Error: {str(e)}"}, status=500)
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+def _textutil_to_pdf(input_path, job_dir):
+    # macOS without LibreOffice: textutil converts docx to html,
+    # cupsfilter prints the html to PDF. Basic files only.
+    output_path = os.path.join(job_dir, os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
+    html_path = os.path.join(job_dir, "temp.html")
+    try:
+        subprocess.run(["textutil", "-convert", "html", input_path, "-output", html_path], check=True)
+        with open(output_path, "wb") as pdf_out:
+            # cupsfilter writes to stdout
+            subprocess.run(["cupsfilter", "-i", "text/html", html_path], stdout=pdf_out, check=True)
+    except Exception as sub_e:
+        raise RuntimeError("LibreOffice not found and fallback failed: " + str(sub_e))
+
+    if os.path.getsize(output_path) == 0:
+        raise RuntimeError("Conversion failed to produce PDF output")
+    return output_path
 
 
 @api_view(["POST"])
-def excel_to_pdf(request):
+def word_to_pdf(request):
     """
     POST multipart:
-      file: XLS/XLSX
+      file: DOCX/DOC
     """
-    if "file" not in request.FILES:
-        return JsonResponse({"error": "No file uploaded"}, status=400)
+    return office_to_pdf(request, unavailable=_textutil_to_pdf)
 
-    f = request.FILES["file"]
-    job_id = str(uuid.uuid4())
-    job_dir = get_job_dir(job_id)
-    input_path = os.path.join(job_dir, f.name)
 
-    try:
-        with open(input_path, "wb") as dest:
-            for chunk in f.chunks():
-                dest.write(chunk)
-        
-        soffice = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        if os.path.exists(soffice):
-             subprocess.run([soffice, "--headless", "--convert-to", "pdf", input_path, "--outdir", job_dir], check=True)
-             expected_out = os.path.splitext(input_path)[0] + ".pdf"
-             return FileResponse(open(expected_out, "rb"), as_attachment=True, filename=os.path.basename(expected_out))
-        else:
-            return JsonResponse({"error": "LibreOffice not found. Excel to PDF not supported."}, status=501)
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+@api_view(["POST"])
+def excel_to_pdf(request):
+    """
+    POST multipart:
+      file: XLS/XLSX
+    """
+    return office_to_pdf(request)
 
 
 @api_view(["POST"])
@@ -1087,60 +1478,57 @@ def ppt_to_pdf(request):
     POST multipart:
       file: PPT/PPTX
     """
-    if "file" not in request.FILES:
-        return JsonResponse({"error": "No file uploaded"}, status=400)
-
-    f = request.FILES["file"]
-    job_id = str(uuid.uuid4())
-    job_dir = get_job_dir(job_id)
-    input_path = os.path.join(job_dir, f.name)
-
-    try:
-        with open(input_path, "wb") as dest:
-            for chunk in f.chunks():
-                dest.write(chunk)
-
-        soffice = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        if os.path.exists(soffice):
-             subprocess.run([soffice, "--headless", "--convert-to", "pdf", input_path, "--outdir", job_dir], check=True)
-             expected_out = os.path.splitext(input_path)[0] + ".pdf"
-             return FileResponse(open(expected_out, "rb"), as_attachment=True, filename=os.path.basename(expected_out))
-        else:
-            return JsonResponse({"error": "LibreOffice not found. PPT to PDF not supported."}, status=501)
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+    return office_to_pdf(request)
 
 
 @api_view(["POST"])
 def text_to_pdf(request):
     """
     POST multipart:
-      file: TXT
+      file: TXT (UTF-8)
+      font_size: 4-72 (default 10)
+      page_size: a4|letter|legal (default a4)
+      async: 1 to queue the conversion and get a jobId back (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
 
+    page_size = request.POST.get("page_size", "a4").lower()
+    if page_size not in PAGE_SIZES:
+        return JsonResponse({"error": "page_size must be a4, letter or legal"}, status=400)
+    try:
+        font_size = float(request.POST.get("font_size", 10))
+    except ValueError:
+        return JsonResponse({"error": "font_size must be a number"}, status=400)
+    if not 4 <= font_size <= 72:
+        return JsonResponse({"error": "font_size must be 4-72"}, status=400)
+
     f = request.FILES["file"]
+    job_id = str(uuid.uuid4())
+    job_dir = get_job_dir(job_id)
+    output_path = os.path.join(job_dir, "converted.pdf")
     
     try:
-        content = f.read().decode("utf-8", errors="ignore")
-        
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, content)
-        
-        s = pdf.output(dest='S').encode('latin-1')
-        return FileResponse(BytesIO(s), as_attachment=True, filename="converted.pdf")
+        input_path = spool_upload(f, job_dir, "input.txt")
+        options = dict(font_size=font_size, page_size=page_size)
+
+        if wants_async(request):
+            return submit_job(job_id, "text_to_pdf", convert_text_to_pdf, input_path, output_path, **options)
+
+        convert_text_to_pdf(input_path, output_path, **options)
+        return FileResponse(open(output_path, "rb"), as_attachment=True, filename="converted.pdf")
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @api_view(["POST"])
+@accepts_doc_id
+@cached_result("ocr_pdf")
 def ocr_pdf(request):
     """
     POST multipart:
       file: PDF (scanned)
+      async: 1 to queue the OCR and get a jobId back (optional)
     """
     if "file" not in request.FILES:
         return JsonResponse({"error": "No file uploaded"}, status=400)
@@ -1151,41 +1539,27 @@ def ocr_pdf(request):
     pdf_file = request.FILES["file"]
     job_id = str(uuid.uuid4())
     job_dir = get_job_dir(job_id)
-    input_path = os.path.join(job_dir, "input.pdf")
+    output_path = os.path.join(job_dir, "ocr_result.pdf")
 
     try:
-        with open(input_path, "wb") as f:
-            for chunk in pdf_file.chunks():
-                f.write(chunk)
-                
-        import fitz
-        doc = fitz.open(input_path)
-        merger = PdfWriter()
-        
-        for i in range(len(doc)):
-            page = doc.load_page(i)
-            # Higher DPI for OCR
-            pix = page.get_pixmap(dpi=300)
-            img_path = os.path.join(job_dir, f"page_{i}.png")
-            pix.save(img_path)
-            
-            try:
-                pdf_bytes = pytesseract.image_to_pdf_or_hocr(img_path, extension='pdf')
-                merger.append(BytesIO(pdf_bytes))
-            except Exception as tess_err:
-                print(f"OCR failed for page {i}: {tess_err}")
-                return JsonResponse({"error": "Tesseract OCR binary not found or failed"}, status=500)
+        input_path = spool_upload(pdf_file, job_dir)
 
-        out = BytesIO()
-        merger.write(out)
-        out.seek(0)
-        
-        return FileResponse(out, as_attachment=True, filename="ocr_result.pdf")
+        if wants_async(request):
+            return submit_job(job_id, "ocr_pdf", ocr_pdf_file, input_path, output_path)
+
+        progress = jobs.Progress()
+        ocr_pdf_file(input_path, output_path, progress=progress)
+
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="ocr_result.pdf")
+        response["X-OCR-Workers"] = str(progress.stats["workers"])
+        response["X-OCR-Page-Timings"] = ",".join(str(t) for t in progress.stats["page_timings"])
+        return response
         
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @api_view(["POST"])
+@accepts_doc_id
 def sign_pdf(request):
     """
     POST multipart:
@@ -1194,6 +1568,7 @@ def sign_pdf(request):
       page: int (1-based, default 1)
       x: int (default 100)
       y: int (default 100)
+      incremental: 1 to append the signature instead of rewriting the file (optional)
     """
     if "file" not in request.FILES or "signature" not in request.FILES:
         return JsonResponse({"error": "PDF and Signature files are required"}, status=400)
@@ -1204,39 +1579,60 @@ def sign_pdf(request):
     x = int(request.POST.get("x", 100))
     y = int(request.POST.get("y", 100))
     
+    job_dir = get_job_dir(str(uuid.uuid4()))
+
     try:
         import fitz  # PyMuPDF
         
-        # Open PDF
-        pdf_bytes = pdf_file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        if page_num < 0 or page_num >= len(doc):
-             return JsonResponse({"error": "Invalid page number"}, status=400)
-             
-        page = doc[page_num]
-        
-        # Open Signature Image
-        sig_bytes = sig_file.read()
-        
-        # Insert Image
-        # rect is (x0, y0, x1, y1)
-        # We'll assume a default width/height if not specified, or scale it?
-        # Let's say we want it to be 100x50 by default effectively? 
-        # Actually fitz.insert_image takes kwarg 'stream'
-        
-        # Let's try to get image size first to keep aspect ratio if possible, or just standard box
-        # For MVP, let's fix a box of width 150, height 75 at (x, y)
-        w, h = 150, 75
-        rect = fitz.Rect(x, y, x + w, y + h)
-        
-        page.insert_image(rect, stream=sig_bytes)
-        
-        out_buffer = BytesIO()
-        doc.save(out_buffer)
-        out_buffer.seek(0)
+        input_path = spool_upload(pdf_file, job_dir)
+        output_path = os.path.join(job_dir, "signed.pdf")
+        incremental = wants_incremental(request)
+        if incremental:
+            # Updated in place: work on a copy, the spooled input may be a
+            # hard link to a file we don't own
+            shutil.copyfile(input_path, output_path)
+            input_path = output_path
+
+        # Open PDF (from disk, not a copy in memory)
+        doc = open_fitz(input_path)
+        try:
+            if page_num < 0 or page_num >= len(doc):
+                return JsonResponse({"error": "Invalid page number"}, status=400)
+
+            page = doc[page_num]
+
+            # Open Signature Image
+            sig_bytes = sig_file.read()
+
+            # Insert Image
+            # rect is (x0, y0, x1, y1)
+            # We'll assume a default width/height if not specified, or scale it?
+            # Let's say we want it to be 100x50 by default effectively? 
+            # Actually fitz.insert_image takes kwarg 'stream'
+
+            # Let's try to get image size first to keep aspect ratio if possible, or just standard box
+            # For MVP, let's fix a box of width 150, height 75 at (x, y)
+            w, h = 150, 75
+            rect = fitz.Rect(x, y, x + w, y + h)
+
+            page.insert_image(rect, stream=sig_bytes)
+
+            if incremental and doc.can_save_incrementally():
+                # Appends only the new image and the touched page objects
+                doc.saveIncr()
+            elif incremental:
+                # Repaired files can't take an update section; rewrite them
+                incremental = False
+                doc.save(output_path + ".full")
+                os.replace(output_path + ".full", output_path)
+            else:
+                doc.save(output_path)
+        finally:
+            doc.close()
         
-        return FileResponse(out_buffer, as_attachment=True, filename="signed.pdf")
+        response = FileResponse(open(output_path, "rb"), as_attachment=True, filename="signed.pdf")
+        response["X-Incremental"] = "true" if incremental else "false"
+        return response
         
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
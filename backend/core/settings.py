@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,10 +56,87 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 CORS_ALLOW_ALL_ORIGINS = True
+# Chunked uploads (api/uploads.py) send each chunk's digest in a header
+CORS_ALLOW_HEADERS = (*default_headers, "x-chunk-sha256")
 ROOT_URLCONF = 'core.urls'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Background conversion jobs (api/jobs.py): size of the local process pool
+JOB_WORKERS = int(os.environ.get("PDF_JOB_WORKERS", os.cpu_count() or 2))
+# Job directories are swept (api/jobs.py): queued jobs' results are kept
+# JOB_TTL after their last update, the scratch space of synchronous
+# requests (spooled input, output already sent) for JOB_SCRATCH_TTL
+JOB_TTL = int(os.environ.get("PDF_JOB_TTL", 24 * 3600))
+JOB_SCRATCH_TTL = int(os.environ.get("PDF_JOB_SCRATCH_TTL", 3600))
+JOB_SWEEP_INTERVAL = 300
+# Host-wide cap on pool processes (api/parallel.py): every *_WORKERS
+# fan-out below, from web and job processes alike, draws from these slots
+PARALLEL_MAX_PROCESSES = int(os.environ.get("PDF_PARALLEL_MAX_PROCESSES", os.cpu_count() or 2))
+PARALLEL_SLOTS_DIR = MEDIA_ROOT / "pool-slots"
+# Per-page OCR fan-out (api/services.py ocr_pdf_file)
+OCR_WORKERS = int(os.environ.get("PDF_OCR_WORKERS", os.cpu_count() or 2))
+# Processes writing split parts (api/split.py)
+SPLIT_WORKERS = int(os.environ.get("PDF_SPLIT_WORKERS", os.cpu_count() or 2))
+# Processes rendering page images for pdf_to_image (api/services.py)
+RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", os.cpu_count() or 2))
+# Images recompressed in parallel by compress_pdf (api/compression.py)
+COMPRESS_WORKERS = int(os.environ.get("PDF_COMPRESS_WORKERS", os.cpu_count() or 2))
+# Processes parsing page segments for pdf_to_word (api/services.py)
+WORD_WORKERS = int(os.environ.get("PDF_WORD_WORKERS", os.cpu_count() or 2))
+# Processes transcoding images for image_to_pdf (api/imagepdf.py)
+IMAGE_WORKERS = int(os.environ.get("PDF_IMAGE_WORKERS", os.cpu_count() or 2))
+# Processes extracting tables for pdf_to_excel (api/tables.py)
+TABLE_WORKERS = int(os.environ.get("PDF_TABLE_WORKERS", os.cpu_count() or 2))
+# Files processed concurrently by one batch job (api/batch.py)
+BATCH_WORKERS = int(os.environ.get("PDF_BATCH_WORKERS", os.cpu_count() or 2))
+
+# Content-addressed cache of tool outputs (api/cache.py)
+RESULT_CACHE_ENABLED = os.environ.get("PDF_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_DIR = MEDIA_ROOT / "cache"
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("PDF_RESULT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Upload-once document handles (api/documents.py)
+DOCUMENTS_DIR = MEDIA_ROOT / "documents"
+DOCUMENTS_TTL = int(os.environ.get("PDF_DOCUMENTS_TTL", 24 * 3600))
+DOCUMENTS_MAX_BYTES = int(os.environ.get("PDF_DOCUMENTS_MAX_BYTES", 10 * 1024 ** 3))
+
+# Resumable chunked uploads (api/uploads.py)
+UPLOADS_DIR = MEDIA_ROOT / "uploads"
+# Incomplete uploads are dropped after this long without a chunk
+UPLOAD_TTL = int(os.environ.get("PDF_UPLOAD_TTL", 24 * 3600))
+UPLOAD_MAX_BYTES = int(os.environ.get("PDF_UPLOAD_MAX_BYTES", 20 * 1024 ** 3))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("PDF_UPLOAD_CHUNK_SIZE", 8 * 1024 ** 2))
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 ** 2
+
+# Page thumbnails and zoom tiles (api/preview.py): rendered images; the
+# sources are stored documents (DOCUMENTS_* above)
+PREVIEW_DIR = MEDIA_ROOT / "preview"
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get("PDF_PREVIEW_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+
+# Long-lived LibreOffice converters for Word/Excel/PPT to PDF (api/office.py)
+OFFICE_BINARY = os.environ.get("PDF_OFFICE_BINARY", "")
+# Dotted path of the worker class; empty picks UNO when available, else the CLI
+OFFICE_WORKER = os.environ.get("PDF_OFFICE_WORKER", "")
+OFFICE_WORKERS = int(os.environ.get("PDF_OFFICE_WORKERS", 2))
+OFFICE_MAX_CONVERSIONS = int(os.environ.get("PDF_OFFICE_MAX_CONVERSIONS", 200))
+OFFICE_QUEUE_TIMEOUT = float(os.environ.get("PDF_OFFICE_QUEUE_TIMEOUT", 60))
+OFFICE_CONVERT_TIMEOUT = float(os.environ.get("PDF_OFFICE_CONVERT_TIMEOUT", 120))
+OFFICE_START_TIMEOUT = float(os.environ.get("PDF_OFFICE_START_TIMEOUT", 30))
+OFFICE_PROFILE_ROOT = MEDIA_ROOT / "office-profiles"
+
+# TrueType font embedded by text_to_pdf (api/textpdf.py); empty picks a
+# system DejaVu Sans Mono, else ReportLab's Vera
+TEXT_PDF_FONT = os.environ.get("PDF_TEXT_FONT", "")
+
+# Job artifact downloads (api/serving.py): "" streams from Django,
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) let the
+# front proxy send the bytes. For nginx, expose MEDIA_ROOT as an internal
+# location at FILE_SERVING_ACCEL_PREFIX.
+FILE_SERVING = os.environ.get("PDF_FILE_SERVING", "").lower()
+FILE_SERVING_ACCEL_PREFIX = os.environ.get("PDF_FILE_SERVING_ACCEL_PREFIX", "/protected-media/")
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -0,0 +1,113 @@
+const API_BASE = "http://localhost:8000";
+
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const CONCURRENCY = 3;
+const MAX_RETRIES = 5;
+
+// Remembers unfinished uploads so a reload can pick up where it stopped
+const resumeKey = (file) => `pdf-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+async function sha256Hex(blob) {
+    const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+        .map((b) => b.toString(16).padStart(2, "0"))
+        .join("");
+}
+
+async function errorFrom(res, fallback) {
+    const txt = await res.text();
+    try {
+        return new Error(JSON.parse(txt).error || fallback);
+    } catch {
+        return new Error(txt || fallback);
+    }
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function startOrResume(file, chunkSize, signal) {
+    const saved = localStorage.getItem(resumeKey(file));
+    if (saved) {
+        const res = await fetch(`${API_BASE}/api/uploads/${saved}/`, { signal });
+        if (res.ok) return res.json();
+        localStorage.removeItem(resumeKey(file));
+    }
+
+    const fd = new FormData();
+    fd.append("name", file.name);
+    fd.append("size", file.size);
+    fd.append("chunk_size", chunkSize);
+    const res = await fetch(`${API_BASE}/api/uploads/`, { method: "POST", body: fd, signal });
+    if (!res.ok) throw await errorFrom(res, "Could not start upload");
+    const state = await res.json();
+    localStorage.setItem(resumeKey(file), state.uploadId);
+    return state;
+}
+
+async function putChunk(uploadId, index, blob, signal) {
+    const checksum = await sha256Hex(blob);
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const res = await fetch(`${API_BASE}/api/uploads/${uploadId}/chunks/${index}/`, {
+                method: "PUT",
+                headers: { "Content-Type": "application/octet-stream", "X-Chunk-Sha256": checksum },
+                body: blob,
+                signal,
+            });
+            if (res.ok) return;
+            // 4xx other than a checksum mismatch won't get better by retrying
+            if (res.status >= 400 && res.status < 500 && res.status !== 422) {
+                throw Object.assign(await errorFrom(res, "Chunk rejected"), { fatal: true });
+            }
+        } catch (e) {
+            if (e.fatal || signal?.aborted || attempt >= MAX_RETRIES) throw e;
+        }
+        if (attempt >= MAX_RETRIES) throw new Error(`Chunk ${index} failed after ${MAX_RETRIES} retries`);
+        await sleep(Math.min(30000, 500 * 2 ** attempt));
+    }
+}
+
+/**
+ * Upload a (possibly multi-gigabyte) PDF in checksummed chunks and return
+ * the document handle; pass its docId as `doc_id` to any PDF tool.
+ * Interrupted uploads resume from the chunks the server already has.
+ */
+export async function uploadDocument(file, { onProgress, chunkSize = CHUNK_SIZE, concurrency = CONCURRENCY, signal, password } = {}) {
+    const state = await startOrResume(file, chunkSize, signal);
+    const { uploadId, totalChunks } = state;
+    const size = state.chunkSize;
+
+    const received = new Set(state.receivedChunks);
+    const pending = [];
+    for (let i = 0; i < totalChunks; i++) {
+        if (!received.has(i)) pending.push(i);
+    }
+
+    let sent = received.size;
+    const report = () => onProgress && onProgress({ sentChunks: sent, totalChunks, fraction: sent / totalChunks });
+    report();
+
+    const worker = async () => {
+        while (pending.length) {
+            const index = pending.shift();
+            await putChunk(uploadId, index, file.slice(index * size, (index + 1) * size), signal);
+            sent += 1;
+            report();
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(concurrency, pending.length) }, worker));
+
+    const fd = new FormData();
+    if (password) fd.append("password", password);
+    const res = await fetch(`${API_BASE}/api/uploads/${uploadId}/complete/`, { method: "POST", body: fd, signal });
+    if (!res.ok) throw await errorFrom(res, "Could not complete upload");
+    localStorage.removeItem(resumeKey(file));
+    return res.json();
+}
+
+export async function cancelUpload(file) {
+    const uploadId = localStorage.getItem(resumeKey(file));
+    if (!uploadId) return;
+    localStorage.removeItem(resumeKey(file));
+    await fetch(`${API_BASE}/api/uploads/${uploadId}/`, { method: "DELETE" });
+}